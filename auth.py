@@ -0,0 +1,130 @@
+"""Admin session checks.
+
+The admin cookie holds a token signed with the app secret (itsdangerous)
+that carries its own issue time, so forged, malformed and expired tokens
+are rejected without touching the database. A well-signed token is still
+looked up in AdminSession once, so logout revokes it, and the answer is
+then trusted for a few seconds from an in-process cache. Expired
+AdminSession rows are deleted at login and periodically afterwards.
+"""
+import time
+import uuid
+import threading
+from functools import wraps
+from datetime import datetime, timedelta
+from collections import OrderedDict
+
+from flask import session, redirect, url_for, flash, jsonify
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+try:
+    from main import db
+except ImportError:
+    from app import db
+
+from models import AdminSession
+
+class AdminSessions:
+    """Issues, validates and revokes admin sessions.
+
+    A logout is seen immediately by the process that handled it and by
+    the other workers within cache_ttl seconds.
+    """
+
+    def __init__(self, secret_key, lifetime=2 * 3600, cache_ttl=30, purge_interval=600, max_entries=256):
+        self.lifetime = lifetime
+        self.cache_ttl = cache_ttl
+        self.purge_interval = purge_interval
+        self.max_entries = max_entries
+        self._serializer = URLSafeTimedSerializer(secret_key, salt='admin-session')
+        self._lock = threading.Lock()
+        self._valid = OrderedDict()  # session token -> monotonic time it was last confirmed in the database
+        self._next_purge = 0.0
+        self.stats = {'cache_hits': 0, 'lookups': 0, 'rejected': 0, 'purged': 0}
+
+    def issue(self):
+        """Create an AdminSession row and return the signed token for the cookie"""
+        self.purge()
+        session_token = str(uuid.uuid4())
+        admin_session = AdminSession()
+        admin_session.session_token = session_token
+        admin_session.expires_at = datetime.utcnow() + timedelta(seconds=self.lifetime)
+        db.session.add(admin_session)
+        db.session.commit()
+        return self._serializer.dumps(session_token)
+
+    def _session_token(self, signed):
+        try:
+            return self._serializer.loads(signed, max_age=self.lifetime)
+        except BadSignature:  # also raised for expired tokens (SignatureExpired)
+            return None
+
+    def validate(self, signed):
+        """Whether a signed token belongs to a live session"""
+        session_token = self._session_token(signed) if signed else None
+        if session_token is None:
+            self.stats['rejected'] += 1
+            return False
+        now = time.monotonic()
+        with self._lock:
+            checked_at = self._valid.get(session_token)
+            if checked_at is not None and now - checked_at < self.cache_ttl:
+                self._valid.move_to_end(session_token)
+                self.stats['cache_hits'] += 1
+                return True
+
+        self.stats['lookups'] += 1
+        if now >= self._next_purge:
+            self.purge()
+        valid = db.session.query(AdminSession.query.filter(
+            AdminSession.session_token == session_token,
+            AdminSession.expires_at > datetime.utcnow()).exists()).scalar()
+        with self._lock:
+            if valid:
+                self._valid[session_token] = now
+                self._valid.move_to_end(session_token)
+                while len(self._valid) > self.max_entries:
+                    self._valid.popitem(last=False)
+            else:
+                self._valid.pop(session_token, None)
+                self.stats['rejected'] += 1
+        return valid
+
+    def revoke(self, signed):
+        """Delete the session behind a signed token (logout)"""
+        session_token = self._session_token(signed) if signed else None
+        if session_token is None:
+            return
+        with self._lock:
+            self._valid.pop(session_token, None)
+        AdminSession.query.filter_by(session_token=session_token).delete()
+        db.session.commit()
+
+    def purge(self):
+        """Delete expired AdminSession rows; returns how many were removed"""
+        self._next_purge = time.monotonic() + self.purge_interval
+        count = AdminSession.query.filter(AdminSession.expires_at <= datetime.utcnow()).delete()
+        db.session.commit()
+        self.stats['purged'] += count
+        return count
+
+    def required(self, view=None, api=False):
+        """Decorator for admin views: redirects to the login page, or answers 401 JSON with api=True"""
+        if view is None:
+            return lambda view: self.required(view, api=api)
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            admin_token = session.get('admin_token')
+            if not admin_token:
+                if api:
+                    return jsonify({'error': 'Unauthorized'}), 401
+                return redirect(url_for('admin_login'))
+            if not self.validate(admin_token):
+                session.pop('admin_token', None)
+                if api:
+                    return jsonify({'error': 'Session expired'}), 401
+                flash('Sessão expirada. Faça login novamente.', 'error')
+                return redirect(url_for('admin_login'))
+            return view(*args, **kwargs)
+        return wrapper
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Benchmark das rotas principais com dados sintéticos.
+
+Seeds an empty database with seed.py (photo-sized images with their
+renditions, videos, posts and conversations), then drives the real app
+twice: in-process through the Flask test client, recording latency and
+the SQL statements each endpoint runs, and over HTTP against a local
+gunicorn started from gunicorn.conf.py (see loadtest.py), recording
+throughput and the peak RSS of its processes. The chatbot always uses
+the fake backend. Results are JSON tagged with the git commit, so runs
+can be compared across commits:
+
+    python benchmark.py --output antes.json
+    git checkout outra-branch
+    python benchmark.py --compare antes.json
+
+Without DATABASE_URL a temporary SQLite database is used; point it at a
+scratch Postgres database to benchmark Postgres.
+"""
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+if __name__ == '__main__':
+    os.environ.setdefault('MEDIA_JOB_WORKER', '0')
+    os.environ['CHATBOT_BACKEND'] = 'fake'
+    if 'DATABASE_URL' not in os.environ:
+        _workdir = tempfile.mkdtemp(prefix='maeva-bench-')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_workdir, 'bench.db')}"
+        os.environ.setdefault('PAGE_CACHE_PATH', os.path.join(_workdir, 'page_cache.sqlite3'))
+        os.environ.setdefault('MEDIA_STORAGE_PATH', os.path.join(_workdir, 'media'))
+
+try:
+    from main import app, db
+except ImportError:
+    from app import app, db
+
+from sqlalchemy import event
+from models import Property, PropertyImage, Post
+from pagination import encode_cursor
+from routes import GALLERY_PAGE_SIZE
+from loadtest import start_server, stop_server, run_load, latency_summary, percentile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def benchmark_endpoints(gallery_page=5):
+    """(name, method, url, json body) for every benchmarked endpoint, using ids from the seeded data"""
+    with app.app_context():
+        property_obj = Property.query.order_by(Property.id).first()
+        post = Post.query.order_by(Post.id).first()
+        video_property = Property.query.filter(Property.video_size.isnot(None)).first()
+        image_post = Post.query.filter(Post.image_size.isnot(None)).first()
+        video_post = Post.query.filter(Post.video_size.isnot(None)).first()
+        image = PropertyImage.query.filter(PropertyImage.image_hash.isnot(None)).first()
+        # The gallery pages by keyset cursor: page k starts after the last card of page k-1
+        deep = Property.query.order_by(Property.created_at.desc(), Property.id.desc()).offset(
+            GALLERY_PAGE_SIZE * (gallery_page - 1) - 1).first()
+
+    endpoints = [
+        ('home', 'GET', '/', None),
+        ('gallery', 'GET', '/galeria', None),
+        ('gallery_search', 'GET', '/galeria?q=piscina+varanda', None),
+        ('posts', 'GET', '/posts', None),
+    ]
+    if deep:
+        cursor = encode_cursor('k', [deep.created_at, deep.id])
+        endpoints += [(f'gallery_page_{gallery_page}', 'GET', f'/galeria?cursor={cursor}', None),
+                      (f'gallery_more_{gallery_page}', 'GET', f'/galeria/mais?cursor={cursor}', None)]
+    if post:
+        endpoints.append(('post', 'GET', f'/post/{post.id}', None))
+    if property_obj:
+        endpoints += [('property_image', 'GET', f'/serve/property_image/{property_obj.id}', None),
+                      ('property_image_index', 'GET', f'/serve/property_image/{property_obj.id}/1', None)]
+    if image:
+        endpoints.append(('media_by_hash', 'GET', f'/m/{image.image_hash}.jpg', None))
+    if video_property:
+        endpoints.append(('property_video', 'GET', f'/serve/property_video/{video_property.id}', None))
+    if image_post:
+        endpoints.append(('post_image', 'GET', f'/serve/post_image/{image_post.id}', None))
+    if video_post:
+        endpoints.append(('post_video', 'GET', f'/serve/post_video/{video_post.id}', None))
+    endpoints.append(('chatbot', 'POST', '/chatbot/message',
+                      {'message': 'Vocês têm apartamentos em Moema?', 'user_name': 'Benchmark', 'user_phone': '11999990000'}))
+    return endpoints
+
+def peak_rss_kb():
+    """Peak resident set size of this process, in KB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def _status_field(pid, field):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def process_tree_peak_rss(pid):
+    """{pid: peak RSS in KB} for a process and its direct children (Linux /proc)"""
+    peaks = {pid: _status_field(pid, 'VmHWM')}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit() and _status_field(entry, 'PPid') == pid:
+            peaks[int(entry)] = _status_field(entry, 'VmHWM')
+    return {child: peak for child, peak in peaks.items() if peak is not None}
+
+def bench_test_client(endpoints, requests=30, cold=False):
+    """Latency and SQL statements per endpoint through the Flask test client.
+
+    The first request of each endpoint runs with cold page and media
+    caches and is reported apart (first_ms, first_queries); the
+    percentiles cover the warm requests after it, or more cold ones with
+    cold=True.
+    """
+    import routes
+
+    client = app.test_client()
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    results = {}
+    try:
+        for name, method, url, body in endpoints:
+            routes.page_cache.backend.clear()
+            routes.media_cache.invalidate_prefix('')
+            latencies, queries, sizes, statuses = [], [], [], set()
+            first = None
+            for i in range(requests + 1):
+                if body is not None:
+                    # A new question each time, so the answer cache doesn't skip the model call
+                    payload = dict(body, message=f"{body['message']} ({i})")
+                else:
+                    payload = None
+                if cold:
+                    routes.page_cache.backend.clear()
+                    routes.media_cache.invalidate_prefix('')
+                del statements[:]
+                started = time.perf_counter()
+                response = client.open(url, method=method, json=payload)
+                size = len(response.get_data())
+                elapsed = time.perf_counter() - started
+                statuses.add(response.status_code)
+                if first is None:
+                    first = {'first_ms': round(elapsed * 1000, 2), 'first_queries': len(statements)}
+                    continue
+                latencies.append(elapsed)
+                queries.append(len(statements))
+                sizes.append(size)
+            summary = latency_summary(latencies, sum(latencies) or 1)
+            results[name] = {
+                'url': url,
+                'status': sorted(statuses),
+                **first,
+                'p50_ms': summary['p50_ms'],
+                'p95_ms': summary['p95_ms'],
+                'p99_ms': summary['p99_ms'],
+                'rps': summary['rps'],  # sequential: 1 / mean latency
+                'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+                'max_queries': max(queries) if queries else None,
+                'response_bytes': percentile(sorted(sizes), 0.5),
+            }
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return results
+
+def bench_gunicorn(endpoints, workers, threads, duration=10.0, clients=16, slow=2):
+    """Throughput over HTTP against gunicorn.conf.py, plus the peak RSS of the master and workers"""
+    page_urls = [url for name, method, url, body in endpoints if method == 'GET' and not url.startswith(('/serve/', '/m/'))]
+    process, port = start_server(dict(os.environ), workers, threads)
+    try:
+        result = run_load(port, duration, clients, slow, page_urls)
+        peaks = process_tree_peak_rss(process.pid)
+    finally:
+        stop_server(process)
+    workers_rss = [peak for pid, peak in peaks.items() if pid != process.pid]
+    result.update(
+        profile=f"{workers}x{threads}",
+        clients=clients,
+        slow_clients=slow,
+        peak_rss_kb={'master': peaks.get(process.pid), 'worker_max': max(workers_rss, default=None),
+                     'total': sum(peaks.values())},
+    )
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline, current, max_regression):
+    """Print p95 and query-count changes per endpoint; returns the names that regressed beyond max_regression"""
+    regressions = []
+    print(f"📊 {baseline.get('commit')} → {current.get('commit')}")
+    if baseline.get('cold') != current.get('cold'):
+        print("   ⚠️ execuções com modos de cache diferentes (--cold); as latências não são comparáveis")
+    for name, now in current['test_client'].items():
+        before = baseline.get('test_client', {}).get(name)
+        if not before or not before.get('p95_ms') or now.get('p95_ms') is None:
+            print(f"   {name:24} novo")
+            continue
+        change = now['p95_ms'] / before['p95_ms'] - 1
+        queries = f"{before['queries_per_request']} → {now['queries_per_request']} consultas"
+        flag = ''
+        # Sub-millisecond differences are timer noise, whatever their percentage
+        if (change > max_regression and now['p95_ms'] - before['p95_ms'] > 1) or (now['queries_per_request'] or 0) > (before['queries_per_request'] or 0):
+            regressions.append(name)
+            flag = ' ⚠️'
+        print(f"   {name:24} p95 {before['p95_ms']:8.2f} → {now['p95_ms']:8.2f} ms ({change:+.0%})  {queries}{flag}")
+    if baseline.get('gunicorn') and current.get('gunicorn'):
+        before, now = baseline['gunicorn']['pages'], current['gunicorn']['pages']
+        print(f"   {'gunicorn páginas':24} {before['rps']} → {now['rps']} req/s, "
+              f"p95 {before['p95_ms']} → {now['p95_ms']} ms")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark das rotas principais')
+    parser.add_argument('--properties', type=int, default=200, help='imóveis sintéticos num banco vazio')
+    parser.add_argument('--images', type=int, default=3, help='imagens por imóvel')
+    parser.add_argument('--posts', type=int, default=60)
+    parser.add_argument('--conversations', type=int, default=2000)
+    parser.add_argument('--image-size', default='1280x853', help='tamanho das fotos sintéticas')
+    parser.add_argument('--videos', type=int, default=3, help='imóveis e posts com vídeo')
+    parser.add_argument('--requests', type=int, default=30, help='requisições por rota no test client')
+    parser.add_argument('--cold', action='store_true', help='limpa os caches antes de cada requisição')
+    parser.add_argument('--gallery-page', type=int, default=5, help='página da galeria medida além da primeira')
+    parser.add_argument('--gunicorn', default='2x8', help='perfil WORKERSxTHREADS do gunicorn ("" para pular)')
+    parser.add_argument('--duration', type=float, default=10.0, help='segundos de carga no gunicorn')
+    parser.add_argument('--clients', type=int, default=16, help='clientes simultâneos no gunicorn')
+    parser.add_argument('--slow', type=int, default=2, help='clientes do chatbot durante a carga')
+    parser.add_argument('--output', help='arquivo JSON de saída (padrão: stdout)')
+    parser.add_argument('--compare', help='JSON de uma execução anterior para comparar')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='aumento de p95 tolerado na comparação (0.25 = 25%%)')
+    args = parser.parse_args(argv)
+
+    from seed import seed_database, parse_size
+    with app.app_context():
+        empty = Property.query.count() == 0
+    dataset = None
+    if empty:
+        print("🌱 Banco vazio: inserindo dados sintéticos...", file=sys.stderr)
+        dataset = seed_database(args.properties, args.images, args.posts, args.conversations,
+                                image_size=parse_size(args.image_size), videos=args.videos)
+    with app.app_context():
+        counts = {'property': Property.query.count(), 'property_image': PropertyImage.query.count(),
+                  'post': Post.query.count()}
+        dialect = db.engine.dialect.name
+
+    endpoints = benchmark_endpoints(args.gallery_page)
+    print(f"⏱️ {len(endpoints)} rotas no test client, {args.requests} requisições cada...", file=sys.stderr)
+    results = {
+        'commit': git_commit(),
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'database': dialect,
+        'dataset': dict(counts, seeded=dataset is not None, image_size=args.image_size if dataset else None),
+        'test_client': bench_test_client(endpoints, args.requests, args.cold),
+        'cold': args.cold,
+    }
+    results['peak_rss_kb'] = peak_rss_kb()
+
+    if args.gunicorn:
+        workers, threads = (int(part) for part in args.gunicorn.lower().split('x'))
+        print(f"🚀 gunicorn {args.gunicorn}: {args.clients} clientes por {args.duration:g}s...", file=sys.stderr)
+        results['gunicorn'] = bench_gunicorn(endpoints, workers, threads, args.duration, args.clients, args.slow)
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"✅ Resultado salvo em {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.max_regression)
+        if regressions:
+            print(f"❌ Regressões: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""Chat backends for the site assistant.
+
+Every backend exposes ``stream(messages)``, yielding the reply as text
+deltas, so the routes can forward tokens to the browser as they arrive.
+FakeChatBackend answers locally without network access for tests and
+benchmarks (CHATBOT_BACKEND=fake).
+"""
+import re
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# System prompt describing the company to the model
+COMPANY_CONTEXT = """
+        Você é a assistente virtual da Maeva Investimentos Imobiliários, uma consultoria imobiliária de São Paulo especializada em imóveis de médio e alto padrão.
+
+        Informações da empresa:
+        - Especializada em imóveis de alto padrão em São Paulo
+        - Mais de 13 anos de experiência no mercado
+        - Consultora principal: Rose Ventura
+        - Regiões de atuação: Jardins, Vila Olímpia, Itaim Bibi, Moema, Brooklin, Pinheiros, Vila Madalena, Morumbi
+        - Tipos de imóveis: Apartamentos, casas, coberturas, imóveis comerciais
+        - Serviços: Consultoria especializada, assessoria para investidores, acompanhamento completo do processo
+        - Contato: WhatsApp (11) 98755-7913, Instagram @Roseaventura
+
+        Seja sempre cordial, profissional e útil. Forneça informações sobre imóveis, bairros de São Paulo, processo de compra, documentação, financiamento imobiliário e investimentos. Sempre incentive o contato direto para agendamento de visitas.
+        """
+
+UNAVAILABLE_MESSAGE = 'Desculpe, o sistema de chat está temporariamente indisponível.'
+ERROR_MESSAGE = 'Desculpe, ocorreu um erro. Tente novamente ou entre em contato pelo WhatsApp (11) 98755-7913.'
+BUSY_MESSAGE = 'Estamos atendendo muitas pessoas agora. Tente novamente em instantes ou fale conosco pelo WhatsApp (11) 98755-7913.'
+
+def build_context(summaries):
+    """Company prompt plus the site listings most relevant to the question"""
+    if not summaries:
+        return COMPANY_CONTEXT
+    lines = '\n'.join(f"        - {summary}" for summary in summaries)
+    return (COMPANY_CONTEXT +
+            "\n        Imóveis e conteúdos do site relacionados à pergunta (use-os na resposta quando fizer sentido):\n" +
+            lines + "\n")
+
+def build_messages(message, context=COMPANY_CONTEXT):
+    return [
+        {"role": "system", "content": context},
+        {"role": "user", "content": message}
+    ]
+
+class OpenAIChatBackend:
+    """Streams completions from the OpenAI chat API"""
+
+    # the newest OpenAI model is "gpt-5" which was released August 7, 2025.
+    # do not change this unless explicitly requested by the user
+    def __init__(self, client, model="gpt-5", max_tokens=300, temperature=0.7):
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    def stream(self, messages):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            stream=True
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+class FakeChatBackend:
+    """Deterministic local stand-in for the LLM, streaming word by word"""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+
+    def stream(self, messages):
+        question = messages[-1]['content'].strip()
+        reply = (f'Obrigada pela pergunta sobre "{question}". Nossa consultora Rose Ventura pode '
+                 f'ajudar com todos os detalhes; fale conosco pelo WhatsApp (11) 98755-7913.')
+        for i, word in enumerate(reply.split(' ')):
+            if self.delay:
+                time.sleep(self.delay)
+            yield word if i == 0 else ' ' + word
+
+def complete(backend, messages):
+    """Whole reply as one string, for callers that don't stream"""
+    return ''.join(backend.stream(messages))
+
+def create_chat_backend(name, api_key=None, fake_delay=0.02):
+    """Backend selected by CHATBOT_BACKEND ('openai' or 'fake'); None when OpenAI has no API key"""
+    if name == 'fake':
+        return FakeChatBackend(delay=fake_delay)
+    if not api_key:
+        return None
+    from openai import OpenAI
+    return OpenAIChatBackend(OpenAI(api_key=api_key))
+
+def sse_event(event, payload):
+    """Format one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+class StreamLimiter:
+    """Caps concurrent chat streams so they can never occupy every server thread"""
+
+    def __init__(self, max_streams):
+        self._semaphore = threading.BoundedSemaphore(max_streams)
+
+    def acquire(self):
+        return self._semaphore.acquire(blocking=False)
+
+    def release(self):
+        self._semaphore.release()
+
+def normalize_message(text):
+    """Fold accents, case, punctuation and whitespace: "Quais  bairros?" == "quais bairros"."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r'[^\w\s]', ' ', text.casefold())
+    return ' '.join(text.split())
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# Words that change what a question asks without changing many trigrams: quantities and negations
+GUARD_WORDS = {
+    'um', 'uma', 'dois', 'duas', 'tres', 'quatro', 'cinco', 'seis', 'sete', 'oito', 'nove', 'dez',
+    'cem', 'mil', 'milhao', 'milhoes', 'bilhao', 'bilhoes', 'meio', 'meia',
+    'nao', 'nem', 'nunca', 'sem', 'jamais', 'nenhum', 'nenhuma',
+}
+
+def guard_tokens(normalised):
+    """Numbers, number words and negations of a normalised message, in order"""
+    return tuple(word for word in normalised.split() if word in GUARD_WORDS or any(char.isdigit() for char in word))
+
+def context_fingerprint(messages):
+    """Hash of everything but the visitor's message, so answers are only reused for the same prompt"""
+    return hashlib.sha256(json.dumps(messages[:-1], sort_keys=True).encode()).hexdigest()[:16]
+
+class ResponseCache:
+    """TTL + LRU cache of chatbot answers keyed by normalised question.
+
+    Exact matches on the normalised text are O(1). With a similarity
+    threshold, a miss falls back to comparing character trigrams (Jaccard)
+    against the cached questions for the same prompt, so "como agendar
+    visitas" can reuse the answer to "Como agendar visita?". Only questions
+    with the same numbers and negations are compared: "2 quartos" and
+    "3 quartos" share almost every trigram but need different answers.
+    """
+
+    def __init__(self, ttl=6 * 3600, max_entries=500, similarity=0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (context, normalised) -> (expires_at, trigrams, guard tokens, answer)
+        self.stats = {'hits': 0, 'similar_hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'purges': 0}
+
+    def get(self, message, context=''):
+        key = (context, normalize_message(message))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                del self._entries[key]
+                self.stats['expired'] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[3]
+
+            if self.similarity and key[1]:
+                grams = trigrams(key[1])
+                guards = guard_tokens(key[1])
+                best, best_score = None, self.similarity
+                for (entry_context, _), (expires_at, entry_grams, entry_guards, answer) in self._entries.items():
+                    if entry_context != context or expires_at < now or entry_guards != guards:
+                        continue
+                    score = len(grams & entry_grams) / len(grams | entry_grams)
+                    if score >= best_score:
+                        best, best_score = answer, score
+                if best is not None:
+                    self.stats['similar_hits'] += 1
+                    return best
+
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, message, answer, context=''):
+        normalised = normalize_message(message)
+        if not normalised or not answer:
+            return
+        key = (context, normalised)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, trigrams(normalised), guard_tokens(normalised), answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def purge(self):
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self.stats['purges'] += 1
+        return count
+
+    def snapshot(self):
+        """Counters and current size, for the admin stats endpoint"""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['similar_hits'] + self.stats['misses']
+            hits = self.stats['hits'] + self.stats['similar_hits']
+            return dict(self.stats, entries=len(self._entries), max_entries=self.max_entries,
+                        ttl=self.ttl, similarity=self.similarity,
+                        hit_rate=round(hits / lookups, 4) if lookups else None)
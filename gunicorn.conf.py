@@ -0,0 +1,110 @@
+"""
+Perfil de produção do gunicorn.
+
+    gunicorn -c gunicorn.conf.py
+
+Workers and threads are derived from the CPUs the container may use, the
+app is imported once in the master (preload_app) and forked, and the
+SQLAlchemy pool of each worker is sized from its threads so that
+workers x (pool + overflow) stays under DB_MAX_CONNECTIONS. The media
+caches' memory tiers share MEDIA_CACHE_TOTAL_MEMORY_MB the same way;
+each worker's image process pool is sized on its own (see below).
+
+Worker classes (GUNICORN_WORKER_CLASS):
+
+- gthread (default): WEB_CONCURRENCY processes x GUNICORN_THREADS threads.
+  A slow video download or chatbot call holds one thread, not the site.
+- gevent: one greenlet per connection, up to GUNICORN_WORKER_CONNECTIONS
+  per worker. Needs `pip install gevent psycogreen` (psycogreen makes
+  psycopg2 cooperative). The app is then imported in each worker after
+  gevent's monkey-patching instead of being preloaded.
+
+Every setting can still be overridden on the command line or with
+GUNICORN_CMD_ARGS.
+"""
+import os
+
+from imaging import available_cpus
+
+cpus = available_cpus()
+
+wsgi_app = 'main:app'
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(2 * cpus + 1, int(os.environ.get('GUNICORN_MAX_WORKERS', 8)))))
+threads = int(os.environ.get('GUNICORN_THREADS', 8)) if worker_class == 'gthread' else 1
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200))
+
+# Long enough for video uploads and chatbot streams; gthread workers heartbeat while requests run
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+graceful_timeout = 30
+keepalive = 5
+max_requests = 1000
+max_requests_jitter = 50
+
+loglevel = 'info'
+errorlog = '-'
+# instrumentation.py already logs one line per request with timings and bytes; a second access line costs throughput
+instrumented = os.environ.get('INSTRUMENTATION', '1') != '0' and os.environ.get('INSTRUMENTATION_LOG', '1') != '0'
+accesslog = None if instrumented else '-'
+
+# gevent must patch the stdlib before the app (and psycopg2, ssl...) is imported
+preload_app = worker_class != 'gevent'
+
+# Connections per worker: one per request thread plus the media job thread, with overflow for
+# chatbot streams, all within the database's budget (Railway Postgres allows ~100)
+db_budget = max(2, (int(os.environ.get('DB_MAX_CONNECTIONS', 100)) - 10) // workers)
+concurrency = threads + 1 if worker_class == 'gthread' else worker_connections
+os.environ.setdefault('DB_POOL_SIZE', str(min(concurrency, db_budget // 2 if worker_class == 'gevent' else db_budget)))
+os.environ.setdefault('DB_MAX_OVERFLOW', str(max(0, min(concurrency, db_budget - int(os.environ['DB_POOL_SIZE'])))))
+
+# Each worker has its own image process pool. Splitting the CPUs between workers would give every
+# host below 8 CPUs a pool of 1 (inline processing), since workers = 2 x CPUs + 1; the pools sit
+# idle outside uploads and a batch rarely runs in two workers at once, so each gets half the CPUs
+# (at least 2) and the kernel shares them on the odd overlap
+os.environ.setdefault('IMAGE_PROCESS_WORKERS', str(max(2, cpus // 2)))
+# The in-memory media caches are always in use, so their budget is split between workers
+os.environ.setdefault('MEDIA_CACHE_MEMORY_MB', str(max(8, int(os.environ.get('MEDIA_CACHE_TOTAL_MEMORY_MB', 256)) // workers)))
+
+# Rendered pages must be invalidated in every worker, so they share the SQLite page cache
+if workers > 1:
+    os.environ.setdefault('PAGE_CACHE_BACKEND', 'sqlite')
+
+# The media job thread is started per worker in post_worker_init; a thread started while
+# preloading would live in the master only (the original setting survives config reloads on HUP)
+os.environ.setdefault('GUNICORN_MEDIA_JOB_WORKER', os.environ.get('MEDIA_JOB_WORKER', '1'))
+start_job_worker = os.environ['GUNICORN_MEDIA_JOB_WORKER'] != '0'
+os.environ['MEDIA_JOB_WORKER'] = '0'
+
+def on_starting(server):
+    server.log.info(
+        f"Perfil: {workers} workers {worker_class} x {threads} threads ({cpus} CPUs), "
+        f"pool {os.environ['DB_POOL_SIZE']}+{os.environ['DB_MAX_OVERFLOW']} conexões por worker, "
+        f"{os.environ['IMAGE_PROCESS_WORKERS']} processos de imagem e {os.environ['MEDIA_CACHE_MEMORY_MB']} MB "
+        f"de cache de mídia por worker, "
+        f"preload={preload_app}, page cache {os.environ.get('PAGE_CACHE_BACKEND', 'memory')}")
+
+def when_ready(server):
+    if preload_app:
+        # Close the connections opened while preloading so no worker inherits them
+        from main import app, db
+        with app.app_context():
+            db.engine.dispose()
+
+def post_worker_init(worker):
+    from main import app, db
+    with app.app_context():
+        # Never reuse a pooled connection across fork; close=False leaves the parent's sockets alone
+        db.engine.dispose(close=False)
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            worker.log.warning("psycogreen não instalado: consultas ao Postgres bloqueiam o worker gevent")
+    # Fork the image processes before this worker starts any thread (job thread, request threads)
+    import routes
+    routes.start_image_pool()
+    if start_job_worker:
+        import jobs
+        jobs.start_worker()
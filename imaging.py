@@ -0,0 +1,207 @@
+"""Image re-encoding helpers shared by uploads and background processing.
+
+These functions only depend on Pillow so they can run outside the Flask
+app (worker processes, maintenance scripts).
+"""
+import io
+import os
+import math
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from PIL import Image, features
+
+# Widths of the responsive renditions generated for every uploaded image
+VARIANT_WIDTHS = (320, 640, 1280, 1920)
+
+# Bounding box uploaded images are downscaled to before storage
+MAX_IMAGE_DIMENSIONS = (1920, 1080)
+
+# Pillow format name -> (content type, encoder options); JPEG is always the fallback.
+# AVIF's quality scale runs lower than JPEG's for the same visual result.
+IMAGE_FORMATS = {
+    'JPEG': ('image/jpeg', {'optimize': True}),
+    'WEBP': ('image/webp', {'method': 4}),
+    'AVIF': ('image/avif', {'speed': 8, 'quality': 60}),
+}
+
+def available_formats():
+    """Formats this Pillow build can encode, most compact last"""
+    formats = ['JPEG']
+    if features.check('webp'):
+        formats.append('WEBP')
+    if features.check('avif'):
+        formats.append('AVIF')
+    return formats
+
+def to_rgb(img):
+    """Flatten transparency onto a white background so the image can be saved as JPEG"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+def encode_image(img, image_format='JPEG', quality=85):
+    """Encode a PIL image in one of IMAGE_FORMATS and return the bytes"""
+    buffer = io.BytesIO()
+    options = {'quality': quality, **IMAGE_FORMATS[image_format][1]}
+    img.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+def encode_jpeg(img, quality=85):
+    """Encode a PIL image as an optimised JPEG and return the bytes"""
+    return encode_image(img, 'JPEG', quality)
+
+def recompress_image(source, max_size=MAX_IMAGE_DIMENSIONS, quality=85):
+    """Decode an image from a path or file object, fit it in max_size and return it as JPEG bytes.
+
+    JPEG sources are decoded at a reduced DCT scale when they are much
+    larger than max_size, so memory use depends on the output size rather
+    than the camera resolution; the result never touches the filesystem.
+    """
+    with Image.open(source) as img:
+        img.draft('RGB', max_size)
+        img = to_rgb(img)
+        if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
+            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+        return encode_jpeg(img, quality)
+
+def _variant(img, width, image_format, quality):
+    data = encode_image(img, image_format, quality)
+    return {
+        'width': width,
+        'data': data,
+        'content_type': IMAGE_FORMATS[image_format][0],
+        'size': len(data),
+        'hash': hashlib.sha256(data).hexdigest()
+    }
+
+def build_variants(data, widths=VARIANT_WIDTHS, formats=None, quality=85):
+    """Generate downscaled renditions of an image in every available format.
+
+    Only widths smaller than the source are produced, since upscaling
+    would just add bytes; the source is stored as JPEG already, so only
+    the modern formats get a full-size rendition. Returns a list of dicts
+    with width, data, content_type, size and hash keys, ordered by width.
+    """
+    formats = formats or available_formats()
+    variants = []
+    with Image.open(io.BytesIO(data)) as source:
+        img = to_rgb(source)
+        for width in sorted(widths):
+            if width >= img.width:
+                break
+            height = max(1, round(img.height * width / img.width))
+            resized = img.resize((width, height), Image.Resampling.LANCZOS)
+            for image_format in formats:
+                variants.append(_variant(resized, width, image_format, quality))
+        for image_format in formats:
+            if image_format != 'JPEG':
+                variants.append(_variant(img, img.width, image_format, quality))
+    return variants
+
+def image_width(data):
+    """Read the pixel width of an encoded image without decoding it fully"""
+    with Image.open(io.BytesIO(data)) as img:
+        return img.width
+
+def process_image(data, quality=85):
+    """Recompress an uploaded image and build its renditions.
+
+    Returns a dict with data, content_type, size, hash, width and variants;
+    runs in worker processes, so it only takes and returns plain values.
+    """
+    data = recompress_image(io.BytesIO(data), quality=quality)
+    return {
+        'data': data,
+        'content_type': 'image/jpeg',
+        'size': len(data),
+        'hash': hashlib.sha256(data).hexdigest(),
+        'width': image_width(data),
+        'variants': build_variants(data, quality=quality)
+    }
+
+def _cgroup_cpu_limit():
+    """CPU quota of the container (cgroup v2, else v1), or None when unlimited"""
+    for path in ('/sys/fs/cgroup/cpu.max', '/sys/fs/cgroup/cpu/cpu.cfs_quota_us'):
+        try:
+            with open(path) as f:
+                values = f.read().split()
+            if len(values) == 1:  # v1 keeps the period in a separate file
+                with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                    values.append(f.read().strip())
+        except OSError:
+            continue
+        try:
+            quota, period = int(values[0]), int(values[1])
+        except ValueError:  # "max"
+            return None
+        return max(1, math.ceil(quota / period)) if quota > 0 else None
+    return None
+
+def available_cpus():
+    """CPUs this process may use: its affinity mask, capped by the container's CPU quota.
+
+    os.cpu_count() reports every CPU of the host, which in a container
+    limited to one CPU would start a dozen image workers.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    return min(cpus, limit) if limit else cpus
+
+def create_pool(max_workers):
+    """Process pool for image work, with its workers already started.
+
+    Workers are forked where the platform allows it: spawned workers would
+    re-import the server's __main__ script (running the whole app startup
+    again), while forked ones only ever run process_image. A fork copies
+    only the calling thread, so a lock held by any other thread stays
+    locked in the child; the pool must therefore be created before the
+    process starts threads, which is why the workers are forked here
+    rather than on the first submit.
+    """
+    method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(method))
+    executor.submit(int).result()  # a fork pool starts all of its processes on the first submit
+    return executor
+
+def process_images(items, executor=None, max_in_flight=4, quality=85):
+    """Run process_image over (key, data) pairs, in parallel when given an executor.
+
+    Yields (key, result, error) in completion order; a failing image only
+    produces an error entry and never stops the batch. At most
+    max_in_flight images are submitted at once so memory stays bounded
+    however many images the batch holds.
+    """
+    if executor is None:
+        for key, data in items:
+            try:
+                yield key, process_image(data, quality), None
+            except Exception as e:
+                yield key, None, e
+        return
+
+    items = iter(items)
+    in_flight = {}
+    while True:
+        for key, data in items:
+            in_flight[executor.submit(process_image, data, quality)] = key
+            if len(in_flight) >= max_in_flight:
+                break
+        if not in_flight:
+            return
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            key = in_flight.pop(future)
+            try:
+                yield key, future.result(), None
+            except Exception as e:
+                yield key, None, e
@@ -0,0 +1,214 @@
+"""Per-request instrumentation.
+
+A WSGI wrapper around the app gives every request a RequestMetrics that
+SQLAlchemy cursor events and Flask's template signals add to, through a
+context variable (per thread, or per greenlet under gevent), so code
+outside a request (the media job thread) costs one lookup per query. Each
+response gets a Server-Timing header (db, tpl, app) that browsers show
+in their network panel. Once the body has been sent, one JSON log line
+records the status, total and app time, query count and time, template
+time and bytes sent. The line also lists any statement executed more
+than INSTRUMENTATION_N_PLUS_ONE times while the view ran, the usual
+lazy-load-in-a-loop N+1. Queries made while streaming a body
+(chunked blob reads) are counted but not treated as N+1.
+
+Phases overlap: queries run from a template count in both db and tpl.
+"""
+import re
+import json
+import time
+import logging
+from collections import Counter
+from contextvars import ContextVar
+
+from flask import request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('instrumentation')
+
+_current = ContextVar('request_metrics', default=None)
+
+_SELECT_LIST = re.compile(r'^SELECT .+? FROM ', re.S)
+
+def statement_shape(statement):
+    """One-line statement with the SELECT column list elided, for log lines"""
+    return _SELECT_LIST.sub('SELECT ... FROM ', ' '.join(statement.split()), count=1)[:300]
+
+class RequestMetrics:
+    """What one request spent on the database, templates and the response body"""
+    __slots__ = ('started', 'app_ms', 'db_ms', 'queries', 'statements', 'streaming', 'template_ms',
+                 'templates', 'bytes_sent', 'status', 'endpoint', '_query_started', '_render_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.app_ms = None
+        self.db_ms = 0.0
+        self.queries = 0
+        self.statements = Counter()
+        self.streaming = False
+        self.template_ms = 0.0
+        self.templates = 0
+        self.bytes_sent = 0
+        self.status = None
+        self.endpoint = None
+        self._query_started = None
+        self._render_started = []
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics._query_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics = _current.get()
+    if metrics is None or metrics._query_started is None:
+        return
+    metrics.db_ms += (time.perf_counter() - metrics._query_started) * 1000
+    metrics._query_started = None
+    metrics.queries += 1
+    if not metrics.streaming:
+        # Bound parameters keep the text identical across ids, so the string is the statement's shape
+        metrics.statements[statement] += 1
+
+def _before_render(sender, template, context, **extra):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics._render_started.append(time.perf_counter())
+
+def _rendered(sender, template, context, **extra):
+    metrics = _current.get()
+    if metrics is not None and metrics._render_started:
+        elapsed = (time.perf_counter() - metrics._render_started.pop()) * 1000
+        metrics.templates += 1
+        if not metrics._render_started:  # nested render_template calls are inside the outer one
+            metrics.template_ms += elapsed
+
+class _CountingIterator:
+    """Response body wrapper that counts the bytes sent and finishes the metrics on close()"""
+
+    def __init__(self, app_iter, on_close):
+        self._app_iter = app_iter
+        self._iter = iter(app_iter)
+        self._on_close = on_close
+        self.bytes_sent = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self._iter)
+        self.bytes_sent += len(chunk)
+        return chunk
+
+    def close(self):
+        try:
+            if hasattr(self._app_iter, 'close'):
+                self._app_iter.close()
+        finally:
+            self._on_close(self.bytes_sent)
+
+class Instrumentation:
+    """Wraps a Flask app; configured by the INSTRUMENTATION_* settings"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.n_plus_one = 5
+        self.slow_ms = 1000
+        self.log = True
+        self.server_timing = True
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('INSTRUMENTATION', True)
+        if not self.enabled:
+            return
+        self.n_plus_one = app.config.get('INSTRUMENTATION_N_PLUS_ONE', 5)
+        self.slow_ms = app.config.get('INSTRUMENTATION_SLOW_MS', 1000)
+        self.log = app.config.get('INSTRUMENTATION_LOG', True)
+        self.server_timing = app.config.get('INSTRUMENTATION_SERVER_TIMING', True)
+
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_rendered, app)
+        # Registered before the routes' hooks, so it runs last and sees the final response
+        app.after_request(self._after_request)
+        app.wsgi_app = self.wrap(app.wsgi_app)
+
+    def _after_request(self, response):
+        metrics = _current.get()
+        if metrics is None:
+            return response
+        metrics.endpoint = request.endpoint
+        metrics.app_ms = (time.perf_counter() - metrics.started) * 1000
+        if self.server_timing:
+            response.headers.add('Server-Timing', ', '.join([
+                f'db;dur={metrics.db_ms:.1f};desc="{metrics.queries} queries"',
+                f'tpl;dur={metrics.template_ms:.1f}',
+                f'app;dur={metrics.app_ms:.1f}',
+            ]))
+        return response
+
+    def wrap(self, wsgi_app):
+        """WSGI middleware binding a RequestMetrics to each request"""
+        def instrumented(environ, start_response):
+            metrics = RequestMetrics()
+            token = _current.set(metrics)
+            headers = {}
+
+            def capture_start_response(status, response_headers, exc_info=None):
+                metrics.status = int(status.split(' ', 1)[0])
+                for name, value in response_headers:
+                    if name.lower() == 'content-length':
+                        headers['content_length'] = int(value)
+                return start_response(status, response_headers, exc_info)
+
+            def finish(bytes_sent):
+                metrics.bytes_sent = bytes_sent
+                try:
+                    _current.reset(token)
+                except ValueError:  # closed from another context
+                    _current.set(None)
+                self.report(metrics, environ)
+
+            try:
+                app_iter = wsgi_app(environ, capture_start_response)
+            except BaseException:
+                _current.reset(token)
+                raise
+            metrics.streaming = True
+            file_wrapper = environ.get('wsgi.file_wrapper')
+            if isinstance(file_wrapper, type) and isinstance(app_iter, file_wrapper):
+                # Left unwrapped so the server can still sendfile() it; the size comes from the headers
+                finish(headers.get('content_length', 0))
+                return app_iter
+            return _CountingIterator(app_iter, finish)
+        return instrumented
+
+    def report(self, metrics, environ):
+        """Write the request's log line, as a warning when it was slow or looked like an N+1"""
+        repeated = [{'count': count, 'statement': statement_shape(statement)}
+                    for statement, count in metrics.statements.most_common(3) if count > self.n_plus_one]
+        total_ms = (time.perf_counter() - metrics.started) * 1000
+        slow = total_ms >= self.slow_ms
+        if not (self.log or repeated or slow):
+            return
+        record = {
+            'method': environ.get('REQUEST_METHOD'),
+            'path': environ.get('PATH_INFO'),
+            'ip': environ.get('REMOTE_ADDR'),  # already rewritten by ProxyFix
+            'endpoint': metrics.endpoint,
+            'status': metrics.status,
+            'ms': round(total_ms, 1),
+            'app_ms': round(metrics.app_ms, 1) if metrics.app_ms is not None else None,
+            'db_ms': round(metrics.db_ms, 1),
+            'queries': metrics.queries,
+            'template_ms': round(metrics.template_ms, 1),
+            'bytes': metrics.bytes_sent,
+        }
+        if repeated:
+            record['n_plus_one'] = repeated
+        level = logging.WARNING if repeated or slow else logging.INFO
+        logger.log(level, json.dumps(record, ensure_ascii=False, separators=(',', ':')))
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Fila de processamento de mídia em segundo plano.
+
+Jobs live in the media_job table so any web worker can enqueue them and
+any process (the in-app worker thread or `python jobs.py drain`) can run
+them. Claiming is an optimistic UPDATE ... WHERE status = 'pending', which
+works the same on Postgres and SQLite and lets several workers share the
+queue without running a job twice.
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+if __name__ == '__main__':
+    # The CLI drains the queue itself; don't start the in-app worker thread too
+    os.environ.setdefault('MEDIA_JOB_WORKER', '0')
+
+# Import from main to avoid circular imports
+try:
+    from main import app, db
+except ImportError:
+    from app import app, db
+
+from models import MediaJob
+
+POLL_INTERVAL = 2  # seconds between queue checks when idle
+RETRY_DELAY = 10  # seconds before the first retry, doubled on each attempt
+STALE_AFTER = timedelta(minutes=10)  # running jobs older than this are assumed orphaned
+
+ACTIVE_STATUSES = ('pending', 'running')
+
+HANDLERS = {}
+_wakeup = threading.Event()
+
+def job_handler(kind):
+    """Register the function that runs jobs of the given kind; it receives the target id"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+def enqueue(kind, target_id, max_attempts=3):
+    """Add a job to the current session; it becomes visible to workers once the caller commits"""
+    job = MediaJob()
+    job.kind = kind
+    job.target_id = target_id
+    job.status = 'pending'
+    job.attempts = 0
+    job.max_attempts = max_attempts
+    job.run_after = datetime.utcnow()
+    db.session.add(job)
+    return job
+
+def notify():
+    """Wake the in-process worker after committing new jobs"""
+    _wakeup.set()
+
+def active_targets(kind):
+    """Ids of the objects of a kind that still have pending or running jobs"""
+    rows = db.session.query(MediaJob.target_id).filter(
+        MediaJob.kind == kind, MediaJob.status.in_(ACTIVE_STATUSES)
+    ).distinct()
+    return {row[0] for row in rows}
+
+def requeue_stale():
+    """Put back jobs whose worker died mid-run"""
+    cutoff = datetime.utcnow() - STALE_AFTER
+    count = MediaJob.query.filter(MediaJob.status == 'running', MediaJob.started_at < cutoff).update(
+        {'status': 'pending'}, synchronize_session=False)
+    db.session.commit()
+    return count
+
+def claim_next(ignore_schedule=False):
+    """Atomically mark the oldest ready job as running and return it, or None"""
+    now = datetime.utcnow()
+    query = db.session.query(MediaJob.id).filter(MediaJob.status == 'pending')
+    if not ignore_schedule:
+        query = query.filter(MediaJob.run_after <= now)
+    for (job_id,) in query.order_by(MediaJob.id).limit(10).all():
+        claimed = MediaJob.query.filter_by(id=job_id, status='pending').update({
+            'status': 'running',
+            'attempts': MediaJob.attempts + 1,
+            'started_at': now
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(MediaJob, job_id)
+    return None
+
+def run_job(job):
+    """Run a claimed job, scheduling a retry with exponential backoff if it fails"""
+    job_id = job.id
+    try:
+        handler = HANDLERS.get(job.kind)
+        if handler is None:
+            raise LookupError(f"Nenhum handler registrado para jobs do tipo {job.kind}")
+        handler(job.target_id)
+
+        job = db.session.get(MediaJob, job_id)
+        job.status = 'done'
+        job.last_error = None
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        print(f"Media job {job_id} ({job.kind}:{job.target_id}) done")
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(MediaJob, job_id)
+        job.last_error = f"{type(e).__name__}: {e}"
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+        else:
+            job.status = 'pending'
+            job.run_after = datetime.utcnow() + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+        db.session.commit()
+        print(f"Error in media job {job_id} ({job.kind}:{job.target_id}), attempt {job.attempts}: {e}")
+    return job.status
+
+def run_pending(limit=None, ignore_schedule=False):
+    """Run ready jobs until the queue is empty (or limit jobs ran); returns how many ran"""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next(ignore_schedule)
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+def _worker_loop():
+    while True:
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+        try:
+            with app.app_context():
+                requeue_stale()
+                run_pending()
+        except Exception as e:
+            print(f"Media job worker error: {e}")
+
+def start_worker():
+    """Start the background thread that runs queued jobs inside this process"""
+    thread = threading.Thread(target=_worker_loop, name='media-job-worker', daemon=True)
+    thread.start()
+    return thread
+
+def queue_counts():
+    """Number of jobs in each status"""
+    rows = db.session.query(MediaJob.status, db.func.count(MediaJob.id)).group_by(MediaJob.status)
+    return {status: count for status, count in rows}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fila de processamento de mídia')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    drain = subparsers.add_parser('drain', help='executa todos os jobs pendentes e sai')
+    drain.add_argument('--now', action='store_true', help='ignora o atraso de retentativa dos jobs com falha')
+    subparsers.add_parser('status', help='mostra quantos jobs há em cada estado')
+    subparsers.add_parser('retry-failed', help='recoloca na fila os jobs que esgotaram as tentativas')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        if args.command == 'drain':
+            from routes import start_image_pool
+            start_image_pool()
+            requeue_stale()
+            started = time.monotonic()
+            count = run_pending(ignore_schedule=args.now)
+            print(f"✅ {count} execuções de jobs em {time.monotonic() - started:.1f}s")
+        elif args.command == 'retry-failed':
+            count = MediaJob.query.filter_by(status='failed').update({
+                'status': 'pending', 'attempts': 0, 'run_after': datetime.utcnow(), 'finished_at': None
+            }, synchronize_session=False)
+            db.session.commit()
+            print(f"🔁 {count} jobs recolocados na fila")
+
+        for status, count in sorted(queue_counts().items()):
+            print(f"{status}: {count}")
+    return 0
+
+if __name__ == '__main__':
+    # Re-import under the module name so the handlers registered by routes.py share this registry
+    import jobs
+    sys.exit(jobs.main())
@@ -0,0 +1,207 @@
+"""In-memory BM25 index over properties and posts for the chatbot.
+
+The index lives in each process and is small (one entry per listing), so
+a query is a handful of dictionary lookups. Admin routes apply their
+writes incrementally; other processes notice the listings generation
+moving on (or the index getting old) and rebuild from the database in a
+background thread, searching the previous index meanwhile.
+"""
+import math
+import time
+import heapq
+import threading
+from collections import Counter, defaultdict
+from operator import itemgetter
+from chatbot import normalize_message
+
+# Words too common in questions and listings to help ranking
+STOPWORDS = {
+    'a', 'o', 'as', 'os', 'um', 'uma', 'uns', 'umas', 'de', 'da', 'do', 'das', 'dos', 'em', 'no', 'na',
+    'nos', 'nas', 'e', 'ou', 'com', 'sem', 'por', 'para', 'pra', 'que', 'se', 'ao', 'aos', 'tem', 'ter',
+    'voce', 'voces', 'vc', 'vcs', 'me', 'eu', 'meu', 'minha', 'quero', 'gostaria', 'algum', 'alguma',
+    'ate', 'mais', 'menos', 'qual', 'quais', 'como', 'onde', 'sobre', 'ha', 'esta', 'estao', 'sao', 'ser',
+}
+
+def tokenize(text):
+    """Accent/case-folded tokens with stopwords dropped and a light plural stem ("quartos" -> "quarto")"""
+    tokens = []
+    for token in normalize_message(text).split():
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+def property_document(property_obj):
+    """Indexed text and prompt summary of a property; title and location count twice"""
+    text = ' '.join(filter(None, [
+        property_obj.title, property_obj.title, property_obj.location, property_obj.location,
+        property_obj.property_type, property_obj.price, property_obj.description
+    ]))
+    details = ', '.join(filter(None, [property_obj.property_type, property_obj.location, property_obj.price]))
+    summary = f"Imóvel: {property_obj.title}" + (f" ({details})" if details else '')
+    if property_obj.description:
+        summary += f" - {property_obj.description[:200]}"
+    return text, summary
+
+def post_document(post_obj):
+    """Indexed text and prompt summary of a blog post"""
+    text = ' '.join(filter(None, [post_obj.title, post_obj.title, post_obj.content]))
+    summary = f"Post: {post_obj.title}"
+    if post_obj.content:
+        summary += f" - {post_obj.content[:200]}"
+    return text, summary
+
+class BM25Index:
+    """Okapi BM25 over an inverted index, with incremental add/remove.
+
+    Postings hold each document's precomputed term weight, so a query only
+    sums idf * weight; terms found in more than half the documents carry
+    almost no idf and are skipped when the query has rarer terms.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._postings = defaultdict(dict)  # term -> {doc_id: BM25 term weight}
+        self._counts = {}                   # doc_id -> term frequencies, to reweigh or remove
+        self._lengths = {}                  # doc_id -> token count
+        self._summaries = {}                # doc_id -> text injected into the prompt
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, doc_id, text, summary):
+        """Index a document, replacing any previous version with the same id"""
+        tokens = tokenize(text)
+        with self._lock:
+            self._remove(doc_id)
+            self._counts[doc_id] = Counter(tokens)
+            self._lengths[doc_id] = len(tokens)
+            self._summaries[doc_id] = summary
+            self._total_length += len(tokens)
+            self._weigh(doc_id)
+
+    def _weigh(self, doc_id):
+        average_length = self._total_length / len(self._lengths) or 1
+        norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+        for term, frequency in self._counts[doc_id].items():
+            self._postings[term][doc_id] = frequency * (self.k1 + 1) / (frequency + norm)
+
+    def reweigh(self):
+        """Recompute every weight against the current average length (after bulk loads)"""
+        with self._lock:
+            for doc_id in self._lengths:
+                self._weigh(doc_id)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        for term in self._counts.pop(doc_id, ()):
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id, 0)
+        self._summaries.pop(doc_id, None)
+
+    def search(self, query, k=3):
+        """Top-k (doc_id, score, summary) for a free-text query"""
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._lengths)
+            matched = [self._postings[term] for term in terms if term in self._postings]
+            if not count or not matched:
+                return []
+            rare = [postings for postings in matched if len(postings) <= count / 2]
+            scores = defaultdict(float)
+            for postings in rare or matched:
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, weight in postings.items():
+                    scores[doc_id] += idf * weight
+            best = heapq.nlargest(k, scores.items(), key=itemgetter(1))
+            return [(doc_id, score, self._summaries[doc_id]) for doc_id, score in best]
+
+class ListingIndex(BM25Index):
+    """BM25 index of the site's properties and posts that knows when it is stale"""
+
+    def __init__(self, max_age=300, **kwargs):
+        super().__init__(**kwargs)
+        self.max_age = max_age
+        self._rebuild_lock = threading.Lock()
+        self.generation = None
+        self.built_at = 0
+
+    def index_property(self, property_obj):
+        self.add(('property', property_obj.id), *property_document(property_obj))
+
+    def index_post(self, post_obj):
+        self.add(('post', post_obj.id), *post_document(post_obj))
+
+    def remove_property(self, property_id):
+        self.remove(('property', property_id))
+
+    def remove_post(self, post_id):
+        self.remove(('post', post_id))
+
+    def rebuild(self, properties, posts, generation=None):
+        """Replace the whole index; searches keep using the old one until the swap"""
+        fresh = ListingIndex(k1=self.k1, b=self.b)
+        for property_obj in properties:
+            fresh.index_property(property_obj)
+        for post_obj in posts:
+            fresh.index_post(post_obj)
+        fresh.reweigh()
+        with self._lock:
+            self._postings = fresh._postings
+            self._counts = fresh._counts
+            self._lengths = fresh._lengths
+            self._summaries = fresh._summaries
+            self._total_length = fresh._total_length
+        self.generation = generation
+        self.built_at = time.monotonic()
+
+    def is_stale(self, generation):
+        """True when content changed in another process or the index is older than max_age"""
+        return generation != self.generation or time.monotonic() - self.built_at > self.max_age
+
+    def refresh(self, generation, load):
+        """Rebuild from load() -> (properties, posts) if stale; only one thread rebuilds at a time.
+
+        Only the first build runs in the caller. Later rebuilds run in a
+        background thread and the caller searches the current index.
+        """
+        if not self.is_stale(generation):
+            return
+        if self.built_at:
+            if self._rebuild_lock.acquire(blocking=False):
+                threading.Thread(target=self._rebuild_in_background, args=(generation, load), daemon=True).start()
+            return
+        with self._rebuild_lock:
+            if self.is_stale(generation):
+                properties, posts = load()
+                self.rebuild(properties, posts, generation)
+
+    def _rebuild_in_background(self, generation, load):
+        try:
+            properties, posts = load()
+            self.rebuild(properties, posts, generation)
+        except Exception as e:
+            # Still stale, so the next query tries again
+            print(f"Warning: Could not rebuild the listing index: {e}")
+        finally:
+            self._rebuild_lock.release()
+
+    def advance(self, generation):
+        """Adopt the generation created by a write this process already applied incrementally.
+
+        If the index was already behind (another process wrote in between),
+        it stays stale and the next query rebuilds it.
+        """
+        if self.generation is not None and self.generation == generation - 1:
+            self.generation = generation
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Teste de carga dos perfis do gunicorn.
+
+Starts gunicorn with gunicorn.conf.py once per profile (WORKERSxTHREADS)
+against a seeded scratch database and measures page and media throughput
+while --slow clients keep chatbot requests in flight, which is what used
+to stall the single-worker deployment. The chatbot runs on the fake
+backend, so no API key is needed. Only the standard library is used on
+the client side.
+
+    python loadtest.py --profiles 1x1 1x8 2x8 --duration 15 --slow 4
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+PAGE_URLS = [
+    '/',
+    '/galeria',
+    '/galeria?q=piscina+varanda',
+    '/galeria?location=moema&type=apartamento',
+    '/galeria?sort=menor-preco',
+    '/posts',
+    '/sobre',
+]
+
+def prepare_database(database_url=None, properties=300, posts=50, conversations=500):
+    """Environment for a seeded database: DATABASE_URL if given, else a new SQLite file in a temp dir"""
+    workdir = tempfile.mkdtemp(prefix='maeva-load-')
+    env = dict(os.environ, MEDIA_JOB_WORKER='0', CHATBOT_BACKEND='fake',
+               DATABASE_URL=database_url or f"sqlite:///{os.path.join(workdir, 'load.db')}",
+               PAGE_CACHE_PATH=os.path.join(workdir, 'page_cache.sqlite3'),
+               MEDIA_STORAGE_PATH=os.path.join(workdir, 'media'))
+    quiet = {'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL}
+    subprocess.run([sys.executable, 'migrate_db.py'], cwd=ROOT, env=env, **quiet)
+    # seed.py refuses (exit 1) when the database already has data, which is fine here
+    subprocess.run([sys.executable, 'seed.py', '--properties', str(properties), '--images', '2',
+                    '--posts', str(posts), '--conversations', str(conversations)],
+                   cwd=ROOT, env=env, **quiet)
+    return env
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(env, workers, threads, worker_class='gthread', log_path=os.devnull, timeout=60):
+    """Start gunicorn with gunicorn.conf.py and wait until it answers; returns (process, port)"""
+    port = free_port()
+    server_env = dict(env, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads),
+                      GUNICORN_WORKER_CLASS=worker_class)
+    log = open(log_path, 'ab')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}'],
+        cwd=ROOT, env=server_env, stdout=log, stderr=log)
+    log.close()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn saiu com status {process.returncode} (log: {log_path})")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/')
+            if connection.getresponse().status == 200:
+                connection.close()
+                return process, port
+        except OSError:
+            pass
+        time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f"gunicorn não respondeu em {timeout}s (log: {log_path})")
+
+def stop_server(process):
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+def media_urls(port, limit=10):
+    """Image URLs linked from the gallery page"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    connection.request('GET', '/galeria')
+    html = connection.getresponse().read().decode('utf-8', 'replace')
+    connection.close()
+    urls = re.findall(r'src="(/(?:m|serve)/[^"]+)"', html)
+    return list(dict.fromkeys(urls))[:limit]
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def latency_summary(latencies, duration):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / duration, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+    }
+
+def _get(connection, url):
+    connection.request('GET', url)
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+def _fetch_loop(port, urls, deadline, latencies, errors, offset):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    i = offset
+    while time.monotonic() < deadline:
+        url = urls[i % len(urls)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            try:
+                status = _get(connection, url)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server may close an idle keep-alive connection (keepalive timeout, worker
+                # recycled by max_requests); like a browser, retry once on a fresh one
+                connection.close()
+                status = _get(connection, url)
+            if status != 200:
+                errors.append(f"{status} {url}")
+                continue
+            latencies.append(time.perf_counter() - started)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(f"{type(e).__name__} {url}")
+            connection.close()
+    connection.close()
+
+def _chat_loop(port, deadline, latencies, errors, client_id):
+    n = 0
+    while time.monotonic() < deadline:
+        n += 1
+        # Unique questions so the chatbot's answer cache never short-circuits the slow path
+        body = json.dumps({'message': f"Vocês têm imóveis em Moema? pergunta {client_id}-{n}",
+                           'user_name': f"Carga {client_id}", 'user_phone': '11999990000'})
+        started = time.perf_counter()
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+            connection.request('POST', '/chatbot/message', body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            if response.status != 200:
+                errors.append(f"{response.status} /chatbot/message")
+                continue
+            latencies.append(time.perf_counter() - started)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(f"{type(e).__name__} /chatbot/message")
+
+def run_load(port, duration=10.0, clients=16, slow=4, urls=None):
+    """Drive a running server for duration seconds; returns throughput and latency per kind of request"""
+    urls = urls or PAGE_URLS
+    media = media_urls(port)
+    page_latencies, media_latencies, chat_latencies, errors = [], [], [], []
+    deadline = time.monotonic() + duration
+    threads = []
+    for i in range(clients):
+        # One in four clients fetches images, the rest pages
+        if media and i % 4 == 3:
+            args = (port, media, deadline, media_latencies, errors, i)
+        else:
+            args = (port, urls, deadline, page_latencies, errors, i)
+        threads.append(threading.Thread(target=_fetch_loop, args=args, daemon=True))
+    for i in range(slow):
+        threads.append(threading.Thread(target=_chat_loop, args=(port, deadline, chat_latencies, errors, i), daemon=True))
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    return {
+        'duration_s': round(elapsed, 1),
+        'pages': latency_summary(page_latencies, elapsed),
+        'media': latency_summary(media_latencies, elapsed),
+        'chatbot': latency_summary(chat_latencies, elapsed),
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:5],
+    }
+
+def parse_profile(value):
+    try:
+        workers, threads = value.lower().split('x')
+        return int(workers), int(threads)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"perfil inválido: {value} (use WORKERSxTHREADS, ex. 2x8)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Teste de carga dos perfis do gunicorn')
+    parser.add_argument('--profiles', nargs='+', type=parse_profile, default=[(1, 1), (1, 8), (2, 8)],
+                        help='perfis WORKERSxTHREADS (padrão: 1x1 1x8 2x8)')
+    parser.add_argument('--worker-class', default='gthread', choices=['gthread', 'gevent', 'sync'])
+    parser.add_argument('--duration', type=float, default=10.0, help='segundos de carga por perfil')
+    parser.add_argument('--clients', type=int, default=16, help='clientes keep-alive buscando páginas e imagens')
+    parser.add_argument('--slow', type=int, default=4, help='clientes enviando perguntas ao chatbot')
+    parser.add_argument('--database-url', help='banco a usar (padrão: SQLite temporário com seed.py)')
+    parser.add_argument('--properties', type=int, default=300, help='imóveis sintéticos no banco temporário')
+    parser.add_argument('--log', default=os.devnull, help='arquivo para os logs do gunicorn')
+    parser.add_argument('--json', action='store_true', help='imprime o resultado em JSON')
+    args = parser.parse_args(argv)
+
+    env = prepare_database(args.database_url, properties=args.properties)
+    results = []
+    for workers, threads in args.profiles:
+        if not args.json:
+            print(f"🚀 {workers}x{threads} ({args.worker_class}): {args.clients} clientes, {args.slow} no chatbot, {args.duration:g}s")
+        process, port = start_server(env, workers, threads, args.worker_class, args.log)
+        try:
+            result = run_load(port, args.duration, args.clients, args.slow)
+        finally:
+            stop_server(process)
+        result.update(profile=f"{workers}x{threads}", workers=workers, threads=threads, worker_class=args.worker_class)
+        results.append(result)
+        if not args.json:
+            pages, media, chat = result['pages'], result['media'], result['chatbot']
+            print(f"   páginas: {pages['rps']} req/s  p50 {pages['p50_ms']}ms  p95 {pages['p95_ms']}ms  p99 {pages['p99_ms']}ms")
+            print(f"   imagens: {media['rps']} req/s  p50 {media['p50_ms']}ms  p95 {media['p95_ms']}ms")
+            print(f"   chatbot: {chat['requests']} respostas  p50 {chat['p50_ms']}ms")
+            if result['errors']:
+                print(f"   ⚠️ {result['errors']} erros: {', '.join(result['error_samples'])}")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return 1 if any(result['errors'] for result in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
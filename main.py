@@ -40,6 +40,10 @@ try:
         app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
             "pool_pre_ping": True,
             "pool_recycle": 300,
+            # Per process; gunicorn.conf.py sizes these from its threads and the server's connection limit
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+            "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+            "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 30)),
             "connect_args": {
                 "connect_timeout": 10,
                 "options": "-c client_encoding=utf8"
@@ -51,10 +55,73 @@ try:
     app.config['UPLOAD_FOLDER'] = 'uploads'
     os.makedirs('uploads', exist_ok=True)
     
+    # Media cache budgets (in-process LRU, then local disk under UPLOAD_FOLDER)
+    app.config['MEDIA_CACHE_MEMORY_MB'] = int(os.environ.get('MEDIA_CACHE_MEMORY_MB', 64))
+    app.config['MEDIA_CACHE_DISK_MB'] = int(os.environ.get('MEDIA_CACHE_DISK_MB', 512))
+    app.config['MEDIA_CACHE_MAX_ITEM_MB'] = int(os.environ.get('MEDIA_CACHE_MAX_ITEM_MB', 2))
+    
+    # Where new media bytes go: "database" (BYTEA columns), "disk" (needs a persistent volume)
+    # or "s3" (any S3-compatible endpoint; credentials from the usual AWS_* variables). See storage.py
+    app.config['MEDIA_STORAGE'] = os.environ.get('MEDIA_STORAGE', 'database')
+    app.config['MEDIA_STORAGE_PATH'] = os.environ.get('MEDIA_STORAGE_PATH', os.path.join('uploads', 'media'))
+    app.config['MEDIA_S3_BUCKET'] = os.environ.get('MEDIA_S3_BUCKET')
+    app.config['MEDIA_S3_ENDPOINT'] = os.environ.get('MEDIA_S3_ENDPOINT')  # e.g. http://localhost:9000 for MinIO
+    app.config['MEDIA_S3_REGION'] = os.environ.get('MEDIA_S3_REGION')
+    app.config['MEDIA_S3_PREFIX'] = os.environ.get('MEDIA_S3_PREFIX', 'media/')
+    app.config['MEDIA_S3_PUBLIC_URL'] = os.environ.get('MEDIA_S3_PUBLIC_URL')  # link media straight to the bucket/CDN
+    
+    # Disk-backed media handed to a front server: "x-accel-redirect" (nginx, with an internal
+    # location PREFIX aliased to ROOT) or "x-sendfile" (Apache/lighttpd); empty = gunicorn sendfile
+    app.config['MEDIA_ACCEL'] = os.environ.get('MEDIA_ACCEL', '').lower()
+    app.config['MEDIA_ACCEL_PREFIX'] = os.environ.get('MEDIA_ACCEL_PREFIX', '/internal-media/')
+    app.config['MEDIA_ACCEL_ROOT'] = os.path.abspath(os.environ.get('MEDIA_ACCEL_ROOT', os.getcwd()))
+    
+    # Rendered-page cache: "memory" for a single worker, "sqlite" to share it between workers
+    app.config['PAGE_CACHE_BACKEND'] = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+    app.config['PAGE_CACHE_PATH'] = os.environ.get('PAGE_CACHE_PATH', os.path.join('uploads', 'page_cache.sqlite3'))
+    app.config['PAGE_CACHE_MAX_ENTRIES'] = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 500))
+    
+    # Processes used to recompress uploaded images in parallel (1 = inline in the job worker);
+    # defaults to the CPUs the container may use, not the host's
+    from imaging import available_cpus
+    app.config['IMAGE_PROCESS_WORKERS'] = int(os.environ.get('IMAGE_PROCESS_WORKERS', available_cpus()))
+    
+    # Chatbot: "openai" (needs OPENAI_API_KEY) or "fake" for local testing; streams are capped
+    # so chat requests always leave server threads free for pages and media
+    app.config['CHATBOT_BACKEND'] = os.environ.get('CHATBOT_BACKEND', 'openai')
+    app.config['CHATBOT_MAX_STREAMS'] = int(os.environ.get('CHATBOT_MAX_STREAMS', 4))
+    
+    # Cache of answers to repeated questions. Exact matches only by default; a similarity such as 0.8
+    # also reuses answers to near-identical questions with the same numbers and negations
+    app.config['CHATBOT_CACHE_TTL'] = int(os.environ.get('CHATBOT_CACHE_TTL', 6 * 3600))
+    app.config['CHATBOT_CACHE_SIZE'] = int(os.environ.get('CHATBOT_CACHE_SIZE', 500))
+    app.config['CHATBOT_CACHE_SIMILARITY'] = float(os.environ.get('CHATBOT_CACHE_SIMILARITY', 0))
+    
+    # Listings injected into the chatbot prompt, and how long a process trusts its index without a rebuild
+    app.config['CHATBOT_TOP_K'] = int(os.environ.get('CHATBOT_TOP_K', 3))
+    app.config['CHATBOT_INDEX_MAX_AGE'] = int(os.environ.get('CHATBOT_INDEX_MAX_AGE', 300))
+    
+    # Admin sessions: how long a validated token skips the database, and how often expired rows are deleted
+    app.config['ADMIN_SESSION_CACHE_TTL'] = int(os.environ.get('ADMIN_SESSION_CACHE_TTL', 30))
+    app.config['ADMIN_SESSION_PURGE_INTERVAL'] = int(os.environ.get('ADMIN_SESSION_PURGE_INTERVAL', 600))
+    
+    # Per-request instrumentation (instrumentation.py): Server-Timing header, one JSON log line per
+    # request (INSTRUMENTATION_LOG=0 keeps only slow and N+1 requests) and a warning when one
+    # statement runs more than INSTRUMENTATION_N_PLUS_ONE times in a view
+    app.config['INSTRUMENTATION'] = os.environ.get('INSTRUMENTATION', '1') != '0'
+    app.config['INSTRUMENTATION_LOG'] = os.environ.get('INSTRUMENTATION_LOG', '1') != '0'
+    app.config['INSTRUMENTATION_SERVER_TIMING'] = os.environ.get('INSTRUMENTATION_SERVER_TIMING', '1') != '0'
+    app.config['INSTRUMENTATION_N_PLUS_ONE'] = int(os.environ.get('INSTRUMENTATION_N_PLUS_ONE', 5))
+    app.config['INSTRUMENTATION_SLOW_MS'] = int(os.environ.get('INSTRUMENTATION_SLOW_MS', 1000))
+    
     # Initialize database
     db = SQLAlchemy(model_class=Base)
     db.init_app(app)
     
+    # Before any route registers its after_request hooks, so the timings cover them
+    from instrumentation import Instrumentation
+    instrumentation = Instrumentation(app)
+    
     logger.info("✅ Flask app initialized successfully")
     
     # Basic health check route first
@@ -79,16 +146,28 @@ try:
     try:
         with app.app_context():
             # Import models
-            from models import Property, Post, AdminSession, PropertyImage, ChatbotConversation
+            from models import Property, Post, AdminSession, PropertyImage, ImageVariant, ChatbotConversation, MediaJob
             logger.info("✅ Models imported successfully")
             
             # Create tables
             db.create_all()
             logger.info("✅ Database tables created successfully")
             
+            # Full-text search index for local SQLite databases (Postgres gets it from migrate_db.py)
+            from search import install_sqlite_fts
+            if install_sqlite_fts():
+                logger.info("✅ SQLite full-text search index created")
+            
             # Import routes after models are ready
             import routes
             logger.info("✅ Routes imported successfully")
+        
+        # Background media processing (disable with MEDIA_JOB_WORKER=0 and run `python jobs.py drain` instead)
+        if os.environ.get('MEDIA_JOB_WORKER', '1') != '0':
+            import jobs
+            routes.start_image_pool()  # forked before the job thread exists
+            jobs.start_worker()
+            logger.info("✅ Media job worker started")
             
     except Exception as e:
         logger.error(f"Database/routes setup error: {e}")
@@ -0,0 +1,283 @@
+import io
+import os
+import uuid
+from datetime import datetime, timezone
+from flask import Response, current_app, request, stream_with_context
+from werkzeug.wsgi import wrap_file
+from sqlalchemy import select, func
+# Import from main to avoid circular imports
+try:
+    from main import db
+except ImportError:
+    from app import db
+
+# Size of each read issued against the database or a legacy file
+CHUNK_SIZE = 256 * 1024
+
+class DatabaseBlobReader(io.RawIOBase):
+    """Seekable file-like view over a LargeBinary column, read in chunks with substr().
+
+    With hash_column and content_hash every read also requires the row to
+    still hold that hash, so a row whose bytes were replaced in place (a
+    media job recompressing an image) raises FileNotFoundError instead of
+    returning new bytes under the old ETag and length.
+    """
+
+    def __init__(self, column, pk_column, pk, size, hash_column=None, content_hash=None):
+        super().__init__()
+        self.column = column
+        self.pk_column = pk_column
+        self.pk = pk
+        self.size = size
+        self.hash_column = hash_column
+        self.content_hash = content_hash
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, min(offset, self.size))
+        return self.position
+
+    def read(self, size=-1):
+        remaining = self.size - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b''
+
+        # substr() is 1-based and works on both Postgres bytea and SQLite blobs
+        query = select(func.substr(self.column, self.position + 1, size)).where(self.pk_column == self.pk)
+        if self.hash_column is not None:
+            query = query.where(self.hash_column == self.content_hash)
+        row = db.session.execute(query).first()
+        if row is None:
+            raise FileNotFoundError(f"{self.content_hash or self.pk} is no longer stored in this row")
+        chunk = bytes(row[0] or b'')
+        self.position += len(chunk)
+        return chunk
+
+def open_database_blob(column, pk_column, pk, size, hash_column=None, content_hash=None):
+    """Return an opener that reads a database blob lazily, chunk by chunk"""
+    return lambda: DatabaseBlobReader(column, pk_column, pk, size, hash_column, content_hash)
+
+def open_local_file(path):
+    """Return an opener for a legacy file stored on disk"""
+    return lambda: open(path, 'rb')
+
+def _if_range_matches(etag, last_modified):
+    """Check the If-Range validator against the current representation"""
+    if_range = request.if_range
+    if if_range.etag:
+        return etag is not None and if_range.etag == etag
+    if if_range.date:
+        return last_modified is not None and if_range.date == http_datetime(last_modified)
+    return True
+
+def http_datetime(value):
+    """Normalise a naive UTC datetime to the second-level precision used in HTTP headers"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.replace(microsecond=0)
+
+def is_not_modified(etag=None, last_modified=None):
+    """Evaluate If-None-Match / If-Modified-Since without touching the blob"""
+    if request.if_none_match:
+        return etag is not None and request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return http_datetime(last_modified) <= request.if_modified_since
+    return False
+
+def requested_ranges(size, etag=None, last_modified=None):
+    """Resolve the Range header into (start, stop) pairs.
+
+    Returns None when the full representation should be sent and an empty
+    list when none of the requested ranges can be satisfied.
+    """
+    byte_range = request.range
+    if byte_range is None or byte_range.units != 'bytes':
+        return None
+    if not _if_range_matches(etag, last_modified):
+        return None
+
+    ranges = []
+    for start, stop in byte_range.ranges:
+        if start < 0:
+            # Suffix range: the last N bytes
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            ranges.append((start, stop))
+    return ranges
+
+def _iter_chunks(fileobj, start, stop):
+    """Yield the bytes between start and stop without materialising them"""
+    fileobj.seek(start)
+    remaining = stop - start
+    while remaining > 0:
+        chunk = fileobj.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+def _stream(opener, ranges, mimetype=None, size=None, boundary=None):
+    fileobj = opener()
+    try:
+        if boundary is None:
+            for start, stop in ranges:
+                yield from _iter_chunks(fileobj, start, stop)
+            return
+
+        for start, stop in ranges:
+            yield _multipart_header(boundary, mimetype, start, stop, size)
+            yield from _iter_chunks(fileobj, start, stop)
+            yield b'\r\n'
+        yield f'--{boundary}--\r\n'.encode()
+    finally:
+        fileobj.close()
+
+def _multipart_header(boundary, mimetype, start, stop, size):
+    return (
+        f'--{boundary}\r\n'
+        f'Content-Type: {mimetype}\r\n'
+        f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n'
+    ).encode()
+
+def send_media(opener, size, mimetype, filename=None, cache_control=None, etag=None, last_modified=None):
+    """Stream a media object with byte-range (206) support.
+
+    ``opener`` is a callable returning a seekable file-like object; it is
+    only invoked once the response body is iterated, so HEAD requests,
+    304 revalidations and unsatisfiable ranges never touch the bytes.
+    """
+    headers = {'Accept-Ranges': 'bytes'}
+    if filename:
+        headers['Content-Disposition'] = f'inline; filename="{filename}"'
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+
+    if is_not_modified(etag, last_modified):
+        response = Response(status=304, headers=headers)
+        _set_validators(response, etag, last_modified)
+        return response
+
+    ranges = requested_ranges(size, etag, last_modified)
+
+    if ranges is None:
+        headers['Content-Length'] = str(size)
+        body = _stream(opener, [(0, size)])
+        status = 200
+    elif not ranges:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+    elif len(ranges) == 1:
+        start, stop = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        headers['Content-Length'] = str(stop - start)
+        body = _stream(opener, ranges)
+        status = 206
+    else:
+        boundary = uuid.uuid4().hex
+        length = sum(
+            len(_multipart_header(boundary, mimetype, start, stop, size)) + (stop - start) + 2
+            for start, stop in ranges
+        ) + len(f'--{boundary}--\r\n')
+        headers['Content-Length'] = str(length)
+        body = _stream(opener, ranges, mimetype, size, boundary)
+        mimetype = f'multipart/byteranges; boundary={boundary}'
+        status = 206
+
+    response = Response(stream_with_context(body), status=status, mimetype=mimetype,
+                        headers=headers, direct_passthrough=True)
+    _set_validators(response, etag, last_modified)
+    return response
+
+def _set_validators(response, etag, last_modified):
+    if etag:
+        response.set_etag(etag)
+    if last_modified:
+        response.last_modified = http_datetime(last_modified)
+
+def _accel_headers(path):
+    """X-Accel-Redirect (nginx) or X-Sendfile (Apache/lighttpd) header handing the file to the front server"""
+    mode = current_app.config.get('MEDIA_ACCEL')
+    if mode == 'x-sendfile':
+        return {'X-Sendfile': os.path.abspath(path)}
+    if mode == 'x-accel-redirect':
+        relative = os.path.relpath(os.path.abspath(path), current_app.config['MEDIA_ACCEL_ROOT'])
+        if not relative.startswith('..'):
+            return {'X-Accel-Redirect': current_app.config['MEDIA_ACCEL_PREFIX'].rstrip('/') + '/' + relative}
+    return None
+
+def send_file_path(path, mimetype, size=None, filename=None, cache_control=None, etag=None, last_modified=None):
+    """Serve a file on local disk without copying its bytes through Python.
+
+    With MEDIA_ACCEL the front server is told to send the file itself
+    (it then also answers Range requests). Otherwise full responses and
+    single ranges go out as the open file through the server's
+    wsgi.file_wrapper, which gunicorn turns into sendfile() from the
+    range start for exactly Content-Length bytes. Servers without a
+    file_wrapper and multipart ranges fall back to chunked streaming.
+    """
+    if size is None:
+        size = os.path.getsize(path)
+    headers = {'Accept-Ranges': 'bytes'}
+    if filename:
+        headers['Content-Disposition'] = f'inline; filename="{filename}"'
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+
+    if is_not_modified(etag, last_modified):
+        response = Response(status=304, headers=headers)
+        _set_validators(response, etag, last_modified)
+        return response
+
+    accel = _accel_headers(path)
+    if accel:
+        headers.update(accel)
+        response = Response(status=200, mimetype=mimetype, headers=headers)
+        _set_validators(response, etag, last_modified)
+        return response
+
+    ranges = requested_ranges(size, etag, last_modified)
+    if ranges is not None and not ranges:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+    if 'wsgi.file_wrapper' not in request.environ or (ranges and len(ranges) > 1):
+        return send_media(open_local_file(path), size, mimetype, filename=filename, cache_control=cache_control,
+                          etag=etag, last_modified=last_modified)
+
+    start, stop = ranges[0] if ranges else (0, size)
+    if ranges:
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    headers['Content-Length'] = str(stop - start)
+    if request.method == 'HEAD':
+        body = []
+    else:
+        fileobj = open(path, 'rb')
+        fileobj.seek(start)
+        body = wrap_file(request.environ, fileobj, CHUNK_SIZE)
+    response = Response(body, status=206 if ranges else 200, mimetype=mimetype,
+                        headers=headers, direct_passthrough=True)
+    _set_validators(response, etag, last_modified)
+    return response
+
+def send_local_file(path, mimetype, **kwargs):
+    """Serve a legacy on-disk file zero-copy, validated by its size and modification time"""
+    stat = os.stat(path)
+    kwargs.setdefault('last_modified', datetime.fromtimestamp(stat.st_mtime, timezone.utc))
+    kwargs.setdefault('etag', f'{int(stat.st_mtime)}-{stat.st_size}')
+    return send_file_path(path, mimetype, size=stat.st_size, **kwargs)
@@ -0,0 +1,282 @@
+import io
+import os
+import time
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows dev servers run a single process
+    fcntl = None
+
+class MediaCache:
+    """Two-tier LRU cache for media blobs keyed by content hash.
+
+    Hot blobs live in a byte-budgeted in-process LRU, so the memory budget
+    applies per worker; entries evicted from memory spill to a sharded
+    directory on local disk. That directory is shared by all workers on the
+    host and its byte budget is for the directory as a whole: after a spill,
+    whichever worker pushes it over budget scans it under a lock file and
+    removes the least recently used files (hits touch the file's mtime).
+    Workers keep no index of it, so a file removed by another worker is just
+    a miss. A small alias table maps
+    route-level keys (e.g. "property_main:12:640:image/webp") to blob
+    metadata so hot requests are answered without any database query.
+    Aliases are per process; when a ``generation`` callable is given (the
+    shared page-cache generation) they also expire as soon as it changes,
+    checked at most every generation_interval seconds, so a change made in
+    one worker reaches the others' aliases.
+    """
+
+    def __init__(self, disk_dir, max_memory_bytes=64 * 1024 * 1024, max_disk_bytes=512 * 1024 * 1024,
+                 max_item_bytes=2 * 1024 * 1024, alias_ttl=300, max_aliases=10000,
+                 generation=None, generation_interval=1.0, disk_scan_interval=30.0):
+        self.disk_dir = disk_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.max_item_bytes = max_item_bytes
+        self.alias_ttl = alias_ttl
+        self.max_aliases = max_aliases
+        self.generation = generation
+        self.generation_interval = generation_interval
+        self._generation = None
+        self._generation_checked_at = 0.0
+        self.disk_scan_interval = disk_scan_interval
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()   # hash -> bytes
+        self._memory_bytes = 0
+        self._disk_lock = threading.Lock()
+        self._disk_items = 0
+        self._disk_bytes = 0           # directory size at the last scan plus what this worker wrote since
+        self._disk_scanned_at = 0.0
+        self._aliases = OrderedDict()  # key -> (expires_at, generation, metadata)
+        self.stats = {
+            'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+            'memory_evictions': 0, 'disk_evictions': 0,
+            'alias_hits': 0, 'alias_misses': 0,
+        }
+        if self.disk_dir and self.max_disk_bytes > 0:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._enforce_disk_budget()
+
+    def _disk_enabled(self):
+        return bool(self.disk_dir) and self.max_disk_bytes > 0
+
+    def _disk_path(self, content_hash):
+        return os.path.join(self.disk_dir, content_hash[:2], content_hash)
+
+    def _scan_disk(self):
+        """(mtime, path, size) of every cached file in the shared directory"""
+        entries = []
+        for shard in os.listdir(self.disk_dir):
+            shard_dir = os.path.join(self.disk_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(shard_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:  # removed by another worker meanwhile
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def _enforce_disk_budget(self):
+        """Measure the shared directory and trim it to max_disk_bytes, oldest files first"""
+        with self._disk_lock:
+            lock_file = None
+            try:
+                if fcntl is not None:
+                    # One worker at a time, so two never evict the same budget overrun
+                    lock_file = open(os.path.join(self.disk_dir, '.lock'), 'w')
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                entries = self._scan_disk()
+                total = sum(size for _, _, size in entries)
+                evicted = 0
+                for _, path, size in sorted(entries):
+                    if total <= self.max_disk_bytes:
+                        break
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    total -= size
+                    evicted += 1
+            except OSError as e:
+                print(f"Warning: Could not trim media cache directory {self.disk_dir}: {e}")
+                return
+            finally:
+                if lock_file is not None:
+                    lock_file.close()
+            with self._lock:
+                self._disk_items = len(entries) - evicted
+                self._disk_bytes = total
+                self._disk_scanned_at = time.monotonic()
+                self.stats['disk_evictions'] += evicted
+
+    def cacheable(self, size):
+        return size is not None and 0 < size <= self.max_item_bytes
+
+    def get(self, content_hash):
+        """Return cached bytes for a hash, promoting disk hits into memory"""
+        with self._lock:
+            data = self._memory.get(content_hash)
+            if data is not None:
+                self._memory.move_to_end(content_hash)
+                self.stats['memory_hits'] += 1
+                return data
+
+        if self._disk_enabled():
+            path = self._disk_path(content_hash)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)  # marks it recently used for every worker's eviction
+            except OSError:
+                # Never spilled, or evicted by some worker
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.stats['disk_hits'] += 1
+                self._put_memory(content_hash, data)
+                return data
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, content_hash, data):
+        if self.cacheable(len(data)):
+            self._put_memory(content_hash, data)
+
+    def _put_memory(self, content_hash, data):
+        spilled = []
+        with self._lock:
+            if content_hash in self._memory:
+                self._memory.move_to_end(content_hash)
+                return
+            self._memory[content_hash] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes and self._memory:
+                evicted_hash, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+                self.stats['memory_evictions'] += 1
+                spilled.append((evicted_hash, evicted))
+        for evicted_hash, evicted in spilled:
+            self._put_disk(evicted_hash, evicted)
+
+    def _put_disk(self, content_hash, data):
+        if not self._disk_enabled() or len(data) > self.max_disk_bytes:
+            return
+        path = self._disk_path(content_hash)
+        if os.path.exists(path):  # already spilled, possibly by another worker
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so other workers never read a partial file
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not spill media {content_hash} to disk: {e}")
+            return
+
+        with self._lock:
+            self._disk_items += 1
+            self._disk_bytes += len(data)
+            # Other workers' spills are not in this estimate, hence the periodic rescan
+            due = (self._disk_bytes > self.max_disk_bytes
+                   or time.monotonic() - self._disk_scanned_at >= self.disk_scan_interval)
+        if due:
+            self._enforce_disk_budget()
+
+    def _remove_disk_file(self, content_hash):
+        try:
+            os.remove(self._disk_path(content_hash))
+        except OSError:
+            pass
+
+    def opener(self, content_hash, size, fallback):
+        """Wrap a blob opener so cacheable blobs are read once and then served from cache"""
+        def open_blob():
+            data = self.get(content_hash)
+            if data is None and self.cacheable(size):
+                with fallback() as source:
+                    data = source.read()
+                self.put(content_hash, data)
+            if data is not None:
+                return io.BytesIO(data)
+            return fallback()
+        return open_blob
+
+    def _current_generation(self):
+        if self.generation is None:
+            return None
+        now = time.monotonic()
+        if now - self._generation_checked_at >= self.generation_interval:
+            self._generation = self.generation()
+            self._generation_checked_at = now
+        return self._generation
+
+    def contains(self, content_hash):
+        """Whether the bytes for a hash are cached in memory or on disk"""
+        with self._lock:
+            if content_hash in self._memory:
+                return True
+        return self._disk_enabled() and os.path.exists(self._disk_path(content_hash))
+
+    def get_alias(self, key):
+        generation = self._current_generation()
+        with self._lock:
+            entry = self._aliases.get(key)
+            if entry is None or entry[0] < time.monotonic() or entry[1] != generation:
+                self._aliases.pop(key, None)
+                self.stats['alias_misses'] += 1
+                return None
+            self._aliases.move_to_end(key)
+            self.stats['alias_hits'] += 1
+            return entry[2]
+
+    def set_alias(self, key, metadata):
+        generation = self._current_generation()
+        with self._lock:
+            self._aliases[key] = (time.monotonic() + self.alias_ttl, generation, metadata)
+            self._aliases.move_to_end(key)
+            while len(self._aliases) > self.max_aliases:
+                self._aliases.popitem(last=False)
+
+    def invalidate(self, content_hash):
+        """Drop a blob from every tier along with the aliases pointing at it"""
+        with self._lock:
+            data = self._memory.pop(content_hash, None)
+            if data is not None:
+                self._memory_bytes -= len(data)
+            for key in [key for key, (_, _, metadata) in self._aliases.items() if metadata.get('hash') == content_hash]:
+                del self._aliases[key]
+        if self._disk_enabled():
+            self._remove_disk_file(content_hash)
+
+    def invalidate_prefix(self, prefix):
+        """Drop every alias whose key starts with prefix"""
+        with self._lock:
+            for key in [key for key in self._aliases if key.startswith(prefix)]:
+                del self._aliases[key]
+
+    def snapshot(self):
+        """Counters and current usage, for the admin stats endpoint"""
+        with self._lock:
+            lookups = self.stats['memory_hits'] + self.stats['disk_hits'] + self.stats['misses']
+            hits = self.stats['memory_hits'] + self.stats['disk_hits']
+            return dict(
+                self.stats,
+                hit_rate=round(hits / lookups, 4) if lookups else None,
+                memory_items=len(self._memory), memory_bytes=self._memory_bytes,
+                max_memory_bytes=self.max_memory_bytes,
+                disk_items=self._disk_items, disk_bytes=self._disk_bytes,
+                max_disk_bytes=self.max_disk_bytes,
+                aliases=len(self._aliases),
+            )
@@ -5,10 +5,15 @@ Script de migração simplificado para Railway
 import os
 import sys
 import logging
+import hashlib
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Media jobs enqueued here are run by the web workers; a worker thread in this short-lived
+# process would be killed mid-job when the migration exits
+os.environ.setdefault('MEDIA_JOB_WORKER', '0')
+
 try:
     from main import app, db
 except ImportError:
@@ -19,25 +24,59 @@ from sqlalchemy import text
 
 def add_missing_columns():
     """Adiciona colunas que podem estar faltando no banco de dados"""
+    from search import POSTGRES_SEARCH_COLUMN
     
     migrations = [
         # Property table
         "ALTER TABLE property ADD COLUMN IF NOT EXISTS video_data BYTEA",
         "ALTER TABLE property ADD COLUMN IF NOT EXISTS video_filename VARCHAR(255)",
         "ALTER TABLE property ADD COLUMN IF NOT EXISTS video_content_type VARCHAR(100)",
+        "ALTER TABLE property ADD COLUMN IF NOT EXISTS video_size INTEGER",
+        "ALTER TABLE property ADD COLUMN IF NOT EXISTS video_hash VARCHAR(64)",
+        "ALTER TABLE property ADD COLUMN IF NOT EXISTS video_storage VARCHAR(20)",
+        "ALTER TABLE property ADD COLUMN IF NOT EXISTS image_count INTEGER",
+        "ALTER TABLE property ADD COLUMN IF NOT EXISTS primary_image_id INTEGER",
+        "ALTER TABLE property ADD COLUMN IF NOT EXISTS price_cents BIGINT",
         
         # PropertyImage table
         "ALTER TABLE property_image ADD COLUMN IF NOT EXISTS image_data BYTEA",
         "ALTER TABLE property_image ADD COLUMN IF NOT EXISTS image_filename VARCHAR(255)",
         "ALTER TABLE property_image ADD COLUMN IF NOT EXISTS image_content_type VARCHAR(100)",
+        "ALTER TABLE property_image ADD COLUMN IF NOT EXISTS image_size INTEGER",
+        "ALTER TABLE property_image ADD COLUMN IF NOT EXISTS image_hash VARCHAR(64)",
+        "ALTER TABLE property_image ADD COLUMN IF NOT EXISTS image_width INTEGER",
+        "ALTER TABLE property_image ADD COLUMN IF NOT EXISTS image_storage VARCHAR(20)",
+        
+        # ImageVariant table
+        "ALTER TABLE image_variant ADD COLUMN IF NOT EXISTS image_storage VARCHAR(20)",
         
         # Post table
         "ALTER TABLE post ADD COLUMN IF NOT EXISTS image_data BYTEA",
         "ALTER TABLE post ADD COLUMN IF NOT EXISTS image_filename VARCHAR(255)",
         "ALTER TABLE post ADD COLUMN IF NOT EXISTS image_content_type VARCHAR(100)",
+        "ALTER TABLE post ADD COLUMN IF NOT EXISTS image_size INTEGER",
+        "ALTER TABLE post ADD COLUMN IF NOT EXISTS image_hash VARCHAR(64)",
+        "ALTER TABLE post ADD COLUMN IF NOT EXISTS image_width INTEGER",
+        "ALTER TABLE post ADD COLUMN IF NOT EXISTS image_storage VARCHAR(20)",
         "ALTER TABLE post ADD COLUMN IF NOT EXISTS video_data BYTEA",
         "ALTER TABLE post ADD COLUMN IF NOT EXISTS video_filename VARCHAR(255)",
         "ALTER TABLE post ADD COLUMN IF NOT EXISTS video_content_type VARCHAR(100)",
+        "ALTER TABLE post ADD COLUMN IF NOT EXISTS video_size INTEGER",
+        "ALTER TABLE post ADD COLUMN IF NOT EXISTS video_hash VARCHAR(64)",
+        "ALTER TABLE post ADD COLUMN IF NOT EXISTS video_storage VARCHAR(20)",
+        
+        # Backfill blob sizes so has_*_data() never needs to read the bytes
+        "UPDATE property SET video_size = length(video_data) WHERE video_data IS NOT NULL AND video_size IS NULL",
+        "UPDATE property_image SET image_size = length(image_data) WHERE image_data IS NOT NULL AND image_size IS NULL",
+        "UPDATE post SET image_size = length(image_data) WHERE image_data IS NOT NULL AND image_size IS NULL",
+        "UPDATE post SET video_size = length(video_data) WHERE video_data IS NOT NULL AND video_size IS NULL",
+        
+        # Denormalised image metadata for listing cards
+        "UPDATE property SET image_count = (SELECT COUNT(*) FROM property_image WHERE property_image.property_id = property.id) WHERE image_count IS NULL",
+        "UPDATE property SET primary_image_id = (SELECT property_image.id FROM property_image WHERE property_image.property_id = property.id ORDER BY property_image.is_primary DESC, property_image.order_index LIMIT 1) WHERE primary_image_id IS NULL",
+        
+        # Full-text search vector for the gallery (indexed in create_indexes)
+        POSTGRES_SEARCH_COLUMN,
     ]
     
     with app.app_context():
@@ -54,14 +93,119 @@ def add_missing_columns():
             logger.error(f"❌ Erro durante migração: {e}")
             raise
 
+def create_indexes():
+    """Cria os índices que faltarem; roda a cada deploy porque índices novos não adicionam colunas"""
+    from search import POSTGRES_SEARCH_INDEX
+    
+    indexes = [
+        # Content hash lookups for fingerprinted /m/<hash> URLs
+        "CREATE INDEX IF NOT EXISTS ix_property_video_hash ON property (video_hash)",
+        "CREATE INDEX IF NOT EXISTS ix_property_image_image_hash ON property_image (image_hash)",
+        "CREATE INDEX IF NOT EXISTS ix_post_image_hash ON post (image_hash)",
+        "CREATE INDEX IF NOT EXISTS ix_post_video_hash ON post (video_hash)",
+        
+        # Hot listing, image and admin queries (declared in models.py)
+        "CREATE INDEX IF NOT EXISTS ix_property_created_at ON property (created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_property_featured_created_at ON property (featured, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_property_image_property_primary ON property_image (property_id, is_primary)",
+        "CREATE INDEX IF NOT EXISTS ix_property_image_property_order ON property_image (property_id, order_index)",
+        "CREATE INDEX IF NOT EXISTS ix_post_created_at ON post (created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_chatbot_conversation_created_at ON chatbot_conversation (created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_media_job_status_run_after ON media_job (status, run_after)",
+        "CREATE INDEX IF NOT EXISTS ix_media_job_kind_status ON media_job (kind, status)",
+        "CREATE INDEX IF NOT EXISTS ix_admin_session_expires_at ON admin_session (expires_at)",
+        
+        # Gallery search filters and sorting
+        "CREATE INDEX IF NOT EXISTS ix_property_property_type ON property (property_type)",
+        "CREATE INDEX IF NOT EXISTS ix_property_price_cents ON property (price_cents)",
+        POSTGRES_SEARCH_INDEX,
+    ]
+    
+    with app.app_context():
+        with db.engine.connect() as conn:
+            for index in indexes:
+                conn.execute(text(index))
+            conn.commit()
+            logger.info(f"✅ {len(indexes)} índices verificados")
+
+def backfill_content_hashes():
+    """Calcula o hash sha256 dos blobs antigos, um registro por vez"""
+    
+    blob_columns = [
+        ('property', 'video'),
+        ('property_image', 'image'),
+        ('post', 'image'),
+        ('post', 'video'),
+    ]
+    
+    with app.app_context():
+        with db.engine.connect() as conn:
+            for table_name, prefix in blob_columns:
+                ids = [row[0] for row in conn.execute(text(
+                    f"SELECT id FROM {table_name} WHERE {prefix}_data IS NOT NULL AND {prefix}_hash IS NULL"
+                ))]
+                for row_id in ids:
+                    data = conn.execute(text(
+                        f"SELECT {prefix}_data FROM {table_name} WHERE id = :id"
+                    ), {'id': row_id}).scalar()
+                    conn.execute(text(
+                        f"UPDATE {table_name} SET {prefix}_hash = :hash WHERE id = :id"
+                    ), {'hash': hashlib.sha256(bytes(data)).hexdigest(), 'id': row_id})
+                    conn.commit()
+                if ids:
+                    logger.info(f"✅ {len(ids)} hashes calculados em {table_name}.{prefix}_data")
+
+def backfill_image_variants():
+    """Enfileira o processamento das imagens enviadas antes das versões responsivas.
+
+    O trabalho é feito pelo worker de mídia (jobs.py), fora do deploy; imagens que já têm
+    um job ativo são ignoradas.
+    """
+    from models import PropertyImage, Post, ImageVariant
+    from imaging import available_formats
+    from jobs import enqueue, active_targets
+    
+    with app.app_context():
+        stored = PropertyImage.image_size.isnot(None)
+        # Never processed: the regular upload jobs recompress them and build every rendition
+        property_ids = {row[0] for row in db.session.query(PropertyImage.property_id).filter(
+            stored, PropertyImage.image_width.is_(None)).distinct()}
+        post_ids = {row[0] for row in db.session.query(Post.id).filter(
+            Post.image_size.isnot(None), Post.image_width.is_(None))}
+        jobs = [('property_images', target_id) for target_id in property_ids - active_targets('property_images')]
+        jobs += [('post_image', target_id) for target_id in post_ids - active_targets('post_image')]
+        
+        if len(available_formats()) > 1:
+            # Processed before WebP/AVIF renditions existed: only the renditions are rebuilt
+            modern_missing = ~PropertyImage.variants.any(ImageVariant.image_content_type != 'image/jpeg')
+            image_ids = {row[0] for row in db.session.query(PropertyImage.id).filter(
+                stored, PropertyImage.image_width.isnot(None), modern_missing)}
+            modern_missing = ~Post.variants.any(ImageVariant.image_content_type != 'image/jpeg')
+            post_ids = {row[0] for row in db.session.query(Post.id).filter(
+                Post.image_size.isnot(None), Post.image_width.isnot(None), modern_missing)}
+            jobs += [('property_image_variants', target_id)
+                     for target_id in image_ids - active_targets('property_image_variants')]
+            jobs += [('post_image_variants', target_id)
+                     for target_id in post_ids - active_targets('post_image_variants')]
+        
+        for kind, target_id in jobs:
+            enqueue(kind, target_id)
+        db.session.commit()
+        if jobs:
+            logger.info(f"🕒 {len(jobs)} jobs de mídia enfileirados para gerar versões responsivas")
+
 def check_database_schema():
     """Verifica se todas as colunas necessárias existem"""
     
     expected_columns = {
-        'property': ['video_data', 'video_filename', 'video_content_type'],
-        'property_image': ['image_data', 'image_filename', 'image_content_type'],
-        'post': ['image_data', 'image_filename', 'image_content_type', 
-                'video_data', 'video_filename', 'video_content_type']
+        'property': ['video_data', 'video_filename', 'video_content_type', 'video_size', 'video_hash', 'video_storage',
+                     'image_count', 'primary_image_id', 'search_vector', 'price_cents'],
+        'property_image': ['image_data', 'image_filename', 'image_content_type', 'image_size', 'image_hash', 'image_width',
+                           'image_storage'],
+        'image_variant': ['image_storage'],
+        'post': ['image_data', 'image_filename', 'image_content_type', 'image_size', 'image_hash', 'image_width',
+                'image_storage', 'video_data', 'video_filename', 'video_content_type', 'video_size', 'video_hash',
+                'video_storage']
     }
     
     with app.app_context():
@@ -108,6 +252,14 @@ if __name__ == "__main__":
                 exit(1)
         else:
             logger.info("✅ Banco de dados já está atualizado!")
+        
+        create_indexes()
+        backfill_content_hashes()
+        backfill_image_variants()
+        
+        from pricing import backfill_prices
+        updated, unparsed = backfill_prices()
+        logger.info(f"✅ Preços numéricos: {updated} atualizados, {unparsed} sem valor reconhecido")
             
     except Exception as e:
         logger.error(f"❌ Erro crítico na migração: {e}")
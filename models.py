@@ -3,6 +3,7 @@ from datetime import datetime
 from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, LargeBinary
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
+from pricing import parse_price
 
 # Get db from main module to avoid circular imports
 try:
@@ -14,25 +15,44 @@ except ImportError:
     db = SQLAlchemy(model_class=Base)
 
 class Property(db.Model):
+    __table_args__ = (
+        db.Index('ix_property_featured_created_at', 'featured', 'created_at'),  # featured listings, newest first
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     image_path = db.Column(db.String(300))  # Main image for backward compatibility
     video_path = db.Column(db.String(300))
-    property_type = db.Column(db.String(100))  # apartment, house, commercial
+    property_type = db.Column(db.String(100), index=True)  # apartment, house, commercial
     price = db.Column(db.String(100))
+    price_cents = db.Column(db.BigInteger, index=True)  # parsed from price, for sorting and range filters
     location = db.Column(db.String(200))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     featured = db.Column(db.Boolean, default=False)
     
-    # Database storage columns
-    video_data = db.Column(db.LargeBinary)
+    # Database storage columns (blobs are deferred so listings only load metadata)
+    video_data = db.deferred(db.Column(db.LargeBinary))
     video_filename = db.Column(db.String(255))
     video_content_type = db.Column(db.String(100))
+    video_size = db.Column(db.Integer)
+    video_hash = db.Column(db.String(64), index=True)  # sha256 of the stored bytes, used as ETag
+    video_storage = db.Column(db.String(20))  # storage.py backend holding the bytes; NULL = video_data
+    
+    # Denormalised image metadata so listing cards never need to count PropertyImage rows
+    image_count = db.Column(db.Integer, default=0)
+    primary_image_id = db.Column(db.Integer)
+    primary_image = db.relationship('PropertyImage', primaryjoin='foreign(Property.primary_image_id) == PropertyImage.id', viewonly=True)
+    
+    @db.validates('price')
+    def validate_price(self, key, price):
+        """Keep price_cents in step with the free-text price"""
+        self.price_cents = parse_price(price)
+        return price
     
     def has_video_data(self):
         """Check if this instance has video data stored in database"""
-        return self.video_data is not None
+        return bool(self.video_size)
     
     def has_video_file(self):
         """Check if this instance has video file stored locally"""
@@ -42,6 +62,11 @@ class Property(db.Model):
         return f'<Property {self.title}>'
 
 class PropertyImage(db.Model):
+    __table_args__ = (
+        db.Index('ix_property_image_property_primary', 'property_id', 'is_primary'),  # primary image lookups
+        db.Index('ix_property_image_property_order', 'property_id', 'order_index'),  # gallery order, /serve/.../<index>
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     property_id = db.Column(db.Integer, db.ForeignKey('property.id'), nullable=False)
     image_path = db.Column(db.String(300), nullable=False)  # Keep for backward compatibility
@@ -49,14 +74,18 @@ class PropertyImage(db.Model):
     order_index = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # Database storage columns
-    image_data = db.Column(db.LargeBinary)
+    # Database storage columns (blobs are deferred so listings only load metadata)
+    image_data = db.deferred(db.Column(db.LargeBinary))
     image_filename = db.Column(db.String(255))
     image_content_type = db.Column(db.String(100))
+    image_size = db.Column(db.Integer)
+    image_hash = db.Column(db.String(64), index=True)  # sha256 of the stored bytes, used as ETag
+    image_width = db.Column(db.Integer)
+    image_storage = db.Column(db.String(20))  # storage.py backend holding the bytes; NULL = image_data
     
     def has_image_data(self):
         """Check if this instance has image data stored in database"""
-        return self.image_data is not None
+        return bool(self.image_size)
     
     def has_image_file(self):
         """Check if this instance has image file stored locally (backward compatibility)"""
@@ -67,13 +96,39 @@ class PropertyImage(db.Model):
     def __repr__(self):
         return f'<PropertyImage {self.image_path}>'
 
+class ImageVariant(db.Model):
+    """Downscaled rendition of a PropertyImage or Post image, generated at upload time"""
+    id = db.Column(db.Integer, primary_key=True)
+    property_image_id = db.Column(db.Integer, db.ForeignKey('property_image.id'), index=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), index=True)
+    width = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Same column names as the originals so media helpers can treat them alike
+    image_data = db.deferred(db.Column(db.LargeBinary))
+    image_filename = db.Column(db.String(255))
+    image_content_type = db.Column(db.String(100))
+    image_size = db.Column(db.Integer)
+    image_hash = db.Column(db.String(64), index=True)
+    image_storage = db.Column(db.String(20))
+    
+    def has_image_data(self):
+        """Check if this instance has image data stored in database"""
+        return bool(self.image_size)
+    
+    property_image = db.relationship('PropertyImage', backref=db.backref('variants', lazy=True, order_by='ImageVariant.width', cascade='all, delete-orphan'))
+    post = db.relationship('Post', backref=db.backref('variants', lazy=True, order_by='ImageVariant.width', cascade='all, delete-orphan'))
+    
+    def __repr__(self):
+        return f'<ImageVariant {self.width}w {self.image_filename}>'
+
 class ChatbotConversation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200))
     phone = db.Column(db.String(50))
     message = db.Column(db.Text)
     bot_response = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     def __repr__(self):
         return f'<ChatbotConversation {self.name}>'
@@ -84,24 +139,31 @@ class Post(db.Model):
     content = db.Column(db.Text)
     image_path = db.Column(db.String(300))
     video_path = db.Column(db.String(300))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     featured = db.Column(db.Boolean, default=False)
     
-    # Database storage columns
-    image_data = db.Column(db.LargeBinary)
+    # Database storage columns (blobs are deferred so listings only load metadata)
+    image_data = db.deferred(db.Column(db.LargeBinary))
     image_filename = db.Column(db.String(255))
     image_content_type = db.Column(db.String(100))
-    video_data = db.Column(db.LargeBinary)
+    image_size = db.Column(db.Integer)
+    image_hash = db.Column(db.String(64), index=True)  # sha256 of the stored bytes, used as ETag
+    image_width = db.Column(db.Integer)
+    image_storage = db.Column(db.String(20))  # storage.py backend holding the bytes; NULL = image_data
+    video_data = db.deferred(db.Column(db.LargeBinary))
     video_filename = db.Column(db.String(255))
     video_content_type = db.Column(db.String(100))
+    video_size = db.Column(db.Integer)
+    video_hash = db.Column(db.String(64), index=True)
+    video_storage = db.Column(db.String(20))
     
     def has_image_data(self):
         """Check if this instance has image data stored in database"""
-        return self.image_data is not None
+        return bool(self.image_size)
     
     def has_video_data(self):
         """Check if this instance has video data stored in database"""
-        return self.video_data is not None
+        return bool(self.video_size)
     
     def has_image_file(self):
         """Check if this instance has image file stored locally (backward compatibility)"""
@@ -119,4 +181,41 @@ class AdminSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     session_token = db.Column(db.String(100), unique=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    expires_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, index=True)  # AdminSessions.purge()
+
+class MediaJob(db.Model):
+    """Queued post-processing of uploaded media, run by the worker in jobs.py"""
+    __table_args__ = (
+        db.Index('ix_media_job_status_run_after', 'status', 'run_after'),  # claim_next()
+        db.Index('ix_media_job_kind_status', 'kind', 'status'),  # active_targets()
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # property_images, post_image
+    target_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, running, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    last_error = db.Column(db.Text)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'target_id': self.target_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'last_error': self.last_error,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f'<MediaJob {self.kind}:{self.target_id} {self.status}>'
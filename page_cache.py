@@ -0,0 +1,195 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, current_app, request, session, g
+
+class MemoryPageBackend:
+    """In-process page store; only correct when the site runs a single worker process"""
+
+    def __init__(self, max_entries=500):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()  # key -> (generation, etag, mimetype, body)
+        self._generation = 0
+        self._listings_generation = 0
+
+    def generation(self):
+        return self._generation
+
+    def listings_generation(self):
+        return self._listings_generation
+
+    def bump(self, listings=False):
+        with self._lock:
+            self._generation += 1
+            if listings:
+                self._listings_generation += 1
+            self._pages.clear()
+            return self._generation
+
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None or entry[0] != generation:
+                return None
+            self._pages.move_to_end(key)
+            return entry[1:]
+
+    def set(self, key, generation, etag, mimetype, body):
+        with self._lock:
+            self._pages[key] = (generation, etag, mimetype, body)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+class SQLitePageBackend:
+    """Page store in a local SQLite file, shared by every worker on the host.
+
+    The generation counters live in the same file, so a bump from the
+    worker that handled an admin write invalidates the pages of all others.
+    """
+
+    def __init__(self, path, max_entries=500):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS page (key TEXT PRIMARY KEY, generation INTEGER NOT NULL, '
+                         'etag TEXT NOT NULL, mimetype TEXT NOT NULL, body BLOB NOT NULL, accessed_at REAL NOT NULL)')
+            conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('generation', 0)")
+            conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('listings', 0)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def generation(self):
+        return self._connect().execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()[0]
+
+    def listings_generation(self):
+        return self._connect().execute("SELECT value FROM meta WHERE name = 'listings'").fetchone()[0]
+
+    def bump(self, listings=False):
+        conn = self._connect()
+        names = ('generation', 'listings') if listings else ('generation',)
+        conn.execute(f"UPDATE meta SET value = value + 1 WHERE name IN ({', '.join('?' * len(names))})", names)
+        generation = self.generation()
+        conn.execute('DELETE FROM page WHERE generation < ?', (generation,))
+        return generation
+
+    def get(self, key, generation):
+        conn = self._connect()
+        row = conn.execute('SELECT etag, mimetype, body FROM page WHERE key = ? AND generation = ?',
+                           (key, generation)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE page SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return row[0], row[1], bytes(row[2])
+
+    def set(self, key, generation, etag, mimetype, body):
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO page (key, generation, etag, mimetype, body, accessed_at) '
+                     'VALUES (?, ?, ?, ?, ?, ?)', (key, generation, etag, mimetype, body, time.time()))
+        conn.execute('DELETE FROM page WHERE key IN (SELECT key FROM page ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                     (self.max_entries,))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM page')
+
+class PageCache:
+    """Full-response cache for public pages, invalidated by a generation counter.
+
+    Every admin write bumps the generation, which orphans all cached pages
+    at once; pages are keyed by endpoint, view arguments and query string.
+    Responses carry an ETag derived from the body so browsers revalidate
+    with If-None-Match and get a 304 without re-downloading the page.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'not_modified': 0}
+
+    def bump(self, listings=False):
+        """Invalidate every cached page after content changed.
+
+        listings=True marks a change to the text of properties or posts
+        too; media-only changes (recompressed images) leave it alone.
+        """
+        return self.backend.bump(listings)
+
+    def generation(self):
+        """Current content generation, shared with other workers by the SQLite backend"""
+        return self.backend.generation()
+
+    def listings_generation(self):
+        """Generation of the properties' and posts' text, bumped only by bump(listings=True)"""
+        return self.backend.listings_generation()
+
+    def _key(self, view_args):
+        args = '&'.join(f'{name}={value}' for name, value in sorted(request.args.items(multi=True)))
+        view = ','.join(f'{name}={value}' for name, value in sorted(view_args.items()))
+        return f'{request.endpoint}:{view}:{args}'
+
+    def _bypass(self):
+        # Pending flash messages are rendered into the page, so that render is personal
+        return request.method != 'GET' or bool(session.get('_flashes'))
+
+    def cached(self, view):
+        """Decorator caching a view's 200 responses"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if self._bypass():
+                self.stats['bypassed'] += 1
+                return view(*args, **kwargs)
+
+            generation = self.backend.generation()
+            key = self._key(kwargs)
+            entry = self.backend.get(key, generation)
+            if entry is None:
+                self.stats['misses'] += 1
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough or g.get('page_cache_skip'):
+                    return response
+                body = response.get_data()
+                etag = hashlib.sha256(body).hexdigest()[:32]
+                self.backend.set(key, generation, etag, response.mimetype, body)
+            else:
+                self.stats['hits'] += 1
+                etag, mimetype, body = entry
+                response = Response(body, mimetype=mimetype)
+
+            response.set_etag(etag)
+            response.cache_control.no_cache = True
+            response.make_conditional(request)
+            if response.status_code == 304:
+                self.stats['not_modified'] += 1
+            return response
+        return wrapper
+
+    def snapshot(self):
+        """Counters and current generation, for the admin stats endpoint"""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return dict(self.stats, generation=self.backend.generation(),
+                    hit_rate=round(self.stats['hits'] / lookups, 4) if lookups else None)
+
+def create_page_cache(backend_name, path=None, max_entries=500):
+    """Build a PageCache from the PAGE_CACHE_BACKEND setting ('memory' or 'sqlite')"""
+    if backend_name == 'sqlite':
+        return PageCache(SQLitePageBackend(path, max_entries))
+    return PageCache(MemoryPageBackend(max_entries))
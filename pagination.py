@@ -0,0 +1,115 @@
+"""Cursor pagination for listings.
+
+Date-ordered lists page by keyset: the cursor holds the (created_at, id)
+of the last row shown and the next page is "rows strictly older than
+that", which the created_at index answers directly, so page 500 costs
+the same as page 1 and rows inserted meanwhile never shift or repeat
+items. Lists ordered by something else (search relevance, price) carry
+an offset in the same opaque cursor format. Totals are optional and come
+from a small TTL cache instead of a COUNT(*) on every page.
+"""
+import json
+import time
+import base64
+import threading
+from datetime import datetime
+from collections import OrderedDict
+
+try:
+    from main import db
+except ImportError:
+    from app import db
+
+class InvalidCursor(ValueError):
+    """Raised for cursors that were not produced by encode_cursor"""
+
+def encode_cursor(kind, values):
+    payload = json.dumps([kind] + [value.isoformat() if isinstance(value, datetime) else value for value in values],
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(kind, values) from a cursor string; kind is 'k' (keyset) or 'o' (offset)"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        kind, values = payload[0], payload[1:]
+        if kind == 'k' and len(values) == 2:
+            return kind, [datetime.fromisoformat(values[0]), int(values[1])]
+        if kind == 'o' and len(values) == 1 and int(values[0]) >= 0:
+            return kind, [int(values[0])]
+    except (ValueError, TypeError, IndexError, AttributeError):
+        pass
+    raise InvalidCursor(cursor)
+
+class CursorPage:
+    """One page of results plus the cursor of the page after it (None on the last page)"""
+
+    def __init__(self, items, next_cursor, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+def paginate(query, cursor=None, per_page=12, keys=None, total=None):
+    """Page of an ordered query.
+
+    With keys=(created_at_column, id_column) the query must be ordered by
+    both descending and pages by keyset; without keys it pages by offset.
+    One extra row is fetched to know whether another page exists.
+    """
+    kind, values = decode_cursor(cursor) if cursor else (None, None)
+    if keys is not None:
+        if kind not in (None, 'k'):
+            raise InvalidCursor(cursor)
+        if values:
+            created_at, row_id = values
+            created_at_column, id_column = keys
+            # The redundant "<=" lets the created_at index bound the scan on every database
+            query = query.filter(created_at_column <= created_at,
+                                 db.or_(created_at_column < created_at, id_column < row_id))
+        rows = query.limit(per_page + 1).all()
+        items = rows[:per_page]
+        next_cursor = None
+        if len(rows) > per_page:
+            last = items[-1]
+            next_cursor = encode_cursor('k', [getattr(last, keys[0].key), getattr(last, keys[1].key)])
+        return CursorPage(items, next_cursor, total)
+
+    if kind not in (None, 'o'):
+        raise InvalidCursor(cursor)
+    offset = values[0] if values else 0
+    rows = query.offset(offset).limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = encode_cursor('o', [offset + per_page]) if len(rows) > per_page else None
+    return CursorPage(items, next_cursor, total)
+
+class CountCache:
+    """Approximate result totals: a COUNT is reused until its TTL runs out or content changes"""
+
+    def __init__(self, ttl=60, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._counts = OrderedDict()  # key -> (expires_at, generation, count)
+
+    def get(self, key, generation, query):
+        """Cached count for key, running query.count() when it is missing, stale or from an older generation"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is not None and entry[0] > now and entry[1] == generation:
+                self._counts.move_to_end(key)
+                return entry[2]
+        count = query.order_by(None).count()
+        with self._lock:
+            self._counts[key] = (now + self.ttl, generation, count)
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return count
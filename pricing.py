@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Conversão dos preços em texto livre ("R$ 1.250.000", "1,2 milhão") para centavos.
+
+Property.price stays the text the admin typed; Property.price_cents is
+derived from it (see Property.validate_price) so SQL can sort and
+range-filter by price. Run `python pricing.py backfill` to fill the column
+for rows saved before it existed.
+"""
+import re
+import sys
+import argparse
+import unicodedata
+
+# Spoken multipliers: "850 mil", "1,2 milhão", "2 mi", "1.5M", "900k"
+MULTIPLIERS = [
+    (re.compile(r'^(bilhao|bilhoes|bi)\b'), 1_000_000_000),
+    (re.compile(r'^(milhao|milhoes|mi|mm|m)\b'), 1_000_000),
+    (re.compile(r'^(mil|k)\b'), 1_000),
+]
+
+NUMBER = re.compile(r'\d[\d.,]*')
+
+def _fold(text):
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+def _to_decimal(number):
+    """Decimal string from a Brazilian ("1.250.000,50") or plain ("1250000.5", "1.5") number"""
+    number = number.rstrip('.,')
+    if '.' in number and ',' in number:
+        # Whichever separator comes last is the decimal one
+        thousands, decimal = ('.', ',') if number.rfind(',') > number.rfind('.') else (',', '.')
+        return number.replace(thousands, '').replace(decimal, '.')
+    separator = '.' if '.' in number else ',' if ',' in number else None
+    if separator is None:
+        return number
+    groups = number.split(separator)
+    if len(groups) > 2 or all(len(group) == 3 for group in groups[1:]):
+        # "1.250.000" or "850.000": thousands separators
+        return number.replace(separator, '')
+    return number.replace(separator, '.')
+
+def parse_price(text):
+    """Price in centavos from free text, or None when there is no number ("Sob consulta").
+
+    Ranges use the first value, with its own multiplier or, as in
+    "R$ 1,2 a 1,5 milhão", the one after the last number.
+    """
+    if not text:
+        return None
+    folded = _fold(text)
+    numbers = list(NUMBER.finditer(folded))
+    if not numbers:
+        return None
+    multiplier = 1
+    for number in (numbers[0], numbers[-1]):
+        rest = folded[number.end():].strip()
+        found = next((value for pattern, value in MULTIPLIERS if pattern.match(rest)), None)
+        if found:
+            multiplier = found
+            break
+    try:
+        value = float(_to_decimal(numbers[0].group()))
+    except ValueError:
+        return None
+    return round(value * multiplier * 100)
+
+def format_price(cents):
+    """"R$ 1.250.000" style text for a value in centavos"""
+    if cents is None:
+        return ''
+    reais, centavos = divmod(cents, 100)
+    text = f"R$ {reais:,}".replace(',', '.')
+    return f"{text},{centavos:02d}" if centavos else text
+
+def backfill_prices(recompute=False):
+    """Fill price_cents from price; returns (updated, unparsed) counts"""
+    try:
+        from main import app, db
+    except ImportError:
+        from app import app, db
+    from models import Property
+
+    updated = unparsed = 0
+    with app.app_context():
+        query = Property.query.filter(Property.price.isnot(None))
+        if not recompute:
+            query = query.filter(Property.price_cents.is_(None))
+        for property_obj in query.all():
+            cents = parse_price(property_obj.price)
+            if cents is None:
+                unparsed += 1
+                print(f"⚠️  Preço não reconhecido no imóvel {property_obj.id}: {property_obj.price!r}")
+            elif cents != property_obj.price_cents:
+                property_obj.price_cents = cents
+                updated += 1
+        db.session.commit()
+    return updated, unparsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Preços numéricos dos imóveis')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    backfill = subparsers.add_parser('backfill', help='preenche price_cents a partir do preço em texto')
+    backfill.add_argument('--all', action='store_true', help='recalcula também os imóveis que já têm price_cents')
+    parse = subparsers.add_parser('parse', help='mostra como um texto de preço é interpretado')
+    parse.add_argument('text')
+    args = parser.parse_args(argv)
+
+    if args.command == 'parse':
+        cents = parse_price(args.text)
+        print(f"{args.text!r} -> {cents} centavos ({format_price(cents) or 'sem valor'})")
+    else:
+        updated, unparsed = backfill_prices(recompute=args.all)
+        print(f"✅ {updated} preços atualizados, {unparsed} não reconhecidos")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
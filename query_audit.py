@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Auditoria dos planos de consulta das rotas principais.
+
+Requests every hot page through the Flask test client, records each SELECT
+the ORM sends, and replays it under EXPLAIN ANALYZE (Postgres) or EXPLAIN
+QUERY PLAN (SQLite). Any sequential scan that reads more rows than
+--max-seq-rows is reported and makes the script exit with status 1, so it
+can gate a deploy or CI job. An empty database is first filled with
+seed.py's synthetic data; point DATABASE_URL at a scratch database.
+
+    DATABASE_URL=postgresql://.../maeva_audit python query_audit.py
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+if __name__ == '__main__':
+    os.environ.setdefault('MEDIA_JOB_WORKER', '0')
+    os.environ.setdefault('CHATBOT_BACKEND', 'fake')
+
+try:
+    from main import app, db
+except ImportError:
+    from app import app, db
+
+from sqlalchemy import event
+from models import Property, Post
+from pagination import encode_cursor
+
+# SQLite plan lines for a full table scan: "SCAN property", never "SCAN property USING INDEX ..."
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+def audit_urls():
+    """Pages to audit, using ids that exist in the seeded data"""
+    with app.app_context():
+        property_id = db.session.query(db.func.max(Property.id)).scalar()
+        post_id = db.session.query(db.func.max(Post.id)).scalar()
+        # A keyset cursor twenty pages into the gallery, as "Carregar mais" would produce
+        deep = Property.query.order_by(Property.created_at.desc(), Property.id.desc()).offset(239).first()
+    urls = [
+        '/',
+        '/galeria',
+        '/galeria?q=piscina+varanda',
+        '/galeria?location=moema&type=apartamento',
+        '/galeria?price=1000000-2000000&sort=menor-preco',
+        '/galeria?featured=1',
+        '/posts',
+        '/admin',
+        '/admin/conversations',
+        '/admin/conversations/mais?cursor=' + encode_cursor('k', [datetime.utcnow(), 0]),
+        '/admin/jobs',
+    ]
+    if deep:
+        urls.insert(2, '/galeria?cursor=' + encode_cursor('k', [deep.created_at, deep.id]))
+        urls.insert(3, '/galeria/mais?cursor=' + encode_cursor('k', [deep.created_at, deep.id]))
+    if post_id:
+        urls.append(f'/post/{post_id}')
+    if property_id:
+        urls += [f'/serve/property_image/{property_id}', f'/serve/property_image/{property_id}/1']
+    return urls
+
+def capture_queries(client, url):
+    """Fetch a URL and return (status, [(statement, parameters), ...]) for the SELECTs it ran"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        status = client.get(url).status_code
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return status, statements
+
+def _postgres_scans(plan):
+    """(table, rows read) for every Seq Scan node in an EXPLAIN ANALYZE JSON plan"""
+    scans = []
+    if plan.get('Node Type') == 'Seq Scan':
+        rows = (plan.get('Actual Rows', 0) + plan.get('Rows Removed by Filter', 0)) * plan.get('Actual Loops', 1)
+        scans.append((plan.get('Relation Name'), int(rows)))
+    for child in plan.get('Plans', []):
+        scans += _postgres_scans(child)
+    return scans
+
+def explain(conn, statement, parameters, table_rows):
+    """(milliseconds, [(table, rows scanned), ...], plan text) for one captured statement"""
+    if db.engine.dialect.name == 'postgresql':
+        result = conn.exec_driver_sql('EXPLAIN (ANALYZE, FORMAT JSON) ' + statement, parameters).scalar()
+        plan = (json.loads(result) if isinstance(result, str) else result)[0]
+        return plan['Execution Time'], _postgres_scans(plan['Plan']), json.dumps(plan['Plan'])[:2000]
+
+    lines = [row[3] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+    started = time.perf_counter()
+    conn.exec_driver_sql(statement, parameters).fetchall()
+    elapsed = (time.perf_counter() - started) * 1000
+    scans = []
+    for line in lines:
+        match = SQLITE_FULL_SCAN.match(line)
+        if match and match.group(1) in table_rows:
+            scans.append((match.group(1), table_rows[match.group(1)]))
+    return elapsed, scans, '\n'.join(lines)
+
+def run_audit(max_seq_rows=1000, verbose=False):
+    """Audit every URL; returns the list of violations (url, table, rows, statement)"""
+    import routes
+
+    client = app.test_client()
+    client.post('/admin-login', data={'password': routes.ADMIN_PASSWORD})
+    violations = []
+
+    with app.app_context():
+        table_rows = {table.name: db.session.query(db.func.count()).select_from(table).scalar()
+                      for table in db.metadata.sorted_tables}
+
+    for url in audit_urls():
+        routes.page_cache.backend.clear()
+        routes.media_cache.invalidate_prefix('')  # forget id -> hash aliases so media routes query again
+        status, statements = capture_queries(client, url)
+        total_ms = 0.0
+        worst = []
+        with app.app_context():
+            with db.engine.connect() as conn:
+                for statement, parameters in statements:
+                    elapsed, scans, plan = explain(conn, statement, parameters, table_rows)
+                    total_ms += elapsed
+                    for table, rows in scans:
+                        worst.append((rows, table))
+                        if rows > max_seq_rows:
+                            violations.append((url, table, rows, statement))
+                    if verbose:
+                        print(f"    {elapsed:7.2f} ms  {' '.join(statement.split())[:150]}")
+                        for line in plan.splitlines():
+                            print(f"               {line}")
+        scan_note = ', '.join(f"seq scan {table} ({rows} linhas)" for rows, table in sorted(worst, reverse=True)[:2])
+        print(f"{status} {url:55} {len(statements):3} consultas {total_ms:8.2f} ms  {scan_note}")
+    return violations
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Auditoria de planos de consulta')
+    parser.add_argument('--max-seq-rows', type=int, default=1000,
+                        help='maior varredura sequencial aceita, em linhas lidas')
+    parser.add_argument('--no-seed', action='store_true', help='não popular um banco vazio com dados sintéticos')
+    parser.add_argument('--verbose', '-v', action='store_true', help='mostra cada consulta e seu plano')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        empty = Property.query.count() == 0
+    if empty and not args.no_seed:
+        from seed import seed_database
+        print("🌱 Banco vazio: inserindo dados sintéticos...")
+        for table, count in seed_database().items():
+            print(f"   {count} registros em {table}")
+
+    violations = run_audit(args.max_seq_rows, args.verbose)
+    if violations:
+        print(f"\n❌ {len(violations)} varreduras sequenciais acima de {args.max_seq_rows} linhas:")
+        for url, table, rows, statement in violations:
+            print(f"  {url}: {table} ({rows} linhas)\n    {' '.join(statement.split())[:300]}")
+        return 1
+    print(f"\n✅ Nenhuma varredura sequencial acima de {args.max_seq_rows} linhas")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,19 +1,30 @@
 import os
-import uuid
 import json
-from datetime import datetime, timedelta
+import hashlib
 from PIL import Image
-from flask import render_template, request, redirect, url_for, session, flash, jsonify, Response
+from flask import render_template, request, redirect, url_for, session, flash, jsonify, Response, g, stream_with_context, abort
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-from openai import OpenAI
 # Import from main to avoid circular imports
 try:
     from main import app, db
 except ImportError:
     from app import app, db
 
-from models import Property, Post, AdminSession, PropertyImage, ChatbotConversation
+from models import Property, Post, PropertyImage, ImageVariant, ChatbotConversation, MediaJob
+from concurrent.futures.process import BrokenProcessPool
+from imaging import build_variants, create_pool, process_images
+from media import send_media, send_local_file, send_file_path
+from storage import get_storage, write_blob, read_blob, blob_opener, delete_unreferenced
+from media_cache import MediaCache
+from page_cache import create_page_cache
+from jobs import job_handler, enqueue, notify, active_targets
+from listing_index import ListingIndex
+from search import parse_filters, search_properties, search_ordering
+from pagination import paginate, CountCache, InvalidCursor
+from auth import AdminSessions
+from chatbot import (create_chat_backend, build_messages, build_context, complete, sse_event, StreamLimiter,
+                     ResponseCache, context_fingerprint, UNAVAILABLE_MESSAGE, ERROR_MESSAGE, BUSY_MESSAGE)
 
 # Try to import magic with fallback
 try:
@@ -33,124 +44,158 @@ ALLOWED_EXTENSIONS = ALLOWED_IMAGE_EXTENSIONS | ALLOWED_VIDEO_EXTENSIONS
 ALLOWED_IMAGE_MIMES = {
     'image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp'
 }
+ALLOWED_IMAGE_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}  # Pillow's names for the same types
 ALLOWED_VIDEO_MIMES = {
     'video/mp4', 'video/avi', 'video/quicktime', 'video/webm'
 }
 
+# Extensions used in fingerprinted media URLs
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif', 'image/webp': 'webp', 'image/avif': 'avif',
+    'video/mp4': 'mp4', 'video/avi': 'avi', 'video/quicktime': 'mov', 'video/webm': 'webm'
+}
+
+# Fingerprinted URLs never change content, so they can be cached forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
 # Optimized file size limits (reduced for better performance)
 MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB for images
 MAX_VIDEO_SIZE = 30 * 1024 * 1024  # 30MB for videos
 
+# Uploads are hashed and measured in chunks of this size; the first one is used for MIME sniffing
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
 ADMIN_PASSWORD = "4731v8"
 
-# Initialize OpenAI
+# Signed admin tokens; a confirmed session is trusted for ADMIN_SESSION_CACHE_TTL seconds
+admin_sessions = AdminSessions(
+    app.secret_key,
+    cache_ttl=app.config['ADMIN_SESSION_CACHE_TTL'],
+    purge_interval=app.config['ADMIN_SESSION_PURGE_INTERVAL']
+)
+admin_required = admin_sessions.required
+
+# Rendered public pages, invalidated whenever an admin changes a property or post
+page_cache = create_page_cache(
+    app.config['PAGE_CACHE_BACKEND'],
+    path=app.config['PAGE_CACHE_PATH'],
+    max_entries=app.config['PAGE_CACHE_MAX_ENTRIES']
+)
+
+# Bounded cache in front of database blob reads, keyed by content hash; its route aliases
+# expire with the page-cache generation, which every worker sees
+media_cache = MediaCache(
+    os.path.join(app.config['UPLOAD_FOLDER'], 'media_cache'),
+    max_memory_bytes=app.config['MEDIA_CACHE_MEMORY_MB'] * 1024 * 1024,
+    max_disk_bytes=app.config['MEDIA_CACHE_DISK_MB'] * 1024 * 1024,
+    max_item_bytes=app.config['MEDIA_CACHE_MAX_ITEM_MB'] * 1024 * 1024,
+    generation=page_cache.generation
+)
+
+# Listing page sizes; later pages are fetched by cursor (?cursor=)
+GALLERY_PAGE_SIZE = 12
+POSTS_PAGE_SIZE = 12
+CONVERSATIONS_PAGE_SIZE = 30
+
+# Result totals shown above filtered listings, recounted after a TTL or a content change
+result_counts = CountCache(ttl=60)
+
+# Initialize OpenAI (or the local fake backend with CHATBOT_BACKEND=fake)
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+chat_backend = create_chat_backend(app.config['CHATBOT_BACKEND'], OPENAI_API_KEY)
+chat_streams = StreamLimiter(app.config['CHATBOT_MAX_STREAMS'])
+
+# Properties and posts searchable by the chatbot, kept in step with admin writes
+listing_index = ListingIndex(max_age=app.config['CHATBOT_INDEX_MAX_AGE'])
+
+# Answers to repeated questions, reused while the prompt context stays the same
+chat_cache = ResponseCache(
+    ttl=app.config['CHATBOT_CACHE_TTL'],
+    max_entries=app.config['CHATBOT_CACHE_SIZE'],
+    similarity=app.config['CHATBOT_CACHE_SIMILARITY']
+)
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def is_safe_file(file):
-    """Enhanced file validation with optional MIME type checking"""
+def scan_upload(stream, max_size):
+    """Read an upload once in chunks, returning (size, sha256, first chunk) and rewinding it.
+
+    Stops as soon as max_size is exceeded, so oversized files are rejected
+    without being read to the end.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    stream.seek(0)
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if not head:
+            head = chunk
+        size += len(chunk)
+        if size > max_size:
+            break
+        digest.update(chunk)
+    stream.seek(0)
+    return size, digest.hexdigest(), head
+
+def inspect_upload(file):
+    """Validate an upload in a single chunked pass; returns (info, message) with info None when invalid"""
     try:
         # Check file extension first
         if not file or not file.filename:
-            return False, "Nenhum arquivo selecionado"
+            return None, "Nenhum arquivo selecionado"
         
         if not allowed_file(file.filename):
-            return False, "Tipo de arquivo não permitido"
-        
-        # Get file size efficiently
-        file.seek(0, 2)
-        file_size = file.tell()
-        file.seek(0)
+            return None, "Tipo de arquivo não permitido"
         
         file_ext = file.filename.rsplit('.', 1)[1].lower()
+        is_image = file_ext in ALLOWED_IMAGE_EXTENSIONS
+        max_size = MAX_IMAGE_SIZE if is_image else MAX_VIDEO_SIZE
+        file_size, file_hash, head = scan_upload(file.stream, max_size)
         
         # Validate MIME type if magic is available
         if MAGIC_AVAILABLE:
             try:
-                # Read first chunk to detect MIME type
-                chunk = file.read(1024)
-                file.seek(0)
-                
-                mime_type = magic.from_buffer(chunk, mime=True) if magic else None
+                mime_type = magic.from_buffer(head[:2048], mime=True) if magic else None
                 
                 # Validate MIME type matches extension
-                if file_ext in ALLOWED_IMAGE_EXTENSIONS:
+                if is_image:
                     if mime_type not in ALLOWED_IMAGE_MIMES:
-                        return False, f"Arquivo de imagem inválido (detectado: {mime_type})"
-                elif file_ext in ALLOWED_VIDEO_EXTENSIONS:
-                    if mime_type not in ALLOWED_VIDEO_MIMES:
-                        return False, f"Arquivo de vídeo inválido (detectado: {mime_type})"
+                        return None, f"Arquivo de imagem inválido (detectado: {mime_type})"
+                elif mime_type not in ALLOWED_VIDEO_MIMES:
+                    return None, f"Arquivo de vídeo inválido (detectado: {mime_type})"
             except Exception as e:
                 print(f"Warning: MIME type validation failed: {e}")
         
         # Check file sizes
-        if file_ext in ALLOWED_IMAGE_EXTENSIONS:
-            if file_size > MAX_IMAGE_SIZE:
-                return False, f"Imagem muito grande. Máximo {MAX_IMAGE_SIZE // (1024*1024)}MB permitido"
-        elif file_ext in ALLOWED_VIDEO_EXTENSIONS:
-            if file_size > MAX_VIDEO_SIZE:
-                return False, f"Vídeo muito grande. Máximo {MAX_VIDEO_SIZE // (1024*1024)}MB permitido"
-        
-        return True, "Arquivo válido"
-    except Exception as e:
-        print(f"Error validating file: {e}")
-        return False, "Erro ao validar arquivo"
-
-def compress_image(file_path, quality=85):
-    """Compress image to reduce file size while maintaining quality"""
-    try:
-        with Image.open(file_path) as img:
-            # Convert RGBA to RGB if necessary (for JPEG)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = background
-            
-            # Resize if image is too large (maintain aspect ratio)
-            max_size = (1920, 1080)
-            if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
-                img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # Save with compression
-            img.save(file_path, 'JPEG', quality=quality, optimize=True)
-            return True
-    except Exception as e:
-        print(f"Error compressing image {file_path}: {e}")
-        return False
-
-def save_uploaded_file_to_disk(file, upload_folder):
-    """Save uploaded file to disk (backward compatibility)"""
-    try:
-        # Validate file
-        is_valid, message = is_safe_file(file)
-        if not is_valid:
-            return None, message
-        
-        # Generate unique filename
-        filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4()}_{filename}"
-        file_path = os.path.join(upload_folder, unique_filename)
+        if file_size > max_size:
+            if is_image:
+                return None, f"Imagem muito grande. Máximo {MAX_IMAGE_SIZE // (1024*1024)}MB permitido"
+            return None, f"Vídeo muito grande. Máximo {MAX_VIDEO_SIZE // (1024*1024)}MB permitido"
         
-        # Save file
-        file.save(file_path)
-        
-        # Compress image if it's an image file
-        file_ext = filename.rsplit('.', 1)[1].lower()
-        if file_ext in ALLOWED_IMAGE_EXTENSIONS:
-            if not compress_image(file_path):
-                # If compression fails, keep original but log warning
-                print(f"Warning: Could not compress image {filename}")
+        # Pillow must recognise the image: without python-magic nothing else looks at the content,
+        # and deferred uploads are stored before any job decodes them
+        if is_image:
+            try:
+                with Image.open(file.stream) as img:
+                    image_format = img.format
+                    img.verify()
+            except Exception as e:
+                print(f"Rejected image upload {file.filename}: {e}")
+                return None, "Arquivo de imagem inválido"
+            finally:
+                file.stream.seek(0)
+            if image_format not in ALLOWED_IMAGE_FORMATS:
+                return None, f"Arquivo de imagem inválido (detectado: {image_format})"
         
-        return file_path, "Upload realizado com sucesso"
+        return {'ext': file_ext, 'is_image': is_image, 'size': file_size, 'hash': file_hash}, "Arquivo válido"
     except Exception as e:
-        print(f"Error saving file: {e}")
-        return None, "Erro ao fazer upload do arquivo"
+        print(f"Error validating file: {e}")
+        return None, "Erro ao validar arquivo"
 
 def get_file_content_type(filename):
     """Get content type based on file extension"""
@@ -165,57 +210,47 @@ def get_file_content_type(filename):
     
     return content_types.get(file_ext, 'application/octet-stream')
 
-def save_file_to_database(file_data, filename, content_type):
-    """Save file data to database, returns database ID or None if failed"""
+def save_file_to_database(file_data, filename, content_type, content_hash=None, size=None):
+    """Save file data to database, returns database ID or None if failed.
+
+    file_data may also be a rewound stream, given with its size and hash.
+    """
     try:
         # This will be used to store file reference
         return {
             'data': file_data,
             'filename': filename,
-            'content_type': content_type
+            'content_type': content_type,
+            'size': len(file_data) if size is None else size,
+            'hash': content_hash or hashlib.sha256(file_data).hexdigest()
         }
     except Exception as e:
         print(f"Error preparing file for database: {e}")
         return None
 
 def process_uploaded_file(file):
-    """Process uploaded file and prepare for database storage"""
+    """Validate an uploaded file and prepare it for storage, as uploaded.
+
+    Images are recompressed and get their renditions later, in the media
+    job the caller enqueues.
+    """
     try:
-        # Validate file
-        is_valid, message = is_safe_file(file)
-        if not is_valid:
+        # Validate file (size, hash and MIME sniffing in one chunked pass)
+        upload, message = inspect_upload(file)
+        if upload is None:
             return None, message
         
-        # Get file data
-        file.seek(0)  # Make sure we're at the beginning
-        file_data = file.read()
-        
         # Get filename and content type
         filename = secure_filename(file.filename)
         content_type = get_file_content_type(file.filename)
         
-        # Compress image data if it's an image
-        file_ext = filename.rsplit('.', 1)[1].lower()
-        if file_ext in ALLOWED_IMAGE_EXTENSIONS:
-            try:
-                # Create temporary file for compression
-                import tempfile
-                with tempfile.NamedTemporaryFile(suffix=f'.{file_ext}') as temp_file:
-                    temp_file.write(file_data)
-                    temp_file.flush()
-                    
-                    # Compress the image
-                    if compress_image(temp_file.name):
-                        # Read the compressed data
-                        with open(temp_file.name, 'rb') as compressed_file:
-                            file_data = compressed_file.read()
-                        print(f"Image compressed successfully: {filename}")
-                    else:
-                        print(f"Warning: Could not compress image {filename}, using original")
-            except Exception as e:
-                print(f"Warning: Error compressing image {filename}: {e}")
+        # Stored as uploaded, so the size and hash from the validation pass describe the content
+        if upload['is_image']:
+            file_info = save_file_to_database(file.stream.read(), filename, content_type, upload['hash'])
+        else:
+            # Videos stay in Werkzeug's spooled temp file; write_blob copies them in chunks
+            file_info = save_file_to_database(file.stream, filename, content_type, upload['hash'], upload['size'])
         
-        file_info = save_file_to_database(file_data, filename, content_type)
         if file_info:
             return file_info, "Upload processado com sucesso"
         else:
@@ -225,16 +260,198 @@ def process_uploaded_file(file):
         print(f"Error processing file: {e}")
         return None, "Erro ao processar arquivo"
 
+def apply_image_info(obj, file_info):
+    """Copy an uploaded or processed image onto a PropertyImage or Post"""
+    obj.image_filename = file_info['filename']
+    obj.image_content_type = file_info['content_type']
+    obj.image_size = file_info['size']
+    obj.image_hash = file_info['hash']
+    obj.image_width = file_info.get('width')
+    write_blob(obj, 'image', file_info['data'])
+    obj.variants = build_image_variants(file_info)
+
+def release_image_blobs(obj):
+    """Flush an image row and drop its bytes (and its renditions') from the session"""
+    db.session.flush()
+    db.session.expire(obj, ['image_data'])
+    for variant in obj.variants:
+        db.session.expire(variant, ['image_data'])
+
+def apply_video_info(obj, file_info):
+    """Copy an uploaded video onto a Property or Post"""
+    obj.video_filename = file_info['filename']
+    obj.video_content_type = file_info['content_type']
+    obj.video_size = file_info['size']
+    obj.video_hash = file_info['hash']
+    write_blob(obj, 'video', file_info['data'])
+
+def build_image_variants(file_info):
+    """Create ImageVariant records for the renditions generated at upload time"""
+    variants = []
+    for variant_info in file_info.get('variants', []):
+        variant = ImageVariant()
+        variant.width = variant_info['width']
+        variant.image_filename = f"{variant_info['width']}w_{file_info['filename']}"
+        variant.image_content_type = variant_info['content_type']
+        variant.image_size = variant_info['size']
+        variant.image_hash = variant_info['hash']
+        write_blob(variant, 'image', variant_info['data'])
+        variants.append(variant)
+    return variants
+
+def publish_content_change():
+    """Invalidate cached pages after an admin write already applied to this process's listing index"""
+    page_cache.bump(listings=True)
+    listing_index.advance(page_cache.listings_generation())
+
+def property_listing_query():
+    """Property query that batch-loads each card's primary image and its renditions (blobs stay deferred)"""
+    return Property.query.options(db.selectinload(Property.primary_image).selectinload(PropertyImage.variants))
+
+def post_listing_query():
+    """Post query that batch-loads image renditions for the cards"""
+    return Post.query.options(db.selectinload(Post.variants))
+
+# Worker processes for image recompression. They are forked, so the pool is started before the
+# process runs any thread (main.py, gunicorn's post_worker_init, jobs.py drain); without one,
+# images are processed inline
+_image_pool = None
+
+def start_image_pool():
+    """Fork the process pool sized by IMAGE_PROCESS_WORKERS, unless that is 1"""
+    global _image_pool
+    if _image_pool is None and app.config['IMAGE_PROCESS_WORKERS'] > 1:
+        _image_pool = create_pool(app.config['IMAGE_PROCESS_WORKERS'])
+    return _image_pool
+
+def image_pool():
+    """The started process pool, or None to process inline"""
+    return _image_pool
+
+def reset_image_pool():
+    """Drop a pool whose worker died; later batches run inline, since forking a new one now would copy running threads' locks"""
+    global _image_pool
+    if _image_pool is not None:
+        _image_pool.shutdown(wait=False, cancel_futures=True)
+        _image_pool = None
+        print("Warning: Image process pool broke; processing images inline from now on")
+
+def process_stored_images(images, *alias_prefixes):
+    """Reprocess stored images in parallel, committing each as it finishes.
+
+    This process's media cache drops each old hash and the route aliases
+    under alias_prefixes right after that image's commit, so they never
+    point at a rewritten row. Returns (old content hashes, error
+    messages); a failing image is reported and left untouched without
+    affecting the others.
+    """
+    images = {image.id: image for image in images}
+    
+    def load_images():
+        for image_id, image in images.items():
+            yield image_id, read_blob(image, 'image')
+            db.session.expire(image, ['image_data'])
+    
+    old_hashes = []
+    errors = []
+    workers = app.config['IMAGE_PROCESS_WORKERS']
+    for image_id, result, error in process_images(load_images(), image_pool(), max_in_flight=max(workers, 1) * 2):
+        image = images[image_id]
+        if error is not None:
+            if isinstance(error, BrokenProcessPool):
+                reset_image_pool()
+            print(f"Error processing image {image.image_filename}: {error}")
+            errors.append(f"{image.image_filename}: {error}")
+            continue
+        
+        old_hashes.append(image.image_hash)
+        apply_image_info(image, dict(result, filename=image.image_filename))
+        db.session.commit()
+        invalidate_media([old_hashes[-1]], *alias_prefixes)
+        release_image_blobs(image)
+    return old_hashes, errors
+
+@job_handler('property_images')
+def process_property_images(property_id):
+    """Background job: recompress a property's unprocessed images and build their renditions"""
+    pending = PropertyImage.query.filter(
+        PropertyImage.property_id == property_id,
+        PropertyImage.image_size.isnot(None),
+        PropertyImage.image_width.is_(None)
+    ).order_by(PropertyImage.order_index).all()
+    
+    # Committed images are skipped on retry, so only the failed ones are redone
+    old_hashes, errors = process_stored_images(pending, f'property_main:{property_id}:', f'property_image:{property_id}:')
+    
+    # Other workers' aliases and the cached pages (with the old URLs) follow the generation
+    if old_hashes:
+        page_cache.bump()
+    if errors:
+        raise RuntimeError(f"{len(errors)} de {len(pending)} imagens falharam: " + '; '.join(errors))
+
+@job_handler('post_image')
+def process_post_image(post_id):
+    """Background job: recompress a post's image and build its renditions"""
+    post_obj = db.session.get(Post, post_id)
+    if not post_obj or not post_obj.image_size or post_obj.image_width:
+        return
+    
+    old_hashes, errors = process_stored_images([post_obj], f'post_image:{post_id}:')
+    if old_hashes:
+        page_cache.bump()
+    if errors:
+        raise RuntimeError(errors[0])
+
+def rebuild_image_variants(obj):
+    """Replace a processed image's renditions with ones in every available format; returns the old hashes"""
+    old_hashes = [variant.image_hash for variant in obj.variants]
+    data = read_blob(obj, 'image')
+    pool = image_pool()
+    try:
+        variants = pool.submit(build_variants, data).result() if pool else build_variants(data)
+    except BrokenProcessPool:
+        reset_image_pool()
+        raise
+    obj.variants = build_image_variants({'filename': obj.image_filename, 'variants': variants})
+    db.session.commit()
+    release_image_blobs(obj)
+    return old_hashes
+
+def has_modern_variants(obj):
+    return any(variant.image_content_type != 'image/jpeg' for variant in obj.variants)
+
+@job_handler('property_image_variants')
+def process_property_image_variants(image_id):
+    """Background job: add the WebP/AVIF renditions to an image processed before they existed"""
+    image = db.session.get(PropertyImage, image_id)
+    if not image or not image.image_width or has_modern_variants(image):
+        return
+    old_hashes = rebuild_image_variants(image)
+    invalidate_media(old_hashes, f'property_main:{image.property_id}:', f'property_image:{image.property_id}:')
+    page_cache.bump()
+
+@job_handler('post_image_variants')
+def process_post_image_variants(post_id):
+    """Background job: add the WebP/AVIF renditions to a post image processed before they existed"""
+    post_obj = db.session.get(Post, post_id)
+    if not post_obj or not post_obj.image_width or has_modern_variants(post_obj):
+        return
+    old_hashes = rebuild_image_variants(post_obj)
+    invalidate_media(old_hashes, f'post_image:{post_id}:')
+    page_cache.bump()
+
 @app.route('/')
+@page_cache.cached
 def index():
     try:
         # Get 3 most recent properties and posts for homepage
-        recent_properties = Property.query.order_by(Property.created_at.desc()).limit(3).all()
-        recent_posts = Post.query.order_by(Post.created_at.desc()).limit(3).all()
+        recent_properties = property_listing_query().order_by(Property.created_at.desc()).limit(3).all()
+        recent_posts = post_listing_query().order_by(Post.created_at.desc()).limit(3).all()
         return render_template('index.html', properties=recent_properties, posts=recent_posts)
     except Exception as e:
         # Log the error but return a basic response for Railway health checks
         print(f"Database error in index route: {e}")
+        g.page_cache_skip = True
         try:
             return render_template('index.html', properties=[], posts=[])
         except Exception as template_error:
@@ -243,40 +460,87 @@ def index():
 
 
 @app.route('/sobre')
+@page_cache.cached
 def about():
     return render_template('about.html')
 
 @app.route('/servicos')
+@page_cache.cached
 def services():
     return render_template('services.html')
 
+def page_links(page, endpoint, fragment_endpoint, **values):
+    """URLs of the next full page and of its JSON fragment, keeping the current query string"""
+    if not page.has_next:
+        return None, None
+    args = request.args.to_dict(flat=False)
+    args.update(values, cursor=page.next_cursor)
+    return url_for(endpoint, **args), url_for(fragment_endpoint, **args)
+
+def cursor_page(query, per_page, keys=None, total=None):
+    """Page of query after the request's ?cursor=, or a 400 for a cursor we didn't issue"""
+    try:
+        return paginate(query, request.args.get('cursor'), per_page, keys, total)
+    except InvalidCursor:
+        abort(400)
+
+def gallery_page():
+    filters = parse_filters(request.args)
+    query = search_properties(property_listing_query(), filters)
+    # Date order pages by keyset; relevance and price order page by offset
+    keys = (Property.created_at, Property.id) if search_ordering(filters) == 'recentes' else None
+    total = None
+    if filters:
+        total = result_counts.get(('property', repr(sorted(filters.items()))), page_cache.generation(), query)
+    return filters, cursor_page(query, GALLERY_PAGE_SIZE, keys, total)
+
 @app.route('/galeria')
+@page_cache.cached
 def gallery():
-    # Add pagination for better performance
-    page = request.args.get('page', 1, type=int)
-    per_page = 12  # Show 12 properties per page
-    properties = Property.query.order_by(Property.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False)
-    return render_template('gallery.html', properties=properties)
+    filters, properties = gallery_page()
+    next_url, fragment_url = page_links(properties, 'gallery', 'gallery_more')
+    return render_template('gallery.html', properties=properties, filters=filters,
+                           next_url=next_url, fragment_url=fragment_url)
+
+@app.route('/galeria/mais')
+@page_cache.cached
+def gallery_more():
+    """Next gallery cards as an HTML fragment, for "Carregar mais" / infinite scroll"""
+    filters, properties = gallery_page()
+    next_url, fragment_url = page_links(properties, 'gallery', 'gallery_more')
+    return jsonify(html=render_template('_property_cards.html', properties=properties),
+                   next_url=next_url, fragment_url=fragment_url)
 
 @app.route('/contato')
 def contact():
     return render_template('contact.html')
 
+def posts_page():
+    query = post_listing_query().order_by(Post.created_at.desc(), Post.id.desc())
+    return cursor_page(query, POSTS_PAGE_SIZE, keys=(Post.created_at, Post.id))
+
 @app.route('/posts')
+@page_cache.cached
 def posts():
-    # Add pagination for better performance
-    page = request.args.get('page', 1, type=int)
-    per_page = 12  # Show 12 posts per page
-    all_posts = Post.query.order_by(Post.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False)
-    return render_template('posts.html', posts=all_posts)
+    all_posts = posts_page()
+    next_url, fragment_url = page_links(all_posts, 'posts', 'posts_more')
+    return render_template('posts.html', posts=all_posts, next_url=next_url, fragment_url=fragment_url)
+
+@app.route('/posts/mais')
+@page_cache.cached
+def posts_more():
+    """Next post cards as an HTML fragment"""
+    all_posts = posts_page()
+    next_url, fragment_url = page_links(all_posts, 'posts', 'posts_more')
+    return jsonify(html=render_template('_post_cards.html', posts=all_posts),
+                   next_url=next_url, fragment_url=fragment_url)
 
 @app.route('/post/<int:post_id>')
+@page_cache.cached
 def view_post(post_id):
     post = Post.query.get_or_404(post_id)
     # Get other posts for related posts section
-    related_posts = Post.query.filter(Post.id != post_id).order_by(Post.created_at.desc()).limit(3).all()
+    related_posts = post_listing_query().filter(Post.id != post_id).order_by(Post.created_at.desc()).limit(3).all()
     return render_template('post.html', post=post, related_posts=related_posts)
 
 @app.route('/admin-login', methods=['GET', 'POST'])
@@ -284,17 +548,7 @@ def admin_login():
     if request.method == 'POST':
         password = request.form.get('password')
         if password == ADMIN_PASSWORD:
-            # Create session
-            session_token = str(uuid.uuid4())
-            expires_at = datetime.utcnow() + timedelta(hours=2)
-            
-            admin_session = AdminSession()
-            admin_session.session_token = session_token
-            admin_session.expires_at = expires_at
-            db.session.add(admin_session)
-            db.session.commit()
-            
-            session['admin_token'] = session_token
+            session['admin_token'] = admin_sessions.issue()
             flash('Login realizado com sucesso!', 'success')
             return redirect(url_for('admin_panel'))
         else:
@@ -303,36 +557,18 @@ def admin_login():
     return render_template('admin_login.html')
 
 @app.route('/admin')
+@admin_required
 def admin_panel():
-    # Check if admin is logged in
-    admin_token = session.get('admin_token')
-    if not admin_token:
-        return redirect(url_for('admin_login'))
-    
-    # Verify token
-    admin_session = AdminSession.query.filter_by(session_token=admin_token).first()
-    if not admin_session or admin_session.expires_at < datetime.utcnow():
-        session.pop('admin_token', None)
-        flash('Sessão expirada. Faça login novamente.', 'error')
-        return redirect(url_for('admin_login'))
-    
     # Optimized queries - limit results for better performance
-    properties = Property.query.order_by(Property.created_at.desc()).limit(20).all()
-    posts = Post.query.order_by(Post.created_at.desc()).limit(20).all()
-    return render_template('admin_panel.html', properties=properties, posts=posts)
+    properties = property_listing_query().order_by(Property.created_at.desc()).limit(20).all()
+    posts = post_listing_query().order_by(Post.created_at.desc()).limit(20).all()
+    return render_template('admin_panel.html', properties=properties, posts=posts,
+                           processing_properties=active_targets('property_images'),
+                           processing_posts=active_targets('post_image'))
 
 @app.route('/admin/add-property', methods=['POST'])
+@admin_required
 def add_property():
-    # Check admin authentication
-    admin_token = session.get('admin_token')
-    if not admin_token:
-        return redirect(url_for('admin_login'))
-    
-    admin_session = AdminSession.query.filter_by(session_token=admin_token).first()
-    if not admin_session or admin_session.expires_at < datetime.utcnow():
-        session.pop('admin_token', None)
-        return redirect(url_for('admin_login'))
-    
     try:
         title = request.form.get('title')
         description = request.form.get('description')
@@ -370,23 +606,26 @@ def add_property():
         
         # Set video data if uploaded
         if video_file_info:
-            property_obj.video_data = video_file_info['data']
-            property_obj.video_filename = video_file_info['filename']
-            property_obj.video_content_type = video_file_info['content_type']
+            apply_video_info(property_obj, video_file_info)
         
         db.session.add(property_obj)
         db.session.commit()
         
         # Handle multiple image uploads with new optimized system
         uploaded_images = []
+        property_images = []
         if 'images' in request.files:
             files = request.files.getlist('images')
-            for i, file in enumerate(files[:10]):  # Limit to 10 images
+            for file in files[:10]:  # Limit to 10 images
                 if file and file.filename:
                     image_file_info, message = process_uploaded_file(file)
                     if image_file_info is None:
+                        # Skip the bad image but keep the rest of the batch
                         flash(f'Erro na imagem {file.filename}: {message}', 'error')
-                        return redirect(url_for('admin_panel'))
+                        continue
+                    
+                    # Indexes stay contiguous over the accepted images; the first one is primary
+                    i = len(property_images)
                     
                     # Create PropertyImage record with database storage
                     property_image = PropertyImage()
@@ -394,19 +633,30 @@ def add_property():
                     property_image.image_path = f'db_image_{property_obj.id}_{i}'  # Reference for backward compatibility
                     property_image.is_primary = (i == 0)  # First image is primary
                     property_image.order_index = i
-                    property_image.image_data = image_file_info['data']
-                    property_image.image_filename = image_file_info['filename']
-                    property_image.image_content_type = image_file_info['content_type']
+                    apply_image_info(property_image, image_file_info)
                     db.session.add(property_image)
+                    release_image_blobs(property_image)
+                    property_images.append(property_image)
                     uploaded_images.append(f'property_image_{property_obj.id}_{i}')
                     print(f"Property image {i+1} processed successfully: {message}")
         
         # Set reference to first image for backward compatibility
         if uploaded_images:
+            db.session.flush()
             property_obj.image_path = uploaded_images[0]
+            property_obj.image_count = len(property_images)
+            property_obj.primary_image_id = property_images[0].id
+            # Recompression and renditions run in the background
+            enqueue('property_images', property_obj.id)
             db.session.commit()
+            notify()
     
-        flash('Propriedade adicionada com sucesso!', 'success')
+        listing_index.index_property(property_obj)
+        publish_content_change()
+        if uploaded_images:
+            flash('Propriedade adicionada com sucesso! As imagens estão sendo processadas.', 'success')
+        else:
+            flash('Propriedade adicionada com sucesso!', 'success')
         print(f"Property created successfully: {property_obj.id}")
         
     except Exception as e:
@@ -417,23 +667,18 @@ def add_property():
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/delete-property/<int:property_id>')
+@admin_required
 def delete_property(property_id):
-    # Check admin authentication
-    admin_token = session.get('admin_token')
-    if not admin_token:
-        return redirect(url_for('admin_login'))
-    
-    admin_session = AdminSession.query.filter_by(session_token=admin_token).first()
-    if not admin_session or admin_session.expires_at < datetime.utcnow():
-        session.pop('admin_token', None)
-        return redirect(url_for('admin_login'))
-    
     try:
         property_obj = Property.query.get_or_404(property_id)
         
         # Delete all associated PropertyImage records (data is in database now)
         property_images = PropertyImage.query.filter_by(property_id=property_id).all()
+        media_hashes = [property_obj.video_hash]
         for img in property_images:
+            media_hashes.append(img.image_hash)
+            media_hashes.extend(variant.image_hash for variant in img.variants)
+            
             # Try to delete physical file if it still exists (backward compatibility)
             if img.image_path and os.path.exists(img.image_path) and not img.image_path.startswith('db_image'):
                 try:
@@ -465,6 +710,10 @@ def delete_property(property_id):
         # Delete the property itself (this also removes binary video data from database)
         db.session.delete(property_obj)
         db.session.commit()
+        invalidate_media(media_hashes, f'property_main:{property_id}:', f'property_image:{property_id}:')
+        delete_unreferenced(media_hashes)
+        listing_index.remove_property(property_id)
+        publish_content_change()
         
         print(f"Property {property_id} deleted successfully from database")
         flash('Propriedade removida com sucesso!', 'success')
@@ -476,62 +725,246 @@ def delete_property(property_id):
     
     return redirect(url_for('admin_panel'))
 
+def primary_image(property_obj):
+    """Return the primary PropertyImage of a property, falling back to the first one"""
+    if property_obj.primary_image_id:
+        return property_obj.primary_image
+    if property_obj.image_count == 0:
+        return None
+    
+    # Rows created before image_count/primary_image_id were backfilled
+    images = property_obj.images
+    for image in images:
+        if image.is_primary:
+            return image
+    return images[0] if images else None
+
+def rendition_width(image):
+    """Pixel width of an original image or of one of its renditions"""
+    return image.width if isinstance(image, ImageVariant) else image.image_width
+
+def image_for_width(image, width=None, content_types=('image/jpeg',)):
+    """Pick the smallest rendition at least `width` pixels wide (full size by default).
+
+    ``content_types`` lists acceptable formats in order of preference; the
+    original is returned when no rendition matches.
+    """
+    target = width or image.image_width
+    if not target:
+        return image
+    
+    candidates = [variant for variant in image.variants if variant.has_image_data()] + [image]
+    for content_type in content_types:
+        matches = [candidate for candidate in candidates
+                   if candidate.image_content_type == content_type and (rendition_width(candidate) or 0) >= target]
+        if matches:
+            return min(matches, key=rendition_width)
+    return image
+
+def negotiated_image_types():
+    """Image formats the client explicitly accepts, best compression first, JPEG last"""
+    accepted = {value for value, quality in request.accept_mimetypes if quality > 0}
+    return [content_type for content_type in ('image/avif', 'image/webp') if content_type in accepted] + ['image/jpeg']
+
+def find_media_by_hash(content_hash):
+    """Locate a stored blob by content hash, returning (object, 'image'|'video')"""
+    for model, kind in ((PropertyImage, 'image'), (ImageVariant, 'image'), (Post, 'image'), (Property, 'video'), (Post, 'video')):
+        obj = model.query.filter(getattr(model, f'{kind}_hash') == content_hash).first()
+        if obj:
+            return obj, kind
+    return None, None
+
+@app.template_global()
+def media_url(obj, kind='image', width=None):
+    """Fingerprinted URL for a stored image or video, falling back to the /serve routes.
+
+    Passing ``width`` selects the smallest image rendition at least that wide.
+    """
+    if isinstance(obj, Property) and kind == 'image':
+        image = primary_image(obj)
+        if not image or not image.image_hash:
+            return url_for('serve_property_main_image', property_id=obj.id, w=width)
+        obj = image
+    
+    if kind == 'image' and width and not isinstance(obj, ImageVariant):
+        obj = image_for_width(obj, width)
+    
+    content_hash = getattr(obj, f'{kind}_hash', None)
+    if content_hash:
+        # Backends with public URLs (S3 behind a CDN) serve the bytes themselves
+        direct_url = get_storage(getattr(obj, f'{kind}_storage', None)).url(content_hash)
+        if direct_url:
+            return direct_url
+        content_type = getattr(obj, f'{kind}_content_type', None)
+        ext = CONTENT_TYPE_EXTENSIONS.get(content_type, 'bin')
+        return url_for('serve_media', content_hash=content_hash, ext=ext)
+    
+    # Legacy rows without a content hash
+    if isinstance(obj, PropertyImage):
+        return url_for('serve_property_image', property_id=obj.property_id, image_index=obj.order_index)
+    if isinstance(obj, Property):
+        return url_for('serve_property_video', property_id=obj.id)
+    return url_for(f'serve_post_{kind}', post_id=obj.id)
+
+@app.template_global()
+def media_srcset(obj, content_type='image/jpeg'):
+    """srcset attribute value listing every stored rendition of an image in one format"""
+    if isinstance(obj, Property):
+        obj = primary_image(obj)
+    if not obj or not obj.image_hash:
+        return ''
+    
+    entries = [f'{media_url(variant)} {variant.width}w' for variant in obj.variants
+               if variant.image_content_type == content_type and variant.has_image_data()]
+    if obj.image_width and obj.image_content_type == content_type:
+        entries.append(f'{media_url(obj)} {obj.image_width}w')
+    return ', '.join(entries)
+
+# Models whose rows hold blobs, looked up by name from cached metadata
+MEDIA_MODELS = {model.__name__: model for model in (Property, PropertyImage, ImageVariant, Post)}
+
+def media_meta(obj, kind):
+    """Everything needed to serve a stored blob, cacheable without the ORM object"""
+    return {
+        'model': type(obj).__name__,
+        'pk': obj.id,
+        'kind': kind,
+        'hash': getattr(obj, f'{kind}_hash'),
+        'size': getattr(obj, f'{kind}_size'),
+        'content_type': getattr(obj, f'{kind}_content_type'),
+        'filename': getattr(obj, f'{kind}_filename'),
+        'storage': getattr(obj, f'{kind}_storage'),
+        'created_at': obj.created_at
+    }
+
+def send_cached_media(meta, cache_control, default_type='application/octet-stream'):
+    """Stream a stored blob: local files zero-copy, anything else through the media cache"""
+    storage = get_storage(meta['storage'])
+    if storage.local and meta['hash']:
+        return send_file_path(
+            storage.path(meta['hash']),
+            meta['content_type'] or default_type,
+            size=meta['size'],
+            filename=meta['filename'],
+            cache_control=cache_control,
+            etag=meta['hash'],
+            last_modified=meta['created_at']
+        )
+    
+    model = MEDIA_MODELS[meta['model']]
+    opener = blob_opener(model, meta['kind'], meta['pk'], meta['hash'], meta['size'], meta['storage'])
+    if meta['hash']:
+        opener = media_cache.opener(meta['hash'], meta['size'], opener)
+    return send_media(
+        opener, meta['size'],
+        mimetype=meta['content_type'] or default_type,
+        filename=meta['filename'],
+        cache_control=cache_control,
+        etag=meta['hash'],
+        last_modified=meta['created_at']
+    )
+
+def negotiated_cache_key(*parts):
+    """Media cache alias for a negotiated image route: route parts plus ?w= and accepted formats"""
+    formats = ','.join(negotiated_image_types())
+    return ':'.join(str(part) for part in (*parts, request.args.get('w', type=int), formats))
+
+def send_negotiated_media(meta, cache_control):
+    response = send_cached_media(meta, cache_control, 'image/jpeg')
+    response.vary.add('Accept')
+    return response
+
+def send_negotiated_image(image, cache_control, cache_key):
+    """Stream the rendition of an image that best matches the request's ?w= and Accept header"""
+    rendition = image_for_width(image, request.args.get('w', type=int), negotiated_image_types())
+    meta = media_meta(rendition, 'image')
+    media_cache.set_alias(cache_key, meta)
+    return send_negotiated_media(meta, cache_control)
+
+def cached_media_meta(cache_key):
+    """Media metadata cached under a route alias, or None when there is none or it went stale.
+
+    Media jobs rewrite database rows in place, so an alias cached before
+    that (here or in another worker) may name a hash the row no longer
+    holds; it is dropped and the caller looks the row up again.
+    """
+    meta = media_cache.get_alias(cache_key)
+    if not meta or not meta['hash'] or media_cache.contains(meta['hash']):
+        return meta
+    if not get_storage(meta['storage']).inline:
+        return meta  # content-addressed blobs are never rewritten
+    model = MEDIA_MODELS[meta['model']]
+    hash_column = getattr(model, f"{meta['kind']}_hash")
+    if db.session.query(model.id).filter(model.id == meta['pk'], hash_column == meta['hash']).first():
+        return meta
+    media_cache.invalidate(meta['hash'])
+    return None
+
+def invalidate_media(content_hashes, *alias_prefixes):
+    """Drop deleted blobs and the route aliases pointing at them from the media cache"""
+    for content_hash in content_hashes:
+        if content_hash:
+            media_cache.invalidate(content_hash)
+    for prefix in alias_prefixes:
+        media_cache.invalidate_prefix(prefix)
+
 # Routes to serve files from database
+@app.route('/m/<content_hash>.<ext>')
+def serve_media(content_hash, ext):
+    """Serve any stored blob by its content hash with year-long immutable caching"""
+    cache_key = f'hash:{content_hash}'
+    meta = cached_media_meta(cache_key)
+    if meta is None:
+        obj, kind = find_media_by_hash(content_hash)
+        if obj is None:
+            return "Media not found", 404
+        meta = media_meta(obj, kind)
+        media_cache.set_alias(cache_key, meta)
+    
+    return send_cached_media(meta, IMMUTABLE_CACHE_CONTROL)
+
 @app.route('/serve/property_image/<int:property_id>')
 def serve_property_main_image(property_id):
     """Serve main property image from database"""
+    cache_key = negotiated_cache_key('property_main', property_id)
+    meta = cached_media_meta(cache_key)
+    if meta:
+        return send_negotiated_media(meta, 'public, max-age=86400')
+    
     property_obj = Property.query.get_or_404(property_id)
     
-    # Try to get first image from database
-    first_image = PropertyImage.query.filter_by(property_id=property_id, is_primary=True).first()
-    if not first_image:
-        first_image = PropertyImage.query.filter_by(property_id=property_id).order_by(PropertyImage.order_index).first()
+    first_image = primary_image(property_obj)
     
     if first_image and first_image.has_image_data():
-        return Response(
-            first_image.image_data,
-            mimetype=first_image.image_content_type or 'image/jpeg',
-            headers={
-                'Content-Disposition': f'inline; filename="{first_image.image_filename}"',
-                'Cache-Control': 'public, max-age=86400',  # 24 hours cache
-                'ETag': f'property-{property_id}-main'
-            }
-        )
+        return send_negotiated_image(first_image, 'public, max-age=86400', cache_key)  # 24 hours cache
     
     # Fallback to file system if available
     if property_obj.image_path and os.path.exists(property_obj.image_path):
-        with open(property_obj.image_path, 'rb') as f:
-            file_data = f.read()
         content_type = get_file_content_type(property_obj.image_path)
-        return Response(file_data, mimetype=content_type)
+        return send_local_file(property_obj.image_path, content_type)
     
     return "Image not found", 404
 
 @app.route('/serve/property_image/<int:property_id>/<int:image_index>')
 def serve_property_image(property_id, image_index):
     """Serve specific property image from database"""
+    cache_key = negotiated_cache_key('property_image', property_id, image_index)
+    meta = cached_media_meta(cache_key)
+    if meta:
+        return send_negotiated_media(meta, 'public, max-age=86400')
+    
     property_image = PropertyImage.query.filter_by(
         property_id=property_id, 
         order_index=image_index
     ).first_or_404()
     
     if property_image.has_image_data():
-        return Response(
-            property_image.image_data,
-            mimetype=property_image.image_content_type or 'image/jpeg',
-            headers={
-                'Content-Disposition': f'inline; filename="{property_image.image_filename}"',
-                'Cache-Control': 'public, max-age=86400',
-                'ETag': f'property-{property_id}-{image_index}'
-            }
-        )
+        return send_negotiated_image(property_image, 'public, max-age=86400', cache_key)
     
     # Fallback to file system
     if property_image.image_path and os.path.exists(property_image.image_path):
-        with open(property_image.image_path, 'rb') as f:
-            file_data = f.read()
         content_type = get_file_content_type(property_image.image_path)
-        return Response(file_data, mimetype=content_type)
+        return send_local_file(property_image.image_path, content_type)
     
     return "Image not found", 404
 
@@ -541,45 +974,33 @@ def serve_property_video(property_id):
     property_obj = Property.query.get_or_404(property_id)
     
     if property_obj.has_video_data():
-        return Response(
-            property_obj.video_data,
-            mimetype=property_obj.video_content_type or 'video/mp4',
-            headers={
-                'Content-Disposition': f'inline; filename="{property_obj.video_filename}"',
-                'Cache-Control': 'max-age=3600'
-            }
-        )
+        # Stream in chunks straight from the database, honouring Range requests
+        return send_cached_media(media_meta(property_obj, 'video'), 'max-age=3600', 'video/mp4')
     
     # Fallback to file system
     if property_obj.video_path and os.path.exists(property_obj.video_path):
-        with open(property_obj.video_path, 'rb') as f:
-            file_data = f.read()
         content_type = get_file_content_type(property_obj.video_path)
-        return Response(file_data, mimetype=content_type)
+        return send_local_file(property_obj.video_path, content_type)
     
     return "Video not found", 404
 
 @app.route('/serve/post_image/<int:post_id>')
 def serve_post_image(post_id):
     """Serve post image from database"""
+    cache_key = negotiated_cache_key('post_image', post_id)
+    meta = cached_media_meta(cache_key)
+    if meta:
+        return send_negotiated_media(meta, 'max-age=3600')
+    
     post_obj = Post.query.get_or_404(post_id)
     
     if post_obj.has_image_data():
-        return Response(
-            post_obj.image_data,
-            mimetype=post_obj.image_content_type,
-            headers={
-                'Content-Disposition': f'inline; filename="{post_obj.image_filename}"',
-                'Cache-Control': 'max-age=3600'
-            }
-        )
+        return send_negotiated_image(post_obj, 'max-age=3600', cache_key)
     
     # Fallback to file system
     if post_obj.image_path and os.path.exists(post_obj.image_path):
-        with open(post_obj.image_path, 'rb') as f:
-            file_data = f.read()
         content_type = get_file_content_type(post_obj.image_path)
-        return Response(file_data, mimetype=content_type)
+        return send_local_file(post_obj.image_path, content_type)
     
     return "Image not found", 404
 
@@ -589,47 +1010,28 @@ def serve_post_video(post_id):
     post_obj = Post.query.get_or_404(post_id)
     
     if post_obj.has_video_data():
-        return Response(
-            post_obj.video_data,
-            mimetype=post_obj.video_content_type,
-            headers={
-                'Content-Disposition': f'inline; filename="{post_obj.video_filename}"',
-                'Cache-Control': 'max-age=3600'
-            }
-        )
+        # Stream in chunks straight from the database, honouring Range requests
+        return send_cached_media(media_meta(post_obj, 'video'), 'max-age=3600', 'video/mp4')
     
     # Fallback to file system
     if post_obj.video_path and os.path.exists(post_obj.video_path):
-        with open(post_obj.video_path, 'rb') as f:
-            file_data = f.read()
         content_type = get_file_content_type(post_obj.video_path)
-        return Response(file_data, mimetype=content_type)
+        return send_local_file(post_obj.video_path, content_type)
     
     return "Video not found", 404
 
 @app.route('/admin/logout')
 def admin_logout():
-    admin_token = session.get('admin_token')
+    admin_token = session.pop('admin_token', None)
     if admin_token:
-        AdminSession.query.filter_by(session_token=admin_token).delete()
-        db.session.commit()
-        session.pop('admin_token', None)
+        admin_sessions.revoke(admin_token)
     
     flash('Logout realizado com sucesso!', 'success')
     return redirect(url_for('index'))
 
 @app.route('/admin/add-post', methods=['POST'])
+@admin_required
 def add_post():
-    # Check admin authentication
-    admin_token = session.get('admin_token')
-    if not admin_token:
-        return redirect(url_for('admin_login'))
-    
-    admin_session = AdminSession.query.filter_by(session_token=admin_token).first()
-    if not admin_session or admin_session.expires_at < datetime.utcnow():
-        session.pop('admin_token', None)
-        return redirect(url_for('admin_login'))
-    
     try:
         title = request.form.get('title')
         content = request.form.get('content')
@@ -674,19 +1076,25 @@ def add_post():
         
         # Set file data if uploaded
         if image_file_info:
-            post_obj.image_data = image_file_info['data']
-            post_obj.image_filename = image_file_info['filename']
-            post_obj.image_content_type = image_file_info['content_type']
+            apply_image_info(post_obj, image_file_info)
         
         if video_file_info:
-            post_obj.video_data = video_file_info['data']
-            post_obj.video_filename = video_file_info['filename']
-            post_obj.video_content_type = video_file_info['content_type']
+            apply_video_info(post_obj, video_file_info)
         
         db.session.add(post_obj)
+        if image_file_info:
+            # Recompression and renditions run in the background
+            db.session.flush()
+            enqueue('post_image', post_obj.id)
         db.session.commit()
+        notify()
         
-        flash('Post adicionado com sucesso!', 'success')
+        listing_index.index_post(post_obj)
+        publish_content_change()
+        if image_file_info:
+            flash('Post adicionado com sucesso! A imagem está sendo processada.', 'success')
+        else:
+            flash('Post adicionado com sucesso!', 'success')
         print(f"Post created successfully: {post_obj.id}")
         
     except Exception as e:
@@ -697,17 +1105,8 @@ def add_post():
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/delete-post/<int:post_id>')
+@admin_required
 def delete_post(post_id):
-    # Check admin authentication
-    admin_token = session.get('admin_token')
-    if not admin_token:
-        return redirect(url_for('admin_login'))
-    
-    admin_session = AdminSession.query.filter_by(session_token=admin_token).first()
-    if not admin_session or admin_session.expires_at < datetime.utcnow():
-        session.pop('admin_token', None)
-        return redirect(url_for('admin_login'))
-    
     try:
         post_obj = Post.query.get_or_404(post_id)
         
@@ -727,8 +1126,14 @@ def delete_post(post_id):
                 print(f"Warning: Could not delete legacy post video: {e}")
         
         # Delete the post (this also removes binary data from database)
+        media_hashes = [post_obj.image_hash, post_obj.video_hash]
+        media_hashes.extend(variant.image_hash for variant in post_obj.variants)
         db.session.delete(post_obj)
         db.session.commit()
+        invalidate_media(media_hashes, f'post_image:{post_id}:')
+        delete_unreferenced(media_hashes)
+        listing_index.remove_post(post_id)
+        publish_content_change()
         
         print(f"Post {post_id} deleted successfully from database")
         flash('Post removido com sucesso!', 'success')
@@ -741,36 +1146,18 @@ def delete_post(post_id):
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/edit-property/<int:property_id>')
+@admin_required
 def edit_property(property_id):
-    # Check admin authentication
-    admin_token = session.get('admin_token')
-    if not admin_token:
-        return redirect(url_for('admin_login'))
-    
-    admin_session = AdminSession.query.filter_by(session_token=admin_token).first()
-    if not admin_session or admin_session.expires_at < datetime.utcnow():
-        session.pop('admin_token', None)
-        return redirect(url_for('admin_login'))
-    
     property_obj = Property.query.get_or_404(property_id)
     
     # GET request - render edit form with optimized queries
-    properties = Property.query.order_by(Property.created_at.desc()).limit(20).all()
-    posts = Post.query.order_by(Post.created_at.desc()).limit(20).all()
+    properties = property_listing_query().order_by(Property.created_at.desc()).limit(20).all()
+    posts = post_listing_query().order_by(Post.created_at.desc()).limit(20).all()
     return render_template('admin_panel.html', properties=properties, posts=posts, edit_property=property_obj)
 
 @app.route('/admin/update-property/<int:property_id>', methods=['POST'])
+@admin_required
 def update_property(property_id):
-    # Check admin authentication
-    admin_token = session.get('admin_token')
-    if not admin_token:
-        return redirect(url_for('admin_login'))
-    
-    admin_session = AdminSession.query.filter_by(session_token=admin_token).first()
-    if not admin_session or admin_session.expires_at < datetime.utcnow():
-        session.pop('admin_token', None)
-        return redirect(url_for('admin_login'))
-    
     try:
         property_obj = Property.query.get_or_404(property_id)
         
@@ -783,6 +1170,8 @@ def update_property(property_id):
         property_obj.featured = 'featured' in request.form
         
         db.session.commit()
+        listing_index.index_property(property_obj)
+        publish_content_change()
         flash('Propriedade atualizada com sucesso!', 'success')
         print(f"Property {property_id} updated successfully")
         
@@ -794,36 +1183,18 @@ def update_property(property_id):
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/edit-post/<int:post_id>')
+@admin_required
 def edit_post(post_id):
-    # Check admin authentication
-    admin_token = session.get('admin_token')
-    if not admin_token:
-        return redirect(url_for('admin_login'))
-    
-    admin_session = AdminSession.query.filter_by(session_token=admin_token).first()
-    if not admin_session or admin_session.expires_at < datetime.utcnow():
-        session.pop('admin_token', None)
-        return redirect(url_for('admin_login'))
-    
     post_obj = Post.query.get_or_404(post_id)
     
     # GET request - render edit form with optimized queries
-    properties = Property.query.order_by(Property.created_at.desc()).limit(20).all()
-    posts = Post.query.order_by(Post.created_at.desc()).limit(20).all()
+    properties = property_listing_query().order_by(Property.created_at.desc()).limit(20).all()
+    posts = post_listing_query().order_by(Post.created_at.desc()).limit(20).all()
     return render_template('admin_panel.html', properties=properties, posts=posts, edit_post=post_obj)
 
 @app.route('/admin/update-post/<int:post_id>', methods=['POST'])
+@admin_required
 def update_post(post_id):
-    # Check admin authentication
-    admin_token = session.get('admin_token')
-    if not admin_token:
-        return redirect(url_for('admin_login'))
-    
-    admin_session = AdminSession.query.filter_by(session_token=admin_token).first()
-    if not admin_session or admin_session.expires_at < datetime.utcnow():
-        session.pop('admin_token', None)
-        return redirect(url_for('admin_login'))
-    
     try:
         post_obj = Post.query.get_or_404(post_id)
         
@@ -833,6 +1204,8 @@ def update_post(post_id):
         post_obj.featured = 'featured' in request.form
         
         db.session.commit()
+        listing_index.index_post(post_obj)
+        publish_content_change()
         flash('Post atualizado com sucesso!', 'success')
         print(f"Post {post_id} updated successfully")
         
@@ -843,15 +1216,31 @@ def update_post(post_id):
     
     return redirect(url_for('admin_panel'))
 
-# Route for serving uploaded files
-@app.route('/uploads/<filename>')
-def uploaded_file(filename):
-    from flask import send_from_directory
-    import os
-    if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], filename)):
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-    else:
-        return "File not found", 404
+def load_listing_documents():
+    """Just the indexed columns, one query per table; runs in the index's background thread too"""
+    with app.app_context():
+        properties = db.session.query(Property.id, Property.title, Property.location, Property.property_type,
+                                      Property.price, Property.description).all()
+        posts = db.session.query(Post.id, Post.title, Post.content).all()
+        return properties, posts
+
+def chat_messages(message):
+    """Prompt for a visitor question, with the best-matching listings injected into the context"""
+    listing_index.refresh(page_cache.listings_generation(), load_listing_documents)
+    matches = listing_index.search(message, app.config['CHATBOT_TOP_K'])
+    return build_messages(message, build_context([summary for _, _, summary in matches]))
+
+def save_conversation(user_name, user_phone, message, bot_response):
+    """Log a chatbot exchange to the database"""
+    conversation = ChatbotConversation()
+    conversation.name = user_name
+    conversation.phone = user_phone
+    conversation.message = message
+    conversation.bot_response = bot_response
+    
+    db.session.add(conversation)
+    db.session.commit()
+    return conversation
 
 @app.route('/chatbot/message', methods=['POST'])
 def chatbot_message():
@@ -861,48 +1250,23 @@ def chatbot_message():
         user_name = data.get('user_name', '')
         user_phone = data.get('user_phone', '')
         
-        if not openai_client:
-            return jsonify({'response': 'Desculpe, o sistema de chat está temporariamente indisponível.'})
-        
-        # Create context about the real estate company
-        context = """
-        Você é a assistente virtual da Maeva Investimentos Imobiliários, uma consultoria imobiliária de São Paulo especializada em imóveis de médio e alto padrão.
-
-        Informações da empresa:
-        - Especializada em imóveis de alto padrão em São Paulo
-        - Mais de 13 anos de experiência no mercado
-        - Consultora principal: Rose Ventura
-        - Regiões de atuação: Jardins, Vila Olímpia, Itaim Bibi, Moema, Brooklin, Pinheiros, Vila Madalena, Morumbi
-        - Tipos de imóveis: Apartamentos, casas, coberturas, imóveis comerciais
-        - Serviços: Consultoria especializada, assessoria para investidores, acompanhamento completo do processo
-        - Contato: WhatsApp (11) 98755-7913, Instagram @Roseaventura
-        
-        Seja sempre cordial, profissional e útil. Forneça informações sobre imóveis, bairros de São Paulo, processo de compra, documentação, financiamento imobiliário e investimentos. Sempre incentive o contato direto para agendamento de visitas.
-        """
-        
-        # the newest OpenAI model is "gpt-5" which was released August 7, 2025.
-        # do not change this unless explicitly requested by the user
-        response = openai_client.chat.completions.create(
-            model="gpt-5",
-            messages=[
-                {"role": "system", "content": context},
-                {"role": "user", "content": message}
-            ],
-            max_tokens=300,
-            temperature=0.7
-        )
+        if not chat_backend:
+            return jsonify({'response': UNAVAILABLE_MESSAGE})
         
-        bot_response = response.choices[0].message.content
+        messages = chat_messages(message)
+        context = context_fingerprint(messages)
+        bot_response = chat_cache.get(message, context)
+        if bot_response is None:
+            if not chat_streams.acquire():
+                return jsonify({'response': BUSY_MESSAGE})
+            try:
+                bot_response = complete(chat_backend, messages)
+            finally:
+                chat_streams.release()
+            chat_cache.put(message, bot_response, context)
         
         # Save conversation to database
-        conversation = ChatbotConversation()
-        conversation.name = user_name
-        conversation.phone = user_phone
-        conversation.message = message
-        conversation.bot_response = bot_response
-        
-        db.session.add(conversation)
-        db.session.commit()
+        conversation = save_conversation(user_name, user_phone, message, bot_response)
         
         return jsonify({
             'response': bot_response,
@@ -911,23 +1275,140 @@ def chatbot_message():
         
     except Exception as e:
         print(f"Chatbot error: {e}")
-        return jsonify({'response': 'Desculpe, ocorreu um erro. Tente novamente ou entre em contato pelo WhatsApp (11) 98755-7913.'})
+        return jsonify({'response': ERROR_MESSAGE})
 
-@app.route('/admin/conversations')
-def admin_conversations():
-    # Check admin authentication
-    admin_token = session.get('admin_token')
-    if not admin_token:
-        return redirect(url_for('admin_login'))
+@app.route('/chatbot/stream', methods=['POST'])
+def chatbot_stream():
+    """Stream the assistant's reply as server-sent events (token, then done or error)"""
+    data = request.get_json(silent=True) or {}
+    message = data.get('message', '')
+    user_name = data.get('user_name', '')
+    user_phone = data.get('user_phone', '')
     
-    admin_session = AdminSession.query.filter_by(session_token=admin_token).first()
-    if not admin_session or admin_session.expires_at < datetime.utcnow():
-        session.pop('admin_token', None)
-        return redirect(url_for('admin_login'))
+    def single_reply(text):
+        yield sse_event('token', {'text': text})
+        yield sse_event('done', {'conversation_id': None})
     
-    conversations = ChatbotConversation.query.order_by(ChatbotConversation.created_at.desc()).all()
+    if not chat_backend:
+        body = single_reply(UNAVAILABLE_MESSAGE)
+    else:
+        messages = chat_messages(message)
+        context = context_fingerprint(messages)
+        cached = chat_cache.get(message, context)
+        if cached is not None:
+            body = stream_with_context(replay_cached_reply(message, cached, user_name, user_phone))
+        else:
+            body = stream_with_context(stream_reply(messages, context, user_name, user_phone))
     
-    return render_template('admin_conversations.html', conversations=conversations)
+    response = Response(body, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let a proxy buffer the tokens
+    return response
+
+def replay_cached_reply(message, answer, user_name, user_phone):
+    """Send a cached answer as a single token; it is still logged like any other reply"""
+    yield sse_event('token', {'text': answer})
+    conversation = save_conversation(user_name, user_phone, message, answer)
+    yield sse_event('done', {'conversation_id': conversation.id})
+
+def stream_reply(messages, context, user_name, user_phone):
+    """Forward tokens as they arrive, then log the whole exchange once the stream ends"""
+    # The slot is taken once the body starts: a generator closed before its first step never runs
+    # its finally, so a visitor who left before then would otherwise hold the slot for good
+    if not chat_streams.acquire():
+        yield sse_event('token', {'text': BUSY_MESSAGE})
+        yield sse_event('done', {'conversation_id': None})
+        return
+    message = messages[-1]['content']
+    parts = []
+    conversation = None
+    try:
+        for delta in chat_backend.stream(messages):
+            parts.append(delta)
+            yield sse_event('token', {'text': delta})
+        # Only complete replies are reused
+        chat_cache.put(message, ''.join(parts), context)
+    except Exception as e:
+        print(f"Chatbot stream error: {e}")
+        yield sse_event('error', {'message': ERROR_MESSAGE})
+    finally:
+        chat_streams.release()
+        # Also runs when the visitor disconnects mid-reply, logging what was sent
+        if parts:
+            try:
+                conversation = save_conversation(user_name, user_phone, message, ''.join(parts))
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error saving chatbot conversation: {e}")
+    yield sse_event('done', {'conversation_id': conversation.id if conversation else None})
+
+def conversations_page(with_total=False):
+    query = ChatbotConversation.query.order_by(ChatbotConversation.created_at.desc(), ChatbotConversation.id.desc())
+    # Conversations don't bump the page-cache generation, so their total is only refreshed by the TTL
+    total = result_counts.get(('chatbot_conversation',), None, query) if with_total else None
+    return cursor_page(query, CONVERSATIONS_PAGE_SIZE, (ChatbotConversation.created_at, ChatbotConversation.id), total)
+
+@app.route('/admin/conversations')
+@admin_required
+def admin_conversations():
+    conversations = conversations_page(with_total=True)
+    next_url, fragment_url = page_links(conversations, 'admin_conversations', 'admin_conversations_more')
+    return render_template('admin_conversations.html', conversations=conversations,
+                           next_url=next_url, fragment_url=fragment_url,
+                           chat_cache_stats=chat_cache.snapshot())
+
+@app.route('/admin/conversations/mais')
+@admin_required(api=True)
+def admin_conversations_more():
+    """Next conversation cards as an HTML fragment"""
+    conversations = conversations_page()
+    next_url, fragment_url = page_links(conversations, 'admin_conversations', 'admin_conversations_more')
+    return jsonify(html=render_template('_conversation_cards.html', conversations=conversations),
+                   next_url=next_url, fragment_url=fragment_url)
+
+@app.route('/admin/chatbot-cache')
+@admin_required
+def admin_chatbot_cache():
+    # Hit/miss counters and size of the chatbot answer cache
+    return jsonify(chat_cache.snapshot())
+
+@app.route('/admin/chatbot-cache/purge', methods=['POST'])
+@admin_required
+def purge_chatbot_cache():
+    count = chat_cache.purge()
+    print(f"Chatbot cache purged: {count} answers removed")
+    flash(f'Cache do chatbot limpo ({count} respostas removidas).', 'success')
+    return redirect(url_for('admin_conversations'))
+
+@app.route('/admin/media-cache')
+@admin_required
+def admin_media_cache():
+    # Hit/miss/eviction counters and current usage of the media cache
+    return jsonify(media_cache.snapshot())
+
+@app.route('/admin/page-cache')
+@admin_required
+def admin_page_cache():
+    # Hit/miss counters and current generation of the rendered-page cache
+    return jsonify(page_cache.snapshot())
+
+@app.route('/admin/jobs')
+@admin_required
+def admin_jobs():
+    # Most recent media jobs, optionally filtered by ?status=
+    query = MediaJob.query.order_by(MediaJob.id.desc())
+    status = request.args.get('status')
+    if status:
+        query = query.filter_by(status=status)
+    return jsonify({'jobs': [job.to_dict() for job in query.limit(50).all()]})
+
+@app.route('/admin/jobs/<int:job_id>')
+@admin_required
+def admin_job_status(job_id):
+    job = db.session.get(MediaJob, job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify(job.to_dict())
 
 @app.errorhandler(404)
 def page_not_found(e):
@@ -0,0 +1,184 @@
+"""Full-text property search for the gallery.
+
+Postgres matches against a generated ``search_vector`` tsvector column
+(Portuguese stemming, GIN index, created by migrate_db.py); SQLite uses an
+FTS5 table kept in sync by triggers. Both index accent-folded text, with
+the location held apart (tsvector weight A, its own FTS5 column) so the
+location filter only matches the neighbourhood, not a description that
+mentions it. If neither index exists yet the search falls back to LIKE.
+"""
+try:
+    from main import db
+except ImportError:
+    from app import db
+
+from chatbot import normalize_message
+from listing_index import tokenize
+from models import Property
+
+# Accent folding that Postgres can evaluate in a generated column (unaccent() is not immutable)
+ACCENTED = 'áàâãäéèêëíìîïóòôõöúùûüçñ'
+UNACCENTED = 'aaaaaeeeeiiiiooooouuuucn'
+
+def _folded(column):
+    return f"translate(lower(coalesce({column}, '')), '{ACCENTED}', '{UNACCENTED}')"
+
+POSTGRES_SEARCH_COLUMN = (
+    "ALTER TABLE property ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    f"setweight(to_tsvector('portuguese', {_folded('location')}), 'A') || "
+    f"setweight(to_tsvector('portuguese', {_folded('title')}), 'B') || "
+    f"setweight(to_tsvector('portuguese', {_folded('property_type')}), 'C') || "
+    f"setweight(to_tsvector('portuguese', {_folded('description')}), 'D')) STORED"
+)
+POSTGRES_SEARCH_INDEX = "CREATE INDEX IF NOT EXISTS ix_property_search_vector ON property USING GIN (search_vector)"
+
+SQLITE_FTS_SETUP = [
+    "CREATE VIRTUAL TABLE property_fts USING fts5(location, title, property_type, description, "
+    "content='property', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER property_fts_insert AFTER INSERT ON property BEGIN "
+    "INSERT INTO property_fts (rowid, location, title, property_type, description) "
+    "VALUES (new.id, new.location, new.title, new.property_type, new.description); END",
+    "CREATE TRIGGER property_fts_delete AFTER DELETE ON property BEGIN "
+    "INSERT INTO property_fts (property_fts, rowid, location, title, property_type, description) "
+    "VALUES ('delete', old.id, old.location, old.title, old.property_type, old.description); END",
+    "CREATE TRIGGER property_fts_update AFTER UPDATE OF location, title, property_type, description ON property BEGIN "
+    "INSERT INTO property_fts (property_fts, rowid, location, title, property_type, description) "
+    "VALUES ('delete', old.id, old.location, old.title, old.property_type, old.description); "
+    "INSERT INTO property_fts (rowid, location, title, property_type, description) "
+    "VALUES (new.id, new.location, new.title, new.property_type, new.description); END",
+    "INSERT INTO property_fts (property_fts) VALUES ('rebuild')",
+]
+
+# Relative weight of each FTS5 column in bm25(): location, title, type, description
+SQLITE_COLUMN_WEIGHTS = (4.0, 3.0, 2.0, 1.0)
+
+def install_sqlite_fts():
+    """Create the FTS5 table and its sync triggers on SQLite databases that don't have them"""
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    with db.engine.connect() as conn:
+        exists = conn.execute(db.text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'property_fts'")).first()
+        if exists:
+            return False
+        for statement in SQLITE_FTS_SETUP:
+            conn.execute(db.text(statement))
+        conn.commit()
+    return True
+
+_index_available = None
+
+def index_available():
+    """Whether this database has the full-text index (checked once per process)"""
+    global _index_available
+    if _index_available is None:
+        with db.engine.connect() as conn:
+            if db.engine.dialect.name == 'postgresql':
+                row = conn.execute(db.text(
+                    "SELECT 1 FROM information_schema.columns "
+                    "WHERE table_name = 'property' AND column_name = 'search_vector'")).first()
+            else:
+                row = conn.execute(db.text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'property_fts'")).first()
+        _index_available = row is not None
+    return _index_available
+
+# Gallery sort options (?sort=); relevance stays the default order for keyword searches
+SORT_OPTIONS = {
+    'recentes': (Property.created_at.desc(), Property.id.desc()),
+    'menor-preco': (Property.price_cents.asc().nullslast(), Property.id.desc()),
+    'maior-preco': (Property.price_cents.desc().nullslast(), Property.id.desc()),
+}
+
+def _price_range(value):
+    """(min, max) in centavos from "500000-1000000" (reais); either side may be empty"""
+    low, _, high = (value or '').partition('-')
+    try:
+        return (int(low) * 100 if low.strip() else None, int(high) * 100 if high.strip() else None)
+    except ValueError:
+        return None, None
+
+def parse_filters(args):
+    """Search filters from the gallery query string; empty values are dropped"""
+    min_price, max_price = _price_range(args.get('price'))
+    # Amenity checkboxes ("piscina", "academia", ...) are extra keywords
+    keywords = ' '.join([args.get('q', '')] + args.getlist('amenity'))
+    filters = {
+        'q': normalize_message(keywords).replace('_', ' ')[:200],
+        'location': normalize_message(args.get('location', '')).replace('_', ' ')[:100],
+        'property_type': (args.get('type') or '').strip().lower()[:100],
+        'featured': args.get('featured') in ('1', 'on', 'true'),
+        'min_price': min_price,
+        'max_price': max_price,
+        'sort': args.get('sort') if args.get('sort') in SORT_OPTIONS else None,
+    }
+    return {name: value for name, value in filters.items() if value}
+
+# Only keyword searches are ranked; a location-only match is sorted by date, so skip scoring it
+
+def _postgres_matches(terms, location_terms):
+    parts = [f"{term}:*" for term in terms]
+    if location_terms:
+        parts.append('(' + ' <-> '.join(f"{term}:A" for term in location_terms) + ')')
+    score = 'ts_rank(property.search_vector, query)' if terms else '0'
+    return db.text(
+        f"SELECT property.id AS id, {score} AS score "
+        "FROM property, to_tsquery('portuguese', :tsquery) AS query "
+        "WHERE property.search_vector @@ query"
+    ).bindparams(tsquery=' & '.join(parts)).columns(id=db.Integer, score=db.Float)
+
+def _sqlite_matches(terms, location_terms):
+    parts = [f'"{term}"*' for term in terms]
+    if location_terms:
+        parts.append('location : "' + ' '.join(location_terms) + '"')
+    weights = ', '.join(str(weight) for weight in SQLITE_COLUMN_WEIGHTS)
+    score = f'-bm25(property_fts, {weights})' if terms else '0'
+    return db.text(
+        f"SELECT rowid AS id, {score} AS score "
+        "FROM property_fts WHERE property_fts MATCH :match"
+    ).bindparams(match=' '.join(parts)).columns(id=db.Integer, score=db.Float)
+
+def _like_filters(query, terms, location_terms):
+    for term in terms:
+        pattern = f"%{term}%"
+        query = query.filter(db.or_(Property.title.ilike(pattern), Property.description.ilike(pattern),
+                                    Property.location.ilike(pattern)))
+    if location_terms:
+        query = query.filter(Property.location.ilike(f"%{' '.join(location_terms)}%"))
+    return query
+
+def search_ordering(filters):
+    """'relevance' for ranked keyword searches, otherwise the SORT_OPTIONS key in effect"""
+    if 'sort' in filters:
+        return filters['sort']
+    return 'relevance' if tokenize(filters.get('q', '')) and index_available() else 'recentes'
+
+def search_properties(query, filters):
+    """Apply parsed filters to a Property query; keyword searches are ordered by relevance"""
+    if 'property_type' in filters:
+        query = query.filter(Property.property_type == filters['property_type'])
+    if filters.get('featured'):
+        query = query.filter(Property.featured.is_(True))
+    if 'min_price' in filters:
+        query = query.filter(Property.price_cents >= filters['min_price'])
+    if 'max_price' in filters:
+        query = query.filter(Property.price_cents <= filters['max_price'])
+
+    terms = tokenize(filters.get('q', ''))
+    location_terms = filters.get('location', '').split()
+    order = SORT_OPTIONS[filters.get('sort', 'recentes')]
+    if not terms and not location_terms:
+        return query.order_by(*order)
+
+    if not index_available():
+        return _like_filters(query, terms, location_terms).order_by(*order)
+
+    # Materialised so the planner runs the full-text match once instead of once per filtered row
+    if db.engine.dialect.name == 'postgresql':
+        matches = _postgres_matches(terms, location_terms).cte('matches').prefix_with('MATERIALIZED')
+    else:
+        matches = _sqlite_matches(terms, location_terms).cte('matches').prefix_with('MATERIALIZED')
+    query = query.join(matches, matches.c.id == Property.id)
+    if search_ordering(filters) == 'relevance':
+        return query.order_by(matches.c.score.desc(), Property.created_at.desc(), Property.id.desc())
+    return query.order_by(*order)
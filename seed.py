@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Dados sintéticos para auditoria de consultas e benchmarks.
+
+Fills an empty database with realistic-looking properties (each with
+images and a rendition), posts and chatbot conversations, using bulk
+inserts so tens of thousands of rows take seconds. Refuses to touch a
+database that already has properties unless --force is given.
+
+By default images share one tiny JPEG; the point is row counts and query
+plans, not pixels. For load tests, --image-size gives every row a
+photo-sized JPEG (from a small pool, with the renditions uploads would
+get) and --videos adds video blobs, so media routes move realistic bytes.
+"""
+import io
+import os
+import sys
+import random
+import hashlib
+import argparse
+from datetime import datetime, timedelta
+
+if __name__ == '__main__':
+    os.environ.setdefault('MEDIA_JOB_WORKER', '0')
+
+try:
+    from main import app, db
+except ImportError:
+    from app import app, db
+
+from models import Property, PropertyImage, ImageVariant, Post, ChatbotConversation
+from pricing import parse_price
+from imaging import encode_jpeg, process_image
+
+LOCATIONS = ['Jardins', 'Vila Olímpia', 'Itaim Bibi', 'Moema', 'Brooklin', 'Pinheiros', 'Vila Madalena', 'Morumbi']
+PROPERTY_TYPES = ['apartamento', 'casa', 'cobertura', 'comercial', 'terreno']
+FEATURES = ['piscina', 'academia', 'varanda gourmet', 'churrasqueira', 'suíte master', 'vista para o parque',
+            'perto do metrô', 'portaria 24 horas', 'salão de festas', 'jardim', 'home office', 'lareira',
+            'adega', 'brinquedoteca', 'quadra de tênis', 'spa', 'depósito privativo', 'pé-direito duplo']
+QUESTIONS = ['Quais bairros vocês atendem?', 'Como agendar uma visita?', 'Vocês têm apartamentos em Moema?',
+             'Qual a documentação para financiamento?', 'Têm cobertura com piscina?', 'Aceitam permuta?']
+
+# Filler vocabulary with a Zipf-like spread, so full-text terms have realistic selectivity
+VOCABULARY = ['amplo', 'reformado', 'iluminado', 'ventilado', 'silencioso', 'arborizado', 'planejado', 'integrado',
+              'condomínio', 'andar', 'alto', 'sol', 'manhã', 'tarde', 'rua', 'tranquila', 'comércio', 'escolas',
+              'acabamento', 'porcelanato', 'madeira', 'mármore', 'armários', 'cozinha', 'sala', 'jantar', 'estar',
+              'lavabo', 'dormitórios', 'vagas', 'depósito', 'lazer', 'completo', 'segurança', 'elevadores']
+
+# Distinct photos generated for --image-size; rows cycle through them
+PHOTO_POOL = 6
+
+def _tiny_jpeg():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 6), (180, 150, 110)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+def _tiny_photo():
+    jpeg = _tiny_jpeg()
+    blob = {'data': jpeg, 'content_type': 'image/jpeg', 'size': len(jpeg), 'hash': hashlib.sha256(jpeg).hexdigest()}
+    return dict(blob, width=8, variants=[dict(blob, width=8)])
+
+def _photo(rng, size):
+    """Processed JPEG (as imaging.process_image returns it) with smooth shapes and fine grain,
+    which compresses about like a real listing photo of that size"""
+    from PIL import Image, ImageChops
+    width, height = size
+    small = (max(1, width // 24), max(1, height // 24))
+    img = Image.frombytes('RGB', small, rng.randbytes(3 * small[0] * small[1])).resize(size, Image.Resampling.BICUBIC)
+    img = ImageChops.add(img, Image.effect_noise(size, 4).convert('RGB'), 1, -128)
+    return process_image(encode_jpeg(img))
+
+def _blob_columns(kind, blob, filename):
+    """{kind}_* column values for a blob dict"""
+    return {f'{kind}_data': blob['data'], f'{kind}_filename': filename, f'{kind}_content_type': blob['content_type'],
+            f'{kind}_size': blob['size'], f'{kind}_hash': blob['hash']}
+
+def _no_blob(kind):
+    return {f'{kind}_data': None, f'{kind}_filename': None, f'{kind}_content_type': None,
+            f'{kind}_size': None, f'{kind}_hash': None}
+
+def _variant_rows(owner_column, owner_id, photo, name):
+    return [dict(_blob_columns('image', variant, f"{variant['width']}w_{name}"),
+                 **{owner_column: owner_id, 'width': variant['width']}) for variant in photo['variants']]
+
+def _description(rng):
+    words = rng.sample(FEATURES, 3) + rng.choices(VOCABULARY, weights=[1 / (i + 1) for i in range(len(VOCABULARY))], k=25)
+    rng.shuffle(words)
+    return ' '.join(words).capitalize() + '.'
+
+def _price_text(rng):
+    reais = rng.randrange(300, 15000) * 1000
+    return f"R$ {reais:,}".replace(',', '.')
+
+def _batches(rows, size=1000):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def seed_database(properties=5000, images_per_property=4, posts=500, conversations=20000, seed=1,
+                  image_size=None, videos=0, video_bytes=2 * 1024 * 1024):
+    """Bulk-insert synthetic rows; returns a dict of how many rows each table received.
+
+    image_size=(width, height) stores photo-sized images (posts get one
+    too) instead of the shared tiny JPEG; the first `videos` properties
+    and posts get a video of video_bytes random bytes.
+    """
+    rng = random.Random(seed)
+    photos = [_photo(rng, image_size) for _ in range(PHOTO_POOL)] if image_size else [_tiny_photo()]
+    video = None
+    if videos:
+        data = rng.randbytes(video_bytes)
+        video = {'data': data, 'content_type': 'video/mp4', 'size': len(data), 'hash': hashlib.sha256(data).hexdigest()}
+    start = datetime.utcnow() - timedelta(days=3 * 365)
+
+    with app.app_context():
+        # Properties (core inserts skip @validates, so price_cents is set here)
+        rows = []
+        for i in range(properties):
+            property_type = rng.choice(PROPERTY_TYPES)
+            location = rng.choice(LOCATIONS)
+            price = _price_text(rng)
+            rows.append({
+                'title': f"{property_type.capitalize()} {rng.choice(FEATURES)} em {location}",
+                'description': _description(rng),
+                'property_type': property_type,
+                'price': price,
+                'price_cents': parse_price(price),
+                'location': f"{location}, São Paulo",
+                'featured': rng.random() < 0.1,
+                'created_at': start + timedelta(minutes=rng.randrange(3 * 365 * 24 * 60)),
+                'image_count': images_per_property,
+                **(_blob_columns('video', video, f"seed_{i}.mp4") if i < videos else _no_blob('video')),
+            })
+        property_ids = []
+        for batch in _batches(rows):
+            property_ids += db.session.scalars(db.insert(Property).returning(Property.id), batch).all()
+
+        # Images, one rendition per primary image, then the denormalised primary_image_id
+        slots = [(property_id, index) for property_id in property_ids for index in range(images_per_property)]
+        image_photos = [photos[(property_id + index) % len(photos)] for property_id, index in slots]
+        image_rows = [dict(
+            _blob_columns('image', photo, f"seed_{property_id}_{index}.jpg"),
+            property_id=property_id,
+            image_path=f"database://seed_{property_id}_{index}.jpg",
+            is_primary=index == 0,
+            order_index=index,
+            image_width=photo['width'],
+        ) for (property_id, index), photo in zip(slots, image_photos)]
+        image_ids = []
+        for batch in _batches(image_rows):
+            image_ids += db.session.scalars(db.insert(PropertyImage).returning(PropertyImage.id), batch).all()
+        primary_ids = image_ids[::images_per_property] if images_per_property else []
+        primary_photos = image_photos[::images_per_property] if images_per_property else []
+        variant_rows = [row for image_id, photo in zip(primary_ids, primary_photos)
+                        for row in _variant_rows('property_image_id', image_id, photo, f"seed_{image_id}.jpg")]
+        for batch in _batches(variant_rows, 200):
+            db.session.execute(db.insert(ImageVariant), batch)
+        for batch in _batches([{'id': property_id, 'primary_image_id': image_id}
+                               for property_id, image_id in zip(property_ids, primary_ids)]):
+            db.session.execute(db.update(Property), batch)
+
+        post_photos = [photos[i % len(photos)] if image_size else None for i in range(posts)]
+        post_rows = [{
+            'title': f"{rng.choice(['Guia', 'Dicas', 'Mercado', 'Tendências'])} de {rng.choice(LOCATIONS)} #{i}",
+            'content': ' '.join(_description(rng) for _ in range(5)),
+            'featured': rng.random() < 0.1,
+            'created_at': start + timedelta(minutes=rng.randrange(3 * 365 * 24 * 60)),
+            'image_width': photo['width'] if photo else None,
+            **(_blob_columns('image', photo, f"post_{i}.jpg") if photo else _no_blob('image')),
+            **(_blob_columns('video', video, f"post_{i}.mp4") if i < videos else _no_blob('video')),
+        } for i, photo in enumerate(post_photos)]
+        post_ids = []
+        for batch in _batches(post_rows, 200):
+            post_ids += db.session.scalars(db.insert(Post).returning(Post.id), batch).all()
+        post_variant_rows = [row for post_id, photo in zip(post_ids, post_photos) if photo
+                             for row in _variant_rows('post_id', post_id, photo, f"post_{post_id}.jpg")]
+        for batch in _batches(post_variant_rows, 200):
+            db.session.execute(db.insert(ImageVariant), batch)
+
+        conversation_rows = [{
+            'name': f"Visitante {i}",
+            'phone': f"(11) 9{rng.randrange(10000, 99999)}-{rng.randrange(1000, 9999)}",
+            'message': rng.choice(QUESTIONS),
+            'bot_response': 'Obrigada pela pergunta! Nossa consultora Rose Ventura pode ajudar com os detalhes.',
+            'created_at': start + timedelta(minutes=rng.randrange(3 * 365 * 24 * 60)),
+        } for i in range(conversations)]
+        for batch in _batches(conversation_rows):
+            db.session.execute(db.insert(ChatbotConversation), batch)
+
+        db.session.commit()
+    return {'property': len(property_ids), 'property_image': len(image_ids),
+            'image_variant': len(variant_rows) + len(post_variant_rows),
+            'post': len(post_ids), 'chatbot_conversation': len(conversation_rows)}
+
+def parse_size(value):
+    """(width, height) from a "1280x853" argument"""
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"tamanho inválido: {value} (use LARGURAxALTURA, ex. 1280x853)")
+    if width < 1 or height < 1:
+        raise argparse.ArgumentTypeError(f"tamanho inválido: {value}")
+    return width, height
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Popula o banco com dados sintéticos')
+    parser.add_argument('--properties', type=int, default=5000)
+    parser.add_argument('--images', type=int, default=4, help='imagens por imóvel')
+    parser.add_argument('--posts', type=int, default=500)
+    parser.add_argument('--conversations', type=int, default=20000)
+    parser.add_argument('--image-size', type=parse_size, help='fotos realistas deste tamanho, ex. 1280x853 (padrão: JPEG mínimo)')
+    parser.add_argument('--videos', type=int, default=0, help='imóveis e posts que recebem um vídeo')
+    parser.add_argument('--video-kb', type=int, default=2048, help='tamanho de cada vídeo em KB')
+    parser.add_argument('--force', action='store_true', help='insere mesmo se já houver imóveis no banco')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        existing = Property.query.count()
+    if existing and not args.force:
+        print(f"❌ O banco já tem {existing} imóveis; use --force para inserir dados sintéticos mesmo assim")
+        return 1
+    counts = seed_database(args.properties, args.images, args.posts, args.conversations,
+                           image_size=args.image_size, videos=args.videos, video_bytes=args.video_kb * 1024)
+    for table, count in counts.items():
+        print(f"✅ {count} registros em {table}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,16 +20,8 @@ if [ $? -eq 0 ]; then
     echo "✅ Migrações concluídas com sucesso!"
     echo "🚀 Iniciando servidor na porta ${PORT:-5000}..."
     
-    # Usar configuração otimizada para Railway
-    exec gunicorn \
-        --bind 0.0.0.0:${PORT:-5000} \
-        --workers 1 \
-        --timeout 120 \
-        --keep-alive 2 \
-        --max-requests 1000 \
-        --max-requests-jitter 50 \
-        --log-level info \
-        main:app
+    # Perfil de produção: workers, threads e pool do banco calculados em gunicorn.conf.py
+    exec gunicorn -c gunicorn.conf.py
 else
     echo "❌ Erro nas migrações. Código de saída: $?"
     exit 1
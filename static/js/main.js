@@ -13,6 +13,7 @@ document.addEventListener('DOMContentLoaded', function() {
     initFormValidation();
     initImageLazyLoading();
     initTooltips();
+    initLoadMore();
     
     console.log('Maeva Investimentos - Website initialized successfully');
 });
@@ -84,16 +85,18 @@ function initHeroSection() {
 
 // Property sharing functionality
 function initPropertySharing() {
-    const shareButtons = document.querySelectorAll('.share-property');
     const shareModalButton = document.querySelector('.share-modal-property');
     
-    shareButtons.forEach(button => {
-        button.addEventListener('click', function() {
-            const title = this.getAttribute('data-title');
-            const url = this.getAttribute('data-url') || window.location.href;
-            
-            shareProperty(title, url);
-        });
+    // Delegated so cards appended by "Carregar mais" can be shared too
+    document.addEventListener('click', function(event) {
+        const button = event.target.closest('.share-property');
+        if (!button) {
+            return;
+        }
+        const title = button.getAttribute('data-title');
+        const url = button.getAttribute('data-url') || window.location.href;
+        
+        shareProperty(title, url);
     });
     
     if (shareModalButton) {
@@ -221,6 +224,54 @@ function showShareModal(options) {
     });
 }
 
+// "Carregar mais": append the next page's cards from the JSON fragment endpoint,
+// automatically when the button scrolls into view (the plain link still works without JS)
+function initLoadMore() {
+    document.querySelectorAll('.load-more').forEach(button => {
+        let loading = false;
+        
+        async function loadNextPage(event) {
+            if (event) {
+                event.preventDefault();
+            }
+            if (loading || !button.dataset.fragmentUrl) {
+                return;
+            }
+            loading = true;
+            button.classList.add('disabled');
+            try {
+                const response = await fetch(button.dataset.fragmentUrl, {headers: {'Accept': 'application/json'}});
+                if (!response.ok) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+                const page = await response.json();
+                document.querySelector(button.dataset.target).insertAdjacentHTML('beforeend', page.html);
+                if (page.fragment_url) {
+                    button.dataset.fragmentUrl = page.fragment_url;
+                    button.href = page.next_url;
+                } else {
+                    button.closest('.load-more-wrapper').remove();
+                    observer.disconnect();
+                }
+            } catch (error) {
+                console.error('Erro ao carregar mais itens:', error);
+                window.location.href = button.href;
+            } finally {
+                loading = false;
+                button.classList.remove('disabled');
+            }
+        }
+        
+        button.addEventListener('click', loadNextPage);
+        const observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadNextPage();
+            }
+        }, {rootMargin: '400px 0px'});
+        observer.observe(button);
+    });
+}
+
 // Smooth scrolling for anchor links
 function initSmoothScrolling() {
     const anchorLinks = document.querySelectorAll('a[href^="#"]');
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+"""
+Armazenamento dos arquivos de mídia (imagens, versões e vídeos).
+
+Blobs are addressed by the sha256 of their bytes (the *_hash columns) and
+every row records which backend holds them in its *_storage column:
+
+- "database" (NULL): the row's own *_data column, the original layout
+- "disk": files sharded by hash under MEDIA_STORAGE_PATH (needs a
+  persistent volume in production)
+- "s3": an S3-compatible bucket (AWS, MinIO, R2...) through boto3, an
+  optional dependency (`pip install '.[s3]'`)
+
+New uploads go to MEDIA_STORAGE. Existing blobs are moved online in two
+phases, so workers holding stale metadata keep serving the old copy:
+
+    python storage.py migrate --to disk   # copy each blob and repoint its row
+    python storage.py prune               # later: drop copies no row points at
+"""
+import io
+import os
+import re
+import sys
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+
+try:
+    from main import app, db
+except ImportError:
+    from app import app, db
+
+from media import CHUNK_SIZE, open_database_blob
+from models import Property, PropertyImage, ImageVariant, Post
+
+# Every (model, kind) whose rows hold a blob in {kind}_data / _hash / _size / _storage
+BLOB_COLUMNS = [(Property, 'video'), (PropertyImage, 'image'), (ImageVariant, 'image'), (Post, 'image'), (Post, 'video')]
+
+CONTENT_HASH = re.compile(r'^[0-9a-f]{64}$')
+
+def _check_key(key):
+    if not key or not CONTENT_HASH.match(key):
+        raise ValueError(f"Invalid content hash: {key!r}")
+    return key
+
+def _read_range(fileobj, start, stop):
+    """Yield the bytes of fileobj between start and stop in CHUNK_SIZE pieces"""
+    with fileobj:
+        fileobj.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = fileobj.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+class DatabaseStorage:
+    """Blobs kept in the *_data column of the rows that reference them.
+
+    The bytes belong to the row, so they are written by write_blob() and
+    removed with the row; put() and delete() have nothing to do here.
+    """
+    name = 'database'
+    inline = True
+    local = False
+
+    def _locate(self, key):
+        for model, kind in BLOB_COLUMNS:
+            row = db.session.query(model.id, getattr(model, f'{kind}_size')).filter(
+                getattr(model, f'{kind}_hash') == key,
+                db.func.coalesce(getattr(model, f'{kind}_storage'), 'database') == 'database',
+                getattr(model, f'{kind}_data').isnot(None)).first()
+            if row:
+                return model, kind, row[0], row[1]
+        raise FileNotFoundError(key)
+
+    def put(self, key, data, content_type=None):
+        pass
+
+    def open(self, key):
+        model, kind, pk, size = self._locate(key)
+        return open_database_blob(getattr(model, f'{kind}_data'), model.id, pk, size,
+                                  getattr(model, f'{kind}_hash'), key)()
+
+    def get(self, key):
+        with self.open(key) as blob:
+            return blob.read()
+
+    def open_range(self, key, start, stop):
+        return _read_range(self.open(key), start, stop)
+
+    def exists(self, key):
+        try:
+            self._locate(key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def delete(self, key):
+        pass
+
+    def url(self, key):
+        return None
+
+class DiskStorage:
+    """Blobs as files under root/ab/cd/abcd..., written atomically and never modified"""
+    name = 'disk'
+    inline = False
+    local = True
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        _check_key(key)
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put(self, key, data, content_type=None):
+        path = self.path(key)
+        if os.path.exists(path):
+            os.utime(path)  # same content already stored; keep it out of prune's grace window
+            return
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as target:
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    target.write(data)
+                else:
+                    shutil.copyfileobj(data, target, CHUNK_SIZE)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def get(self, key):
+        with self.open(key) as blob:
+            return blob.read()
+
+    def open_range(self, key, start, stop):
+        return _read_range(self.open(key), start, stop)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key):
+        return None
+
+    def keys(self):
+        """(key, modified timestamp) of every stored blob"""
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if CONTENT_HASH.match(name):
+                    yield name, os.path.getmtime(os.path.join(directory, name))
+
+class S3Reader(io.RawIOBase):
+    """Seekable reader over an S3 object: one ranged GET per contiguous run of reads"""
+
+    def __init__(self, client, bucket, key, size):
+        super().__init__()
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.position = 0
+        self._body = None
+        self._body_position = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, min(offset, self.size))
+        return self.position
+
+    def read(self, size=-1):
+        remaining = self.size - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b''
+        if self._body is None or self._body_position != self.position:
+            self._close_body()
+            self._body = self.client.get_object(Bucket=self.bucket, Key=self.key,
+                                                Range=f'bytes={self.position}-')['Body']
+            self._body_position = self.position
+        chunk = self._body.read(size)
+        self.position += len(chunk)
+        self._body_position = self.position
+        return chunk
+
+    def _close_body(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+
+    def close(self):
+        self._close_body()
+        super().close()
+
+class S3Storage:
+    """Blobs as objects in an S3-compatible bucket (endpoint_url points at MinIO, R2, ...)"""
+    name = 's3'
+    inline = False
+    local = False
+
+    def __init__(self, bucket, prefix='media/', endpoint_url=None, region=None, public_url=None, client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError as e:
+                raise ImportError("MEDIA_STORAGE=s3 precisa do boto3: pip install '.[s3]' (ou pip install boto3)") from e
+            client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_url = public_url.rstrip('/') if public_url else None
+
+    def object_key(self, key):
+        return self.prefix + _check_key(key)
+
+    def put(self, key, data, content_type=None):
+        extra = {'ContentType': content_type} if content_type else {}
+        # Content-addressed objects never change, so caches may keep them forever
+        self.client.put_object(Bucket=self.bucket, Key=self.object_key(key), Body=data,
+                               CacheControl='public, max-age=31536000, immutable', **extra)
+
+    def open(self, key, size=None):
+        if size is None:
+            size = self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))['ContentLength']
+        return S3Reader(self.client, self.bucket, self.object_key(key), size)
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))['Body'].read()
+
+    def open_range(self, key, start, stop):
+        body = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key),
+                                      Range=f'bytes={start}-{stop - 1}')['Body']
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def url(self, key):
+        """Public URL of the object when MEDIA_S3_PUBLIC_URL is set (bucket website or CDN), else None"""
+        if self.public_url:
+            return f'{self.public_url}/{self.object_key(key)}'
+        return None
+
+    def keys(self):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                key = item['Key'][len(self.prefix):]
+                if CONTENT_HASH.match(key):
+                    yield key, item['LastModified'].timestamp()
+
+def create_storage(name, config):
+    """Build a backend from the MEDIA_STORAGE* / MEDIA_S3_* settings"""
+    if name == 'database':
+        return DatabaseStorage()
+    if name == 'disk':
+        return DiskStorage(config['MEDIA_STORAGE_PATH'])
+    if name == 's3':
+        if not config.get('MEDIA_S3_BUCKET'):
+            raise ValueError("MEDIA_S3_BUCKET is required for S3 media storage")
+        return S3Storage(config['MEDIA_S3_BUCKET'], prefix=config['MEDIA_S3_PREFIX'],
+                         endpoint_url=config.get('MEDIA_S3_ENDPOINT'), region=config.get('MEDIA_S3_REGION'),
+                         public_url=config.get('MEDIA_S3_PUBLIC_URL'))
+    raise ValueError(f"Unknown media storage {name!r}")
+
+_storages = {}
+
+def get_storage(name=None):
+    """Backend by name; None (rows written before *_storage existed) is the database"""
+    name = name or 'database'
+    if name not in _storages:
+        _storages[name] = create_storage(name, app.config)
+    return _storages[name]
+
+def default_storage():
+    """Backend that receives new uploads (MEDIA_STORAGE)"""
+    return get_storage(app.config['MEDIA_STORAGE'])
+
+def configured_storages():
+    """External backends that may hold blobs: disk once its directory exists, S3 when a bucket is set"""
+    names = []
+    if os.path.isdir(app.config['MEDIA_STORAGE_PATH']) or app.config['MEDIA_STORAGE'] == 'disk':
+        names.append('disk')
+    if app.config.get('MEDIA_S3_BUCKET'):
+        names.append('s3')
+    return [get_storage(name) for name in names]
+
+def write_blob(obj, kind, data, storage=None):
+    """Store a row's bytes in the default (or given) backend and point the row at them.
+
+    The row's {kind}_hash and {kind}_content_type must already be set. data
+    may be a file object, which external backends copy in chunks.
+    """
+    storage = storage or default_storage()
+    if storage.inline:
+        if hasattr(data, 'read'):
+            data = data.read()  # a BYTEA column takes the whole value at once
+        setattr(obj, f'{kind}_data', data)
+        setattr(obj, f'{kind}_storage', None)
+        return
+    storage.put(getattr(obj, f'{kind}_hash'), data, getattr(obj, f'{kind}_content_type'))
+    setattr(obj, f'{kind}_data', None)
+    setattr(obj, f'{kind}_storage', storage.name)
+
+def read_blob(obj, kind):
+    """All the bytes of a row's blob, wherever they are stored"""
+    storage = get_storage(getattr(obj, f'{kind}_storage'))
+    if storage.inline:
+        return getattr(obj, f'{kind}_data')
+    return storage.get(getattr(obj, f'{kind}_hash'))
+
+def blob_opener(model, kind, pk, key, size, storage_name=None):
+    """Opener (see media.send_media) for a row's blob.
+
+    Database blobs are read by primary key and must still carry the
+    expected hash: rows are rewritten in place when a media job
+    recompresses an image, and metadata cached by another worker may
+    predate that.
+    """
+    storage = get_storage(storage_name)
+    if storage.inline:
+        if key is None:  # legacy rows stored before content hashes
+            return open_database_blob(getattr(model, f'{kind}_data'), model.id, pk, size)
+        return open_database_blob(getattr(model, f'{kind}_data'), model.id, pk, size,
+                                  getattr(model, f'{kind}_hash'), key)
+    if isinstance(storage, S3Storage):
+        return lambda: storage.open(key, size)
+    return lambda: storage.open(key)
+
+def referenced_keys(keys, storage_name=None):
+    """Subset of keys still referenced by some row (in the given backend, or in any)"""
+    keys = [key for key in set(keys) if key]
+    found = set()
+    for model, kind in BLOB_COLUMNS:
+        hash_column = getattr(model, f'{kind}_hash')
+        query = db.session.query(hash_column).filter(hash_column.in_(keys))
+        if storage_name:
+            query = query.filter(getattr(model, f'{kind}_storage') == storage_name)
+        found.update(row[0] for row in query.distinct())
+    return found
+
+def delete_unreferenced(keys):
+    """Delete blobs of removed rows from the external backends once no row references them"""
+    keys = [key for key in set(keys) if key]
+    if not keys:
+        return
+    orphans = set(keys) - referenced_keys(keys)
+    if not orphans:
+        return
+    try:
+        storages = configured_storages()
+    except Exception as e:
+        print(f"Warning: Could not open media storage to delete {len(orphans)} blobs: {e}")
+        return
+    for storage in storages:
+        for key in orphans:
+            try:
+                storage.delete(key)
+            except Exception as e:
+                print(f"Warning: Could not delete {key} from {storage.name} storage: {e}")
+
+def migrate_blobs(target_name, source_name=None, log=print):
+    """Copy every blob not yet in target to it and repoint its row, one row per commit.
+
+    Copies left behind are kept until prune_blobs(), so requests that
+    still hold the old location finish normally. Returns (moved, failed).
+    """
+    target = get_storage(target_name)
+    moved = failed = 0
+    for model, kind in BLOB_COLUMNS:
+        storage_column = db.func.coalesce(getattr(model, f'{kind}_storage'), 'database')
+        query = db.session.query(model.id).filter(getattr(model, f'{kind}_size').isnot(None),
+                                                  storage_column != target.name)
+        if source_name:
+            query = query.filter(storage_column == source_name)
+        ids = [row[0] for row in query.order_by(model.id)]
+        for pk in ids:
+            obj = db.session.get(model, pk)
+            try:
+                data = read_blob(obj, kind)
+                content_hash = hashlib.sha256(data).hexdigest() if data is not None else None
+                if content_hash is None or len(data) != getattr(obj, f'{kind}_size'):
+                    raise ValueError("conteúdo ausente ou com tamanho diferente do registrado")
+                if getattr(obj, f'{kind}_hash') is None:
+                    setattr(obj, f'{kind}_hash', content_hash)
+                elif getattr(obj, f'{kind}_hash') != content_hash:
+                    raise ValueError("hash do conteúdo não confere")
+                if target.inline:
+                    setattr(obj, f'{kind}_data', data)
+                    setattr(obj, f'{kind}_storage', None)
+                else:
+                    target.put(content_hash, data, getattr(obj, f'{kind}_content_type'))
+                    setattr(obj, f'{kind}_storage', target.name)
+                db.session.commit()
+                moved += 1
+            except Exception as e:
+                db.session.rollback()
+                failed += 1
+                log(f"⚠️  {model.__tablename__}.{kind} {pk}: {e}")
+            db.session.expunge_all()  # drop the bytes before the next row
+        if ids:
+            log(f"✅ {model.__tablename__}.{kind}: {len(ids)} registros processados")
+    return moved, failed
+
+def prune_blobs(grace=3600, log=print):
+    """Remove copies no row points at: *_data of rows moved out of the database, and
+    external blobs older than `grace` seconds without a row in that backend"""
+    cleared = 0
+    for model, kind in BLOB_COLUMNS:
+        data_column = getattr(model, f'{kind}_data')
+        result = db.session.execute(db.update(model).where(
+            getattr(model, f'{kind}_storage').isnot(None), data_column.isnot(None)).values({data_column: None}))
+        cleared += result.rowcount
+        db.session.commit()
+
+    deleted = 0
+    cutoff = time.time() - grace
+    for storage in configured_storages():
+        removed = 0
+        referenced = set()
+        for model, kind in BLOB_COLUMNS:
+            hash_column = getattr(model, f'{kind}_hash')
+            referenced.update(row[0] for row in db.session.query(hash_column).filter(
+                getattr(model, f'{kind}_storage') == storage.name).distinct())
+        for key, modified in storage.keys():
+            # The grace period protects blobs whose row is still being committed
+            if key not in referenced and modified < cutoff:
+                storage.delete(key)
+                removed += 1
+        deleted += removed
+        log(f"✅ {storage.name}: {removed} arquivos sem referência removidos")
+    return cleared, deleted
+
+def storage_counts():
+    """{backend name: (blobs, bytes)} over every blob column"""
+    counts = {}
+    for model, kind in BLOB_COLUMNS:
+        storage_column = db.func.coalesce(getattr(model, f'{kind}_storage'), 'database')
+        size_column = getattr(model, f'{kind}_size')
+        for name, blobs, size in db.session.query(storage_column, db.func.count(), db.func.sum(size_column)).filter(
+                size_column.isnot(None)).group_by(storage_column):
+            total = counts.get(name, (0, 0))
+            counts[name] = (total[0] + blobs, total[1] + (size or 0))
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Armazenamento das mídias')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate = subparsers.add_parser('migrate', help='move os arquivos para outro armazenamento')
+    migrate.add_argument('--to', required=True, choices=['database', 'disk', 's3'])
+    migrate.add_argument('--from', dest='source', choices=['database', 'disk', 's3'],
+                         help='move apenas os arquivos que estão neste armazenamento')
+    prune = subparsers.add_parser('prune', help='remove cópias que nenhum registro usa mais')
+    prune.add_argument('--grace', type=int, default=3600,
+                       help='segundos antes de um arquivo sem referência poder ser removido')
+    subparsers.add_parser('stats', help='mostra quantos arquivos estão em cada armazenamento')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        if args.command == 'migrate':
+            moved, failed = migrate_blobs(args.to, args.source)
+            print(f"✅ {moved} arquivos movidos para {args.to}, {failed} com erro")
+            if moved:
+                print("ℹ️  As cópias antigas continuam servindo requisições em andamento; "
+                      "rode `python storage.py prune` depois de alguns minutos")
+            return 1 if failed else 0
+        if args.command == 'prune':
+            cleared, deleted = prune_blobs(args.grace)
+            print(f"✅ {cleared} blobs liberados no banco, {deleted} arquivos removidos")
+            return 0
+        for name, (blobs, size) in sorted(storage_counts().items()):
+            print(f"{name:10} {blobs:8} arquivos {size / 1024 / 1024:10.1f} MB")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())